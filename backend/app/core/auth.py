@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import time
 from datetime import datetime, timedelta, UTC
 from typing import Any
 
@@ -7,11 +8,11 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlmodel import select
+from sqlmodel import select, Session
 
 from app.core.config import get_settings
-from app.db import User
-from app.dependencies.db import DB
+from app.core.user_cache import get_user_cache
+from app.db import read_session_runner, SessionRunner, User
 
 settings = get_settings()
 
@@ -54,10 +55,10 @@ def verify_token(token: str) -> dict[str, Any]:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_user(
-    db: DB,
+def get_token_subject(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-) -> User:
+) -> str:
+    """Username from a valid bearer token, without a database lookup"""
     payload = verify_token(credentials.credentials)
     username: str | None = payload.get("sub")
     if username is None:
@@ -66,13 +67,40 @@ def get_current_user(
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+    return username
+
+def get_user_by_username(db: Session, username: str) -> User | None:
     statement = select(User).where(User.username == username)
-    user = db.exec(statement).first()
+    return db.exec(statement).first()
+
+async def get_read_session_runner(username: str = Depends(get_token_subject)):
+    """A read-only session, on the read replica unless this user has just written"""
+    async with read_session_runner(username) as runner:
+        yield runner
+
+async def get_current_user(
+    db: SessionRunner = Depends(get_read_session_runner),
+    username: str = Depends(get_token_subject),
+) -> User:
+    user_cache = get_user_cache()
+    user = user_cache.get(username) if user_cache is not None else None
+    if user is not None:
+        return user
+
+    started = time.perf_counter()
+    user = await db.run(get_user_by_username, username)
+    if user is None and db.on_replica:
+        # A user who has just registered may not have reached the replica
+        await db.use_primary()
+        user = await db.run(get_user_by_username, username)
+    if user_cache is not None:
+        user_cache.record_miss(time.perf_counter() - started)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user
\ No newline at end of file
+    if user_cache is not None:
+        user_cache.set(username, user)
+    return user
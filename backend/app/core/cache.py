@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Protocol, TypeVar
+
+from fastapi import Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from .config import get_settings
+
+
+T = TypeVar('T')
+
+
+class CacheBackend(Protocol):
+    # Whether calls wait on the network, and so have to be kept off the event loop
+    blocking: bool
+
+    def get(self, key: str) -> bytes | None: ...
+    def set(self, key: str, value: bytes) -> None: ...
+    def get_version(self, scope: str) -> int: ...
+    def bump_version(self, scope: str) -> int: ...
+
+
+class MemoryCacheBackend:
+    """In-process LRU bounded by the total size of the cached bodies.
+
+    Versions are per process, so with several workers an upload handled by
+    one worker doesn't invalidate the others; use the redis backend there.
+    Entries and versions expire after ttl seconds, so the other workers
+    serve old data, or answer 304 for it, for at most that long.
+    """
+
+    blocking = False
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        # Values are (expiry on the monotonic clock, body or version)
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._versions: dict[str, tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.size -= len(entry[1])
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get_version(self, scope: str) -> int:
+        with self._lock:
+            now = time.monotonic()
+            entry = self._versions.get(scope)
+            if entry is None or entry[0] <= now:
+                # From the clock, so versions never repeat across restarts or expiry
+                entry = self._versions[scope] = (now + self.ttl, time.time_ns())
+            return entry[1]
+
+    def bump_version(self, scope: str) -> int:
+        with self._lock:
+            now = time.monotonic()
+            entry = self._versions.get(scope)
+            version = max(entry[1] + 1 if entry else 0, time.time_ns())
+            self._versions[scope] = (now + self.ttl, version)
+            return version
+
+
+class RedisCacheBackend:
+    """Cache shared by all workers through Redis or anything that speaks its protocol.
+
+    Entries expire after ttl seconds; size-based eviction is left to the
+    server's maxmemory policy (allkeys-lru). The client is synchronous, so
+    cached_response calls it from the threadpool.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str, ttl: int):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "CACHE_BACKEND=redis needs the redis package: install backend[redis]"
+            ) from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(f'cache:{key}')
+
+    def set(self, key: str, value: bytes) -> None:
+        self.client.set(f'cache:{key}', value, ex=self.ttl)
+
+    def get_version(self, scope: str) -> int:
+        key = f'version:{scope}'
+        self.client.set(key, time.time_ns(), nx=True)
+        return int(self.client.get(key))
+
+    def bump_version(self, scope: str) -> int:
+        key = f'version:{scope}'
+        self.client.set(key, time.time_ns(), nx=True)
+        return self.client.incr(key)
+
+
+@cache
+def get_cache_backend() -> CacheBackend | None:
+    settings = get_settings()
+    if settings.CACHE_BACKEND == 'memory':
+        return MemoryCacheBackend(settings.CACHE_MAX_BYTES, settings.MEMORY_CACHE_TTL_SECONDS)
+    if settings.CACHE_BACKEND == 'redis':
+        return RedisCacheBackend(settings.REDIS_URL, settings.CACHE_TTL_SECONDS)
+    return None
+
+
+def invalidate_user_cache(username: str) -> None:
+    """Called after a user's data changes, so every cached response and ETag goes stale"""
+    backend = get_cache_backend()
+    if backend is not None:
+        backend.bump_version(username)
+
+
+async def _call(backend: CacheBackend, method: Callable[..., T], *args: Any) -> T:
+    """A backend method, in the threadpool if it would block the event loop"""
+    if backend.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+async def _tee(backend: CacheBackend, key: str, chunks: AsyncIterator[str | bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    """Pass a streamed body through, storing it once complete unless it gets too big"""
+    parts: list[bytes] | None = []
+    size = 0
+    async for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if parts is not None:
+            size += len(chunk)
+            if size > max_bytes:
+                parts = None
+            else:
+                parts.append(chunk)
+        yield chunk
+    if parts is not None:
+        await _call(backend, backend.set, key, b''.join(parts))
+
+
+async def cached_response(
+    request: Request,
+    username: str,
+    build: Callable[[], Awaitable[bytes | AsyncIterator[str | bytes]]],
+    media_type: str = 'application/json',
+) -> Response:
+    """Serve a per-user response from cache, or build and cache it.
+
+    The ETag is the user's data version and the media type, so a matching
+    If-None-Match is answered with 304 before any query runs. `build`
+    returns the body, either whole or as an async iterator of chunks which
+    is streamed through.
+    """
+    backend = get_cache_backend()
+    if backend is None:
+        body = await build()
+        if isinstance(body, bytes):
+            return Response(body, media_type=media_type)
+        return StreamingResponse(body, media_type=media_type)
+
+    version = await _call(backend, backend.get_version, username)
+    # Formats of the same data must not share an ETag
+    etag = f'"{version}"' if media_type == 'application/json' else f'"{version}-{media_type_tag(media_type)}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Accept'}
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    key = f'{username}:{version}:{media_type}:{request.url.path}?{request.url.query}'
+    body = await _call(backend, backend.get, key)
+    if body is None:
+        body = await build()
+        if not isinstance(body, bytes):
+            settings = get_settings()
+            return StreamingResponse(
+                _tee(backend, key, body, settings.CACHE_MAX_ENTRY_BYTES),
+                media_type=media_type,
+                headers=headers,
+            )
+        await _call(backend, backend.set, key, body)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def media_type_tag(media_type: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', media_type.lower())
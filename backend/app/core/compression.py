@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import zlib
+from typing import Protocol
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .response_formats import parse_accept
+
+# Already compressed, or has to reach the client chunk by chunk
+SKIP_MEDIA_TYPES = ('text/event-stream', 'application/zip', 'application/gzip', 'image/', 'video/')
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+    def flush(self) -> bytes:
+        """Everything compressed so far, so the client can decode it without waiting for more"""
+    def finish(self) -> bytes: ...
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        # wbits 31 writes a gzip header and trailer rather than raw zlib
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """br over gzip, whatever their q-values, as long as the client accepts it"""
+    accepted = {coding for coding, quality in parse_accept(accept_encoding) if quality > 0}
+    for coding in ('br', 'gzip'):
+        if coding in accepted:
+            return coding
+    return None
+
+
+def compressible(start: Message) -> bool:
+    """Whether the response that starts with this message is one the middleware compresses"""
+    headers = Headers(raw=start['headers'])
+    return 'content-encoding' not in headers and not headers.get('content-type', '').startswith(SKIP_MEDIA_TYPES)
+
+
+class CompressionMiddleware:
+    """Compresses response bodies of at least minimum_size bytes with brotli or gzip.
+
+    Whole bodies under the threshold go out as they are. Streamed bodies are
+    compressed chunk by chunk as they pass through, each chunk flushed so it
+    reaches the client as soon as it's sent; their size isn't known up
+    front, so they're always compressed.
+
+    Every response that could have been compressed carries Vary:
+    Accept-Encoding, and its ETag is made weak when the client accepts an
+    encoding: the bytes differ by encoding, and a compressed body and its
+    304 must show the same tag. If-None-Match comparisons (see
+    cache.cached_response) already ignore W/.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compressor(self, encoding: str) -> Compressor:
+        if encoding == 'br':
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            async def vary_send(message: Message) -> None:
+                if message['type'] == 'http.response.start' and compressible(message):
+                    MutableHeaders(raw=message['headers']).add_vary_header('Accept-Encoding')
+                await send(message)
+
+            await self.app(scope, receive, vary_send)
+            return
+
+        start: Message | None = None
+        compressor: Compressor | None = None
+        passthrough = False
+
+        async def compressing_send(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                passthrough = not compressible(message)
+                if passthrough:
+                    await send(message)
+                    return
+                headers = MutableHeaders(raw=message['headers'])
+                headers.add_vary_header('Accept-Encoding')
+                etag = headers.get('etag')
+                if etag is not None and not etag.startswith('W/'):
+                    headers['ETag'] = f'W/{etag}'
+                # Held back until the first body chunk says whether to compress
+                start = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if start is not None:
+                headers = MutableHeaders(raw=start['headers'])
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = self.compressor(encoding)
+                headers['Content-Encoding'] = encoding
+                if more_body:
+                    del headers['Content-Length']
+                else:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    start = None
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                await send(start)
+                start = None
+
+            body = compressor.compress(body) + (compressor.flush() if more_body else compressor.finish())
+            await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+        await self.app(scope, receive, compressing_send)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import tempfile
 from functools import cache
 
 from pydantic_settings import BaseSettings
@@ -11,6 +12,84 @@ class Settings(BaseSettings):
     JWT_SECRET: str = "secret-key-change-in-production"
     FRONTEND_URL: str = 'http://localhost:8080'
 
+    # Connection pools. With DB_ASYNC the auth and read endpoints use an
+    # asyncpg engine (ASYNC_DATABASE_URL, derived from DATABASE_URL by default)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_ASYNC: bool = False
+    ASYNC_DATABASE_URL: str | None = None
+    ASYNC_DB_POOL_SIZE: int = 10
+    ASYNC_DB_MAX_OVERFLOW: int = 20
+    # Connections opened per pool at startup, so the first requests don't wait for them
+    DB_POOL_WARMUP: int = 0
+
+    # Optional read replica for the product and analytics reads and user
+    # lookups. Reads go back to the primary for DB_READ_RETRY_SECONDS when the
+    # replica fails, and a user's reads stay on the primary for
+    # READ_AFTER_WRITE_SECONDS after they upload, so they see their own data
+    DATABASE_READ_URL: str | None = None
+    ASYNC_DATABASE_READ_URL: str | None = None
+    DB_READ_POOL_SIZE: int = 10
+    DB_READ_MAX_OVERFLOW: int = 20
+    DB_READ_RETRY_SECONDS: float = 30.0
+    READ_AFTER_WRITE_SECONDS: float = 10.0
+
+    # Largest end_day /analytics/timeseries accepts; it's clamped to the last day with data anyway
+    TIMESERIES_MAX_DAYS: int = 10_000
+
+    # Hash partitions of procurement_data and sales_data, fixed once the tables exist
+    FACT_TABLE_PARTITIONS: int = 16
+
+    # Executors: threadpool for sync endpoints and blocking DB calls,
+    # process pool for Excel decoding and parsing
+    THREADPOOL_WORKERS: int = 40
+    CPU_POOL_WORKERS: int = 2
+
+    # Per-user response cache: 'memory', 'redis' or 'none'. The memory cache
+    # is per process, so with several workers an upload only invalidates it
+    # in the worker that took it; MEMORY_CACHE_TTL_SECONDS bounds how long
+    # the others can serve the old data. Use redis (or none) with several workers
+    CACHE_BACKEND: str = 'memory'
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_MAX_ENTRY_BYTES: int = 8 * 1024 * 1024
+    CACHE_TTL_SECONDS: int = 3600
+    MEMORY_CACHE_TTL_SECONDS: int = 60
+    REDIS_URL: str = 'redis://localhost:6379/0'
+
+    # Responses of at least this size are compressed, brotli or gzip by Accept-Encoding
+    COMPRESSION_MIN_BYTES: int = 16 * 1024
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+
+    # Users resolved from bearer tokens, cached to skip a lookup per request
+    USER_CACHE_ENABLED: bool = True
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_ENTRIES: int = 10_000
+
+    # Upload size limits. CSV, Parquet and Arrow files, and .xlsx files over
+    # the streaming threshold, are read and stored UPLOAD_CHUNK_ROWS rows at
+    # a time, so memory stays flat. .xls files are capped at the threshold
+    UPLOAD_MAX_BYTES: int = 512 * 1024 * 1024
+    UPLOAD_STREAM_THRESHOLD_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_CHUNK_ROWS: int = 1000
+
+    # Chunked uploads (POST /upload/sessions): largest chunk per PUT, and how
+    # long an upload may sit idle before its spooled bytes are removed
+    UPLOAD_CHUNK_MAX_BYTES: int = 64 * 1024 * 1024
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 3600
+
+    # Background upload jobs. An upload still processing UPLOAD_STALE_SECONDS
+    # after it started is taken to have died with its worker, and marked
+    # failed at the next startup
+    UPLOAD_JOB_WORKERS: int = 2
+    UPLOAD_SPOOL_DIR: str = tempfile.gettempdir()
+    UPLOAD_STALE_SECONDS: int = 6 * 3600
+
+    # Progress events (GET /upload/jobs/{id}/events): at most one per upload
+    # per interval, and a keep-alive when a listener has heard nothing
+    UPLOAD_PROGRESS_INTERVAL_SECONDS: float = 0.25
+    UPLOAD_PROGRESS_KEEPALIVE_SECONDS: float = 15.0
+
     model_config = SettingsConfigDict(
         env_file='.env', env_file_encoding='utf-8',
     )
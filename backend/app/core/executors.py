@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from anyio import to_thread
+
+from .config import get_settings
+from .progress import init_worker, ProgressForwarder
+
+T = TypeVar('T')
+
+_process_pool: ProcessPoolExecutor | None = None
+_progress_forwarder: ProgressForwarder | None = None
+# Pools are created and replaced from the event loop and from job threads
+_pool_lock = threading.Lock()
+
+
+def configure_threadpool() -> None:
+    """Size the threadpool that runs sync endpoints, dependencies and run_in_threadpool calls.
+
+    Must be called from inside the running event loop.
+    """
+    settings = get_settings()
+    to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_WORKERS
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound work such as decoding and parsing workbooks"""
+    global _process_pool, _progress_forwarder
+    with _pool_lock:
+        if _process_pool is None:
+            settings = get_settings()
+            # spawn, since forking a process that already holds pooled DB connections and threads isn't safe
+            context = multiprocessing.get_context('spawn')
+            # Workers report upload progress through the forwarder's queue
+            _progress_forwarder = ProgressForwarder(context)
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.CPU_POOL_WORKERS,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(_progress_forwarder.queue,),
+            )
+        return _process_pool
+
+
+def discard_process_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a pool that broke, e.g. because a worker was OOM-killed, so the next call starts a new one.
+
+    Does nothing if the pool was already replaced by another caller.
+    """
+    global _process_pool, _progress_forwarder
+    with _pool_lock:
+        if pool is not _process_pool:
+            return
+        forwarder = _progress_forwarder
+        _process_pool = _progress_forwarder = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    forwarder.stop()
+
+
+async def run_cpu_bound(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run fn in the process pool without blocking the event loop, once more on a new pool if it broke"""
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    try:
+        return await loop.run_in_executor(pool, partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        discard_process_pool(pool)
+        return await loop.run_in_executor(get_process_pool(), partial(fn, *args, **kwargs))
+
+
+def map_in_process(fn: Callable[..., T], calls: Iterable[tuple[Any, ...]]) -> Iterator[T]:
+    """fn(*args) for each args on the process pool in parallel, results in order as they're ready.
+
+    If the pool breaks, the calls without a result yet are submitted once
+    more on a new pool. Blocks, so call it from a thread.
+    """
+    calls = list(calls)
+    done = 0
+    for attempt in range(2):
+        pool = get_process_pool()
+        try:
+            # A broken pool already refuses new work here
+            futures = [pool.submit(fn, *args) for args in calls[done:]]
+            for future in futures:
+                result = future.result()
+                done += 1
+                yield result
+            return
+        except BrokenProcessPool:
+            if attempt:
+                raise
+            discard_process_pool(pool)
+
+
+def call_in_process(fn: Callable[..., T], *args: Any) -> T:
+    """fn(*args) on the process pool, blocking until it returns; see map_in_process"""
+    return next(map_in_process(fn, [args]))
+
+
+def shutdown_executors() -> None:
+    global _process_pool, _progress_forwarder
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
+        _progress_forwarder.stop()
+        _progress_forwarder = None
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import csv
+import io
+import itertools
+import tempfile
+from typing import Any, Iterable, Iterator
+
+from .lazy_imports import lazy_import
+
+pa = lazy_import('pyarrow')
+
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Bytes handed to the response at a time, and rows per Parquet row group
+EXPORT_CHUNK_BYTES = 256 * 1024
+EXPORT_BATCH_ROWS = 1000
+
+# Sheet of the products without a site
+DEFAULT_SHEET = 'Products'
+
+
+def csv_export(header: list[str], rows: Iterable[list[Any]]) -> Iterator[bytes]:
+    """CSV in chunks of about EXPORT_CHUNK_BYTES, holding no more than one chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _Chunks(io.RawIOBase):
+    """A write-only file that collects what is written until it is drained"""
+
+    def __init__(self):
+        self.parts: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def parquet_export(header: list[str], types: list[str], rows: Iterable[list[Any]]) -> Iterator[bytes]:
+    """Parquet with a row group per EXPORT_BATCH_ROWS rows, each sent as soon as it is written.
+
+    `types` are 'string', 'int64' or 'float64' per column; None is null.
+    """
+    # Not lazy_import: finding a submodule's spec imports pyarrow itself
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([pa.field(name, getattr(pa, kind)()) for name, kind in zip(header, types)])
+    sink = _Chunks()
+    with pq.ParquetWriter(sink, schema) as writer:
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, EXPORT_BATCH_ROWS)):
+            columns = zip(*batch)
+            writer.write_table(pa.table(
+                [pa.array(column, field.type) for column, field in zip(columns, schema)], schema=schema,
+            ))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def xlsx_export(header: list[str], sheets: list[str], rows: Iterable[tuple[str, list[Any]]]) -> Iterator[bytes]:
+    """An XLSX workbook with a sheet per name in `sheets`, each starting with the header.
+
+    `rows` are (sheet, row) pairs in any order. openpyxl's write-only mode
+    spools each sheet's rows to a temporary file rather than keeping cells,
+    but the workbook is a zip that can only be assembled at the end, so it
+    is saved to a temporary file and then sent.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheets = {}
+    for name in sheets or ['']:
+        worksheets[name] = workbook.create_sheet(name or DEFAULT_SHEET)
+        worksheets[name].append(header)
+    for name, row in rows:
+        worksheets[name].append(row)
+
+    with tempfile.TemporaryFile() as spool:
+        workbook.save(spool)
+        spool.seek(0)
+        while chunk := spool.read(EXPORT_CHUNK_BYTES):
+            yield chunk
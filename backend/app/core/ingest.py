@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import io
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List
+from uuid import UUID
+
+from sqlalchemy import Connection
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, text
+
+from app.db import Product, ProcurementData, SalesData
+
+
+def _upsert_products(
+    db: Session,
+    user_id: UUID,
+    products_data: List[Dict[str, Any]],
+    now: datetime,
+) -> tuple[Dict[tuple[str, str], UUID], int, int]:
+    """Insert or update every product in one statement keyed on unique_user_product_site.
+
+    Products whose content hash matches the stored one are left alone and
+    not returned, so only new and changed products come back.
+    """
+    table = Product.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        constraint='unique_user_product_site',
+        set_={
+            'name': stmt.excluded.name,
+            'opening_inventory': stmt.excluded.opening_inventory,
+            'content_hash': stmt.excluded.content_hash,
+            'updated_at': stmt.excluded.updated_at,
+        },
+        where=table.c.content_hash.is_distinct_from(stmt.excluded.content_hash),
+    ).returning(
+        table.c.id,
+        table.c.product_id,
+        table.c.site,
+        # xmax is only zero on rows this statement inserted
+        literal_column('xmax = 0').label('inserted'),
+    )
+
+    rows = [{
+        'user_id': user_id,
+        'product_id': product['product_id'],
+        'site': product['site'],
+        'name': product['name'],
+        'opening_inventory': product['opening_inventory'],
+        'content_hash': product['content_hash'],
+        'created_at': now,
+        'updated_at': now,
+    } for product in products_data]
+
+    product_ids: Dict[tuple[str, str], UUID] = {}
+    inserted = 0
+    for row in db.exec(stmt, params=rows):
+        product_ids[row.product_id, row.site] = row.id
+        inserted += row.inserted
+    return product_ids, inserted, len(product_ids) - inserted
+
+
+def _replace_day_rows(
+    db: Session,
+    model: type[ProcurementData] | type[SalesData],
+    user_id: UUID,
+    product_ids: Dict[tuple[str, str], UUID],
+    products_data: List[Dict[str, Any]],
+    key: str,
+) -> Dict[str, int]:
+    """Upsert the non-empty day rows of each product and delete the rest.
+
+    Rows are COPYed into a temporary staging table and merged with a single
+    INSERT ... SELECT ... ON CONFLICT, which avoids binding hundreds of
+    thousands of parameters through executemany.
+    """
+    table = model.__tablename__
+    stage = f'{table}_stage'
+
+    db.exec(text(
+        f'CREATE TEMP TABLE IF NOT EXISTS {stage} '
+        '(product_id uuid, day integer, quantity integer, price float8, amount float8) '
+        'ON COMMIT DROP'
+    ))
+    db.exec(text(f'TRUNCATE {stage}'))
+
+    buffer = io.StringIO()
+    staged = 0
+    for product in products_data:
+        product_uuid = product_ids[product['product_id'], product['site']]
+        for day in product[key]:
+            if day['quantity'] > 0 or day['price'] > 0:
+                buffer.write(f"{product_uuid}\t{day['day']}\t{day['quantity']}\t{day['price']!r}\t{day['amount']!r}\n")
+                staged += 1
+    buffer.seek(0)
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {stage} FROM STDIN', buffer)
+
+    # Partitioned tables can't return xmax, so inserts are told apart by
+    # counting the staged keys that already exist
+    existing = db.exec(text(
+        f'SELECT count(*) FROM {stage} s JOIN {table} t ON '
+        't.user_id = :user_id AND t.product_id = s.product_id AND t.day = s.day'
+    ), params={'user_id': user_id}).scalar_one()
+
+    # Unchanged rows are left alone, so they aren't written or counted
+    written = db.exec(text(
+        f'INSERT INTO {table} (user_id, product_id, day, quantity, price, amount) '
+        f'SELECT :user_id, product_id, day, quantity, price, amount FROM {stage} '
+        'ON CONFLICT (user_id, product_id, day) DO UPDATE SET '
+        'quantity = excluded.quantity, price = excluded.price, amount = excluded.amount '
+        f'WHERE ({table}.quantity, {table}.price, {table}.amount) '
+        'IS DISTINCT FROM (excluded.quantity, excluded.price, excluded.amount)'
+    ), params={'user_id': user_id}).rowcount
+    inserted = staged - existing
+
+    # Anything left for these products that wasn't in the sheet is stale
+    deleted = db.exec(text(
+        f'DELETE FROM {table} t WHERE t.user_id = :user_id AND t.product_id = ANY(CAST(:ids AS uuid[])) '
+        f'AND NOT EXISTS (SELECT 1 FROM {stage} s WHERE s.product_id = t.product_id AND s.day = t.day)'
+    ), params={
+        'user_id': user_id,
+        'ids': [str(product_uuid) for product_uuid in product_ids.values()],
+    }).rowcount
+
+    return {
+        'inserted': inserted,
+        'updated': written - inserted,
+        'unchanged': staged - written,
+        'deleted': deleted,
+    }
+
+
+# Per-day totals of both fact tables with the running change in inventory,
+# rolled up per product. Products without any day rows still get a summary
+SUMMARY_UPSERT = '''
+INSERT INTO product_summary (
+    user_id, product_id, code, site, name, opening_inventory, total_procurement_qty, total_procurement_amount,
+    total_sales_qty, total_sales_amount, closing_inventory, gross_margin, last_day, stockout
+)
+SELECT
+    p.user_id, p.id, p.product_id, p.site, p.name, p.opening_inventory,
+    coalesce(sum(d.procurement_qty), 0), coalesce(sum(d.procurement_amount), 0),
+    coalesce(sum(d.sales_qty), 0), coalesce(sum(d.sales_amount), 0),
+    p.opening_inventory + coalesce(sum(d.procurement_qty - d.sales_qty), 0),
+    CASE WHEN sum(d.procurement_qty) > 0 THEN
+        sum(d.sales_amount) - sum(d.sales_qty) * sum(d.procurement_amount) / sum(d.procurement_qty)
+    END,
+    max(d.day),
+    coalesce(bool_or(p.opening_inventory + d.change <= 0), p.opening_inventory <= 0)
+FROM products p LEFT JOIN (
+    SELECT
+        product_id, day,
+        sum(procurement_qty) AS procurement_qty, sum(procurement_amount) AS procurement_amount,
+        sum(sales_qty) AS sales_qty, sum(sales_amount) AS sales_amount,
+        sum(sum(procurement_qty) - sum(sales_qty)) OVER (PARTITION BY product_id ORDER BY day) AS change
+    FROM (
+        SELECT product_id, day, quantity AS procurement_qty, amount AS procurement_amount,
+            0 AS sales_qty, 0.0 AS sales_amount
+        FROM procurement_data WHERE user_id = :user_id AND product_id = ANY(CAST(:ids AS uuid[]))
+        UNION ALL
+        SELECT product_id, day, 0, 0.0, quantity, amount
+        FROM sales_data WHERE user_id = :user_id AND product_id = ANY(CAST(:ids AS uuid[]))
+    ) day_rows
+    GROUP BY product_id, day
+) d ON d.product_id = p.id
+WHERE p.user_id = :user_id AND p.id = ANY(CAST(:ids AS uuid[]))
+GROUP BY p.id
+ON CONFLICT (user_id, product_id) DO UPDATE SET
+    code = excluded.code,
+    site = excluded.site,
+    name = excluded.name,
+    opening_inventory = excluded.opening_inventory,
+    total_procurement_qty = excluded.total_procurement_qty,
+    total_procurement_amount = excluded.total_procurement_amount,
+    total_sales_qty = excluded.total_sales_qty,
+    total_sales_amount = excluded.total_sales_amount,
+    closing_inventory = excluded.closing_inventory,
+    gross_margin = excluded.gross_margin,
+    last_day = excluded.last_day,
+    stockout = excluded.stockout
+'''
+
+
+def refresh_product_summaries(db: Session | Connection, user_id: UUID, product_ids: Iterable[UUID]) -> None:
+    """Recompute the product_summary rows of some of a user's products from their day rows"""
+    ids = [str(product_id) for product_id in product_ids]
+    if ids:
+        db.execute(text(SUMMARY_UPSERT), {'user_id': user_id, 'ids': ids})
+
+
+def backfill_product_summaries(conn: Connection) -> None:
+    """Summarize products that have none, i.e. ones stored before product_summary existed"""
+    missing = conn.execute(text(
+        'SELECT p.user_id, array_agg(p.id) FROM products p WHERE NOT EXISTS ('
+        'SELECT 1 FROM product_summary s WHERE s.user_id = p.user_id AND s.product_id = p.id'
+        ') GROUP BY p.user_id'
+    )).all()
+    for user_id, product_ids in missing:
+        refresh_product_summaries(conn, user_id, product_ids)
+
+
+def ingest_products(db: Session, user_id: UUID, products_data: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Write parsed products and their day rows with set-based upserts.
+
+    Products whose content hash is unchanged since the last upload are
+    skipped, day rows and summaries included. Nothing is committed here so the caller can
+    keep the whole upload in a single transaction. Returns
+    inserted/updated/unchanged/deleted row counts.
+    """
+    # The same product ID twice in one sheet: the last row wins
+    products_data = list({(product['product_id'], product['site']): product for product in products_data}.values())
+    now = datetime.now(UTC)
+
+    product_ids, products_inserted, products_updated = _upsert_products(db, user_id, products_data, now)
+    changed = [product for product in products_data if (product['product_id'], product['site']) in product_ids]
+    procurement = _replace_day_rows(db, ProcurementData, user_id, product_ids, changed, 'procurement_data')
+    sales = _replace_day_rows(db, SalesData, user_id, product_ids, changed, 'sales_data')
+    refresh_product_summaries(db, user_id, product_ids.values())
+
+    return {
+        'products_inserted': products_inserted,
+        'products_updated': products_updated,
+        'products_unchanged': len(products_data) - len(product_ids),
+        'procurement_inserted': procurement['inserted'],
+        'procurement_updated': procurement['updated'],
+        'procurement_unchanged': procurement['unchanged'],
+        'procurement_deleted': procurement['deleted'],
+        'sales_inserted': sales['inserted'],
+        'sales_updated': sales['updated'],
+        'sales_unchanged': sales['unchanged'],
+        'sales_deleted': sales['deleted'],
+    }
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import math
+from statistics import NormalDist
+from typing import Any
+
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+def day_matrix(products: int, days: int, rows: np.ndarray) -> np.ndarray:
+    """A products × days matrix of quantities from (product, day, quantity) records.
+
+    Each product has at most one row per day, so plain assignment fills it;
+    days outside 1..days are ignored.
+    """
+    matrix = np.zeros((products, days), dtype=np.int64)
+    inside = (rows['day'] >= 1) & (rows['day'] <= days) & (rows['product'] < products)
+    matrix[rows['product'][inside], rows['day'][inside] - 1] = rows['quantity'][inside]
+    return matrix
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """numerator / denominator, NaN where the denominator is zero"""
+    result = np.full(numerator.shape, np.nan)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+
+def inventory_metrics(
+    opening_inventory: np.ndarray,
+    procurement: np.ndarray,
+    sales: np.ndarray,
+    procurement_amount: np.ndarray,
+    sales_amount: np.ndarray,
+    window_days: int,
+    lead_time_days: int,
+    service_level: float,
+) -> dict[str, Any]:
+    """Stock health of every product at once, from its daily quantities.
+
+    `procurement` and `sales` are products × days matrices; the amounts
+    are per-product totals. Running inventory is the opening inventory
+    plus the cumulative net quantity, so every figure is a few whole-matrix
+    operations rather than a loop over products and days. The demand rate
+    and its variability come from the last `window_days` days; the reorder
+    point covers `lead_time_days` of that demand plus safety stock for
+    `service_level` under normally distributed daily demand.
+
+    Returns one array per metric. Undefined values are NaN, e.g. days of
+    cover for a product that doesn't sell.
+    """
+    products, days = procurement.shape
+    inventory = opening_inventory[:, None] + np.cumsum(procurement - sales, axis=1)
+    closing = inventory[:, -1] if days else opening_inventory.astype(np.int64)
+
+    out = inventory <= 0
+    ran_out = out.any(axis=1)
+    first_out = out.argmax(axis=1) if days else np.zeros(products, dtype=np.int64)
+    stockout_day = np.where(ran_out, first_out + 1, np.nan)
+
+    window = sales[:, max(0, days - window_days):]
+    daily_sales = window.mean(axis=1) if window.shape[1] else np.zeros(products)
+    daily_sales_std = window.std(axis=1) if window.shape[1] else np.zeros(products)
+
+    in_stock = np.maximum(closing, 0)
+    days_of_cover = np.where(closing <= 0, 0.0, _ratio(in_stock, daily_sales))
+    # The day the current stock runs out at the current rate; today if it already has
+    projected_stockout_day = np.where(closing <= 0, float(days), days + np.floor(days_of_cover))
+
+    procurement_qty = procurement.sum(axis=1)
+    sales_qty = sales.sum(axis=1)
+    sell_through_rate = _ratio(sales_qty, opening_inventory + procurement_qty)
+    # 1 - unit cost / unit price, from the average procurement and sales prices
+    average_margin = 1 - _ratio(_ratio(procurement_amount, procurement_qty), _ratio(sales_amount, sales_qty))
+
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * daily_sales_std * math.sqrt(lead_time_days)
+    reorder_point = daily_sales * lead_time_days + safety_stock
+    needs_reorder = (reorder_point > 0) & (closing <= reorder_point)
+    # Enough to get back above the reorder point by another lead time's demand
+    suggested_order_qty = np.where(
+        needs_reorder, np.ceil(reorder_point + daily_sales * lead_time_days - closing), 0,
+    ).astype(np.int64)
+
+    return {
+        'closing_inventory': closing,
+        'stockout_day': stockout_day,
+        'stockout_days': out.sum(axis=1),
+        'daily_sales': daily_sales,
+        'days_of_cover': days_of_cover,
+        'projected_stockout_day': projected_stockout_day,
+        'sell_through_rate': sell_through_rate,
+        'average_margin': average_margin,
+        'safety_stock': safety_stock,
+        'reorder_point': reorder_point,
+        'needs_reorder': needs_reorder,
+        'suggested_order_qty': suggested_order_qty,
+    }
+
+
+def rank(values: np.ndarray, descending: bool, limit: int | None = None) -> np.ndarray:
+    """Indices of the first `limit` values in order, NaN last either way and ties in index order"""
+    values = values.astype(np.float64)
+    # lexsort is stable and sorts by its last key first
+    order = np.lexsort((-values if descending else values, np.isnan(values)))
+    return order[:limit]
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from .config import get_settings
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_job_executor() -> ThreadPoolExecutor:
+    """Worker pool for background uploads, at most UPLOAD_JOB_WORKERS run at once"""
+    global _executor
+    if _executor is None:
+        settings = get_settings()
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.UPLOAD_JOB_WORKERS,
+            thread_name_prefix='upload-job',
+        )
+    return _executor
+
+
+def submit_job(fn: Callable[..., Any], *args: Any) -> Future:
+    return get_job_executor().submit(fn, *args)
+
+
+def shutdown_jobs(wait: bool = True) -> None:
+    """Let queued and running jobs finish, then stop the workers"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """The module `name`, executed on first attribute access rather than now.
+
+    pandas, numpy and pyarrow take most of the app's import time but are
+    only needed to parse uploads and encode columnar responses, so workers
+    that haven't done either yet start without them. The placeholder goes
+    into sys.modules, so a plain `import` of the same name elsewhere gets it
+    and triggers the load as well.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
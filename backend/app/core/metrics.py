@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import itertools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from fastapi import Response
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, Histogram
+from prometheus_client import multiprocess
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Uploads run from milliseconds to minutes
+UPLOAD_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+UPLOAD_STAGE_SECONDS = Histogram(
+    'upload_stage_seconds', 'Time spent in each upload stage', ['stage'], buckets=UPLOAD_SECONDS_BUCKETS,
+)
+UPLOAD_ROWS = Histogram('upload_rows', 'Sheet rows read per upload', buckets=SIZE_BUCKETS)
+UPLOAD_CELLS = Histogram('upload_cells', 'Cells read per upload', buckets=SIZE_BUCKETS)
+UPLOAD_PEAK_MEMORY_BYTES = Histogram(
+    'upload_peak_memory_bytes', 'Peak RSS growth of the processes handling an upload', buckets=MEMORY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency until the body is sent', ['method', 'route', 'status'],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    'db_pool_checkout_seconds', 'Wait for a pooled database connection', ['engine'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # No procfs (macOS): the best we have is the process's lifetime peak
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    """Tracks this process's peak RSS over each measured span, sampling it from one daemon thread.
+
+    The thread only samples while a span is open, every `interval` seconds,
+    so peaks between stage boundaries are caught without a thread per stage.
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self._peaks: dict[int, int] = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> int:
+        rss = current_rss_bytes()
+        with self._lock:
+            token = next(self._tokens)
+            self._peaks[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+                self._thread.start()
+            self._active.set()
+        return token
+
+    def stop(self, token: int) -> int:
+        """The highest RSS seen since start returned this token"""
+        rss = current_rss_bytes()
+        with self._lock:
+            peak = max(self._peaks.pop(token), rss)
+            if not self._peaks:
+                self._active.clear()
+        return peak
+
+    def _run(self) -> None:
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            rss = current_rss_bytes()
+            with self._lock:
+                for token, peak in self._peaks.items():
+                    self._peaks[token] = max(peak, rss)
+
+
+rss_sampler = RssSampler()
+
+
+class UploadMetrics:
+    """Wall time per upload stage, rows and cells read, and peak memory growth.
+
+    peak_memory_bytes is how far RSS rose during the upload's stages above
+    where it was when the process took the upload on (see note_baseline),
+    the largest of any process involved. RSS is per process, so uploads
+    running at the same time in one process count each other's memory too.
+    Picklable, so a process pool worker can time decoding and parsing and
+    hand it back for the database write to be added.
+    """
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self.rows = 0
+        self.cells = 0
+        self.peak_memory_bytes = 0
+        # RSS when each process took the upload on, by process ID
+        self.baseline_rss: dict[int, int] = {os.getpid(): current_rss_bytes()}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        token = rss_sampler.start()
+        baseline = self.baseline_rss.setdefault(os.getpid(), current_rss_bytes())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self.peak_memory_bytes = max(self.peak_memory_bytes, rss_sampler.stop(token) - baseline)
+
+    def note_baseline(self, rss: int) -> None:
+        """Measure this process's growth from `rss`, for metrics made elsewhere of an upload it was already handling"""
+        pid = os.getpid()
+        self.baseline_rss[pid] = min(rss, self.baseline_rss.get(pid, rss))
+
+    @classmethod
+    def combine(cls, parts: list[UploadMetrics]) -> UploadMetrics:
+        """One upload's metrics from parts timed in parallel, e.g. one per sheet.
+
+        Stage seconds, rows and cells add up, so stages report worker time
+        rather than wall time; peak memory growth is the largest of any one.
+        """
+        combined = cls()
+        for part in parts:
+            for name, seconds in part.seconds.items():
+                combined.seconds[name] = combined.seconds.get(name, 0.0) + seconds
+            combined.rows += part.rows
+            combined.cells += part.cells
+            combined.peak_memory_bytes = max(combined.peak_memory_bytes, part.peak_memory_bytes)
+        return combined
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'stage_seconds': {**self.seconds, 'total': sum(self.seconds.values())},
+            'rows_read': self.rows,
+            'cells_read': self.cells,
+            'peak_memory_bytes': self.peak_memory_bytes,
+        }
+
+
+def observe_upload(upload_metrics: dict[str, Any]) -> None:
+    """Export an upload's UploadMetrics.as_dict() to the histograms"""
+    for stage, seconds in upload_metrics['stage_seconds'].items():
+        UPLOAD_STAGE_SECONDS.labels(stage).observe(seconds)
+    UPLOAD_ROWS.observe(upload_metrics['rows_read'])
+    UPLOAD_CELLS.observe(upload_metrics['cells_read'])
+    UPLOAD_PEAK_MEMORY_BYTES.observe(upload_metrics['peak_memory_bytes'])
+
+
+class RequestMetricsMiddleware:
+    """Records request latency by route template, until the last body chunk is sent.
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed responses are
+    timed to the end and not buffered.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; using its
+            # template keeps IDs in paths from creating new series
+            route = scope.get('route')
+            REQUEST_SECONDS.labels(
+                scope['method'], getattr(route, 'path', 'unmatched'), status_code,
+            ).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    """The Prometheus exposition of this process, or of all workers with PROMETHEUS_MULTIPROC_DIR"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing.context import BaseContext
+from multiprocessing.queues import Queue
+from typing import Any, Iterator
+from uuid import UUID
+
+from .config import get_settings
+
+# Events a listener may fall behind by; older ones are dropped, the newest kept
+LISTENER_BACKLOG = 8
+# Outcomes kept for listeners that subscribe just after an upload finished
+FINISHED_KEPT = 256
+# Latest progress of an upload that has published nothing for this long is
+# dropped: its worker died before it could publish an outcome
+LATEST_KEPT_SECONDS = 3600
+
+DONE = 'done'
+
+
+class ProgressBroker:
+    """In-process pub/sub of upload progress, keyed by upload ID.
+
+    Publishers may be on any thread; listeners are on the event loop the
+    broker is attached to, and the lock guards what both touch. Each
+    listener is a small queue, so holding one open costs no thread and no
+    database connection. Publishing to an upload nobody listens to only
+    records it as the upload's latest event, until the upload finishes
+    (failed uploads publish DONE too) or LATEST_KEPT_SECONDS pass.
+    """
+
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+        # Least recently published first, each with when it was published
+        self._latest: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._finished: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._listeners: dict[str, set[asyncio.Queue]] = {}
+
+    def attach(self, loop: asyncio.AbstractEventLoop | None) -> None:
+        self._loop = loop
+
+    def publish(self, upload_id: str, event: dict[str, Any]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if event['stage'] == DONE:
+                self._latest.pop(upload_id, None)
+                self._finished[upload_id] = event
+                while len(self._finished) > FINISHED_KEPT:
+                    self._finished.popitem(last=False)
+            else:
+                self._latest[upload_id] = (now, event)
+                self._latest.move_to_end(upload_id)
+            while self._latest and next(iter(self._latest.values()))[0] < now - LATEST_KEPT_SECONDS:
+                self._latest.popitem(last=False)
+            listened = upload_id in self._listeners
+        loop = self._loop
+        if loop is None or not listened:
+            return
+        try:
+            loop.call_soon_threadsafe(self._deliver, upload_id, event)
+        except RuntimeError:
+            # The loop closed under us, e.g. at shutdown
+            pass
+
+    def _deliver(self, upload_id: str, event: dict[str, Any]) -> None:
+        with self._lock:
+            queues = list(self._listeners.get(upload_id, ()))
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    @contextmanager
+    def subscribe(self, upload_id: str) -> Iterator[asyncio.Queue]:
+        """The upload's events from now on, starting with its latest. Call on the event loop"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=LISTENER_BACKLOG)
+        with self._lock:
+            self._listeners.setdefault(upload_id, set()).add(queue)
+            latest = self._latest.get(upload_id, (0.0, None))[1] or self._finished.get(upload_id)
+        if latest is not None:
+            queue.put_nowait(latest)
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                listeners = self._listeners[upload_id]
+                listeners.discard(queue)
+                if not listeners:
+                    del self._listeners[upload_id]
+
+
+progress_broker = ProgressBroker()
+
+# Set in process pool workers, whose events the parent forwards to its broker
+_worker_queue: Queue | None = None
+
+
+def publish(upload_id: str, event: dict[str, Any]) -> None:
+    if _worker_queue is not None:
+        _worker_queue.put((upload_id, event))
+    else:
+        progress_broker.publish(upload_id, event)
+
+
+def init_worker(queue: Queue) -> None:
+    """Process pool initializer: send this worker's events to the parent"""
+    global _worker_queue
+    _worker_queue = queue
+
+
+class ProgressForwarder:
+    """A queue for process pool workers' events, and a thread publishing them in this process"""
+
+    def __init__(self, context: BaseContext):
+        self.queue: Queue = context.Queue()
+        self._thread = threading.Thread(target=self._forward, name='upload-progress', daemon=True)
+        self._thread.start()
+
+    def _forward(self) -> None:
+        while (item := self.queue.get()) is not None:
+            progress_broker.publish(*item)
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self._thread.join()
+        self.queue.close()
+        self.queue.join_thread()
+
+
+class UploadProgress:
+    """Stage, rows parsed and products written of one upload, published at most every interval.
+
+    advance() is called from the parse and write loops, so it does nothing
+    but count unless the interval has passed.
+    """
+
+    def __init__(self, upload_id: UUID):
+        self.upload_id = str(upload_id)
+        self.stage = 'queued'
+        self.rows_parsed = 0
+        self.products_written = 0
+        self._interval = get_settings().UPLOAD_PROGRESS_INTERVAL_SECONDS
+        self._next_publish = 0.0
+
+    def advance(self, stage: str, rows: int = 0, products: int = 0) -> None:
+        self.stage = stage
+        self.rows_parsed += rows
+        self.products_written += products
+        now = time.monotonic()
+        if now >= self._next_publish:
+            self._next_publish = now + self._interval
+            publish(self.upload_id, {
+                'stage': stage,
+                'rows_parsed': self.rows_parsed,
+                'products_written': self.products_written,
+            })
+
+
+def publish_done(upload_id: UUID, job: dict[str, Any]) -> None:
+    """Tell listeners the upload has finished, with its job document as JSON-ready data"""
+    publish(str(upload_id), {'stage': DONE, 'job': job})
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from .cache import get_cache_backend, RedisCacheBackend
+from .config import get_settings
+
+# Users' read-your-writes deadlines when they aren't shared through Redis.
+# Not in the response cache, whose LRU could evict one before it's due
+_local_writes: dict[str, float] = {}
+_local_lock = threading.Lock()
+
+
+def _write_key(username: str) -> str:
+    return f'primary-until:{username}'
+
+
+def _shared_client():
+    """The Redis client that shares deadlines between workers, if the cache is in Redis"""
+    backend = get_cache_backend()
+    return backend.client if isinstance(backend, RedisCacheBackend) else None
+
+
+def note_user_write(username: str) -> None:
+    """Keep the user's reads on the primary until the replica has had time to catch up.
+
+    With Redis as the cache backend the deadline is a key of its own that
+    expires with it, so every worker sees it. May wait on Redis, so call it
+    from a thread.
+    """
+    settings = get_settings()
+    if settings.DATABASE_READ_URL is None:
+        return
+    client = _shared_client()
+    if client is not None:
+        client.set(_write_key(username), 1, px=max(1, int(settings.READ_AFTER_WRITE_SECONDS * 1000)))
+        return
+    now = time.monotonic()
+    with _local_lock:
+        for expired in [name for name, until in _local_writes.items() if until <= now]:
+            del _local_writes[expired]
+        _local_writes[username] = now + settings.READ_AFTER_WRITE_SECONDS
+
+
+def wrote_recently(username: str) -> bool:
+    """Whether the user's reads should stay on the primary; may wait on Redis, like note_user_write"""
+    client = _shared_client()
+    if client is not None:
+        return bool(client.exists(_write_key(username)))
+    with _local_lock:
+        until = _local_writes.get(username)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del _local_writes[username]
+            return False
+        return True
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+import msgpack
+
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pa = lazy_import('pyarrow')
+
+JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.columnar+json'
+MSGPACK = 'application/msgpack'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+# ?format= values, for clients that can't set Accept
+FORMATS = {'json': JSON, 'columnar': COLUMNAR_JSON, 'msgpack': MSGPACK, 'arrow': ARROW}
+MEDIA_TYPE_ALIASES = {'application/x-msgpack': MSGPACK, 'application/vnd.apache.arrow.file': ARROW}
+
+PRODUCT_FIELDS = ('id', 'product_id', 'site', 'name', 'opening_inventory')
+DAY_FIELDS = ('product', 'day', 'quantity', 'price', 'amount')
+# numpy dtype names, so neither numpy nor pyarrow is needed to import this module
+DAY_TYPES = {
+    'product': 'int64',
+    'day': 'int64',
+    'quantity': 'int64',
+    'price': 'float64',
+    'amount': 'float64',
+}
+
+
+def parse_accept(header: str) -> list[tuple[str, float]]:
+    """The lowercased values of an Accept-style header with their q-values"""
+    entries = []
+    for entry in header.split(','):
+        value, *params = [part.strip() for part in entry.split(';')]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        entries.append((value.lower(), quality))
+    return entries
+
+
+def negotiate_format(accept: str | None, requested: str | None = None) -> str:
+    """Pick the response media type from ?format= or the Accept header, JSON by default.
+
+    Accept entries are tried by q-value, then in order; `*/*` and anything
+    unknown fall back to JSON rather than a 406.
+    """
+    if requested is not None:
+        return FORMATS[requested]
+
+    candidates = []
+    for position, (media_type, quality) in enumerate(parse_accept(accept or '')):
+        media_type = MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        if quality > 0 and media_type in FORMATS.values():
+            candidates.append((-quality, position, media_type))
+    return min(candidates)[2] if candidates else JSON
+
+
+def empty_day_columns() -> dict[str, np.ndarray]:
+    return {field: np.empty(0, dtype=DAY_TYPES[field]) for field in DAY_FIELDS}
+
+
+class ProductColumns:
+    """A page of products as one array per field.
+
+    Day rows are flat arrays sorted by product then day, where `product` is
+    the row's index into the product arrays.
+    """
+
+    def __init__(
+        self,
+        products: dict[str, list[Any]],
+        procurement_data: dict[str, np.ndarray],
+        sales_data: dict[str, np.ndarray],
+        next_cursor: str | None,
+    ):
+        self.products = products
+        self.procurement_data = procurement_data
+        self.sales_data = sales_data
+        self.next_cursor = next_cursor
+
+    @classmethod
+    def concat(cls, batches: list[ProductColumns], next_cursor: str | None) -> ProductColumns:
+        """Join consecutive batches, whose day rows already index the joined product arrays"""
+        if not batches:
+            return cls({field: [] for field in PRODUCT_FIELDS}, empty_day_columns(), empty_day_columns(), next_cursor)
+        return cls(
+            {field: [value for batch in batches for value in batch.products[field]] for field in PRODUCT_FIELDS},
+            {field: np.concatenate([batch.procurement_data[field] for batch in batches]) for field in DAY_FIELDS},
+            {field: np.concatenate([batch.sales_data[field] for batch in batches]) for field in DAY_FIELDS},
+            next_cursor,
+        )
+
+    @property
+    def total(self) -> int:
+        return len(self.products['id'])
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'products': self.products,
+            'procurement_data': {field: values.tolist() for field, values in self.procurement_data.items()},
+            'sales_data': {field: values.tolist() for field, values in self.sales_data.items()},
+            'total': self.total,
+            'next_cursor': self.next_cursor,
+        }
+
+    def to_arrow(self) -> pa.Table:
+        """One row per product with the days as list<struct> columns, like ProductDataResponse"""
+        def day_lists(days: dict[str, np.ndarray]) -> pa.ListArray:
+            counts = np.bincount(days['product'], minlength=self.total)
+            offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+            values = pa.StructArray.from_arrays(
+                [pa.array(days[field], pa.from_numpy_dtype(np.dtype(DAY_TYPES[field]))) for field in DAY_FIELDS[1:]],
+                names=list(DAY_FIELDS[1:]),
+            )
+            return pa.ListArray.from_arrays(pa.array(offsets), values)
+
+        metadata = {'total': str(self.total)}
+        if self.next_cursor is not None:
+            metadata['next_cursor'] = self.next_cursor
+        return pa.table({
+            'id': pa.array(self.products['id'], pa.string()),
+            'product_id': pa.array(self.products['product_id'], pa.string()),
+            'site': pa.array(self.products['site'], pa.string()),
+            'name': pa.array(self.products['name'], pa.string()),
+            'opening_inventory': pa.array(self.products['opening_inventory'], pa.int64()),
+            'procurement_data': day_lists(self.procurement_data),
+            'sales_data': day_lists(self.sales_data),
+        }, metadata=metadata)
+
+    def encode(self, media_type: str) -> bytes:
+        if media_type == COLUMNAR_JSON:
+            return json.dumps(self.as_dict(), separators=(',', ':')).encode()
+        if media_type == MSGPACK:
+            return msgpack.packb(self.as_dict())
+        if media_type == ARROW:
+            sink = pa.BufferOutputStream()
+            table = self.to_arrow()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+        raise ValueError(f'Not a columnar media type: {media_type}')
@@ -1,27 +1,60 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
 from datetime import date
 from datetime import datetime
 from datetime import UTC
 from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import TypeVar
 from uuid import UUID
 from uuid import uuid4
 
+from sqlalchemy import AsyncAdaptedQueuePool
+from sqlalchemy import BigInteger
+from sqlalchemy import Connection
+from sqlalchemy import DateTime
+from sqlalchemy import Engine
+from sqlalchemy import event
+from sqlalchemy import Index
+from sqlalchemy import inspect
 from sqlalchemy import JSON
+from sqlalchemy import make_url
+from sqlalchemy import PrimaryKeyConstraint
+from sqlalchemy import QueuePool
+from sqlalchemy import Table
 from sqlalchemy import UniqueConstraint
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import InterfaceError
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.schema import CreateTable
 from sqlmodel import Column
 from sqlmodel import create_engine
 from sqlmodel import Field
 from sqlmodel import Session
 from sqlmodel import SQLModel
 from sqlmodel import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from app.core.config import get_settings
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS
+from app.core.read_routing import wrote_recently
 
 
 settings = get_settings()
 DATABASE_URL = settings.DATABASE_URL
 
+T = TypeVar('T')
+
 
 def uuid_pk():
     return Field(
@@ -30,6 +63,13 @@ def uuid_pk():
         sa_column_kwargs={'server_default': text('gen_random_uuid()')},
     )
 
+def utc_timestamp():
+    # Timezone-aware, so the UTC datetimes we write bind cleanly under asyncpg too
+    return Field(
+        default_factory=lambda: datetime.now(UTC),
+        sa_type=DateTime(timezone=True),
+    )
+
 # ========== Core Tables ==========
 
 class User(SQLModel, table=True):
@@ -38,7 +78,7 @@ class User(SQLModel, table=True):
     id: UUID = uuid_pk()
     username: str = Field(unique=True, index=True)
     password_hash: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    created_at: datetime = utc_timestamp()
 
 class Product(SQLModel, table=True):
     __tablename__ = "products"
@@ -46,74 +86,414 @@ class Product(SQLModel, table=True):
     id: UUID = uuid_pk()
     user_id: UUID = Field(foreign_key="users.id")
     product_id: str  # Original ID from Excel (e.g., '0000001')
+    # Sheet of a multi-sheet workbook the product came from, one per site; '' otherwise
+    site: str = Field(default='', sa_column_kwargs={'server_default': ''})
     name: str
     opening_inventory: int
-    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    content_hash: str | None = None  # Hash of the parsed record, see parse_excel_data
+    created_at: datetime = utc_timestamp()
+    updated_at: datetime = utc_timestamp()
     
     __table_args__ = (
-        UniqueConstraint('user_id', 'product_id', name='unique_user_product'),
+        UniqueConstraint('user_id', 'product_id', 'site', name='unique_user_product_site'),
+    )
+
+def fact_table_args(table: str) -> tuple:
+    """Keys, indexes and partitioning shared by the per-day fact tables.
+
+    Rows are keyed and hash-partitioned by their owner, so everything a
+    dashboard reads for one user comes from one partition. The primary key
+    carries the values for index-only product reads, and (user_id, day)
+    covers the per-day totals of the charts.
+    """
+    return (
+        PrimaryKeyConstraint(
+            'user_id', 'product_id', 'day',
+            name=f'{table}_pkey', postgresql_include=['quantity', 'price', 'amount'],
+        ),
+        Index(f'ix_{table}_user_day', 'user_id', 'day', postgresql_include=['quantity', 'amount']),
+        {'postgresql_partition_by': 'HASH (user_id)'},
     )
 
 class ProcurementData(SQLModel, table=True):
     __tablename__ = "procurement_data"
     
-    id: UUID = uuid_pk()
-    product_id: UUID = Field(foreign_key="products.id")
-    day: int
+    user_id: UUID = Field(primary_key=True)  # Owner of the product, copied for partitioning
+    product_id: UUID = Field(foreign_key="products.id", primary_key=True)
+    day: int = Field(primary_key=True)
     quantity: int
     price: float
     amount: float
-    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
     
-    __table_args__ = (
-        UniqueConstraint('product_id', 'day', name='unique_product_procurement_day'),
-    )
+    __table_args__ = fact_table_args('procurement_data')
 
 class SalesData(SQLModel, table=True):
     __tablename__ = "sales_data"
     
-    id: UUID = uuid_pk()
-    product_id: UUID = Field(foreign_key="products.id")
-    day: int
+    user_id: UUID = Field(primary_key=True)  # Owner of the product, copied for partitioning
+    product_id: UUID = Field(foreign_key="products.id", primary_key=True)
+    day: int = Field(primary_key=True)
     quantity: int
     price: float
     amount: float
-    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    
+    __table_args__ = fact_table_args('sales_data')
+
+FACT_TABLES = (ProcurementData.__table__, SalesData.__table__)
+
+class ProductSummary(SQLModel, table=True):
+    """Per-product totals, rewritten by ingest_products in the upload's transaction.
+
+    The product's own fields are copied in too, so listings never touch
+    products or the day rows.
+    """
+    __tablename__ = "product_summary"
+    
+    user_id: UUID = Field(primary_key=True)
+    product_id: UUID = Field(foreign_key="products.id", primary_key=True)
+    code: str  # Product.product_id, the ID from the sheet
+    site: str = Field(default='', sa_column_kwargs={'server_default': ''})
+    name: str
+    opening_inventory: int
+    total_procurement_qty: int
+    total_procurement_amount: float
+    total_sales_qty: int
+    total_sales_amount: float
+    closing_inventory: int
+    gross_margin: float | None = None  # Sales less their cost at the average procurement price; None if nothing was procured
+    last_day: int | None = None  # Last day with procurement or sales
+    stockout: bool  # Closing inventory of some day with activity was zero or less (opening inventory if none)
     
     __table_args__ = (
-        UniqueConstraint('product_id', 'day', name='unique_product_sales_day'),
+        Index('ix_product_summary_user_code', 'user_id', 'code'),
     )
 
+@event.listens_for(ProcurementData.__table__, 'after_create')
+@event.listens_for(SalesData.__table__, 'after_create')
+def _create_partitions(table: Table, connection: Connection, **kw: Any) -> None:
+    # The modulus is fixed once the table exists; changing it means recreating the table
+    partitions = settings.FACT_TABLE_PARTITIONS
+    for remainder in range(partitions):
+        connection.execute(text(
+            f'CREATE TABLE {table.name}_p{remainder} PARTITION OF {table.name} '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        ))
+
 class ExcelUpload(SQLModel, table=True):
     __tablename__ = "excel_uploads"
     
     id: UUID = uuid_pk()
     user_id: UUID = Field(foreign_key="users.id")
     filename: str
-    upload_date: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    checksum: str | None = None  # SHA-256 of the uploaded file
+    upload_date: datetime = utc_timestamp()
     status: str = Field(default="processing")  # processing/completed/failed
+    finished_at: datetime | None = Field(default=None, sa_type=DateTime(timezone=True))
+    products_processed: int | None = None
+    validation_info: dict[str, Any] | None = Field(default=None, sa_column=Column(JSON))
+    ingest_stats: dict[str, int] | None = Field(default=None, sa_column=Column(JSON))
+    errors: list[str] | None = Field(default=None, sa_column=Column(JSON))
+    # Seconds per stage (decode/validate/parse/write/total), see UploadMetrics
+    stage_seconds: dict[str, float] | None = Field(default=None, sa_column=Column(JSON))
+    rows_read: int | None = None
+    cells_read: int | None = None
+    peak_memory_bytes: int | None = Field(default=None, sa_type=BigInteger)
+    
+    __table_args__ = (
+        # A user's uploads, latest first (find_identical_upload)
+        Index('ix_excel_uploads_user_id_upload_date', 'user_id', 'upload_date'),
+    )
+
+class UploadSession(SQLModel, table=True):
+    """A chunked upload, its bytes so far spooled to disk (see routers/upload_sessions.py)"""
+    __tablename__ = "upload_sessions"
+    
+    id: UUID = uuid_pk()
+    user_id: UUID = Field(foreign_key="users.id")
+    filename: str
+    size: int = Field(sa_type=BigInteger)  # Declared by the client up front
+    received_bytes: int = Field(default=0, sa_type=BigInteger)
+    sha256: str | None = None  # Of the whole file, checked on completion when the client sends it
+    upload_id: UUID | None = Field(default=None, foreign_key="excel_uploads.id")  # Set once completed
+    created_at: datetime = utc_timestamp()
+    updated_at: datetime = utc_timestamp()
+
+class SchemaVersion(SQLModel, table=True):
+    """The schema_version() the database was last set up for"""
+    __tablename__ = "schema_version"
+    
+    version: str = Field(primary_key=True)
+    applied_at: datetime = utc_timestamp()
 
 
 
 # ========== Database Setup ==========
 
+class TimedQueuePool(QueuePool):
+    """A QueuePool that reports how long each checkout waited, including connecting"""
+
+    engine_label = 'sync'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.engine_label).observe(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    engine_label = 'async'
+
+
+class TimedReadQueuePool(TimedQueuePool):
+    engine_label = 'sync-read'
+
+
+class TimedAsyncReadQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    engine_label = 'async-read'
+
+
 engine = create_engine(
     DATABASE_URL,
-    pool_size=10,
-    max_overflow=20,
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
     pool_pre_ping=True,
     pool_recycle=3600,
     echo=False
 )
 
 
-def create_db_and_tables(drop_first: bool = False) -> None:
-    if drop_first:
-        with engine.begin() as conn:
+def async_database_url(url: str) -> str:
+    """The DATABASE_URL rewritten for the asyncpg driver"""
+    async_url = make_url(url).set(drivername='postgresql+asyncpg')
+    # asyncpg spells libpq's sslmode as ssl
+    if 'sslmode' in async_url.query:
+        query = dict(async_url.query)
+        query['ssl'] = query.pop('sslmode')
+        async_url = async_url.set(query=query)
+    return async_url.render_as_string(hide_password=False)
+
+
+# Only created with DB_ASYNC, so asyncpg stays an optional dependency
+async_engine: AsyncEngine | None = None
+if settings.DB_ASYNC:
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL or async_database_url(DATABASE_URL),
+        poolclass=TimedAsyncQueuePool,
+        pool_size=settings.ASYNC_DB_POOL_SIZE,
+        max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        echo=False
+    )
+
+
+# Read replica engines, only with DATABASE_READ_URL. The schema is the
+# primary's; a replica only ever runs reads
+read_engine: Engine | None = None
+async_read_engine: AsyncEngine | None = None
+if settings.DATABASE_READ_URL:
+    read_engine = create_engine(
+        settings.DATABASE_READ_URL,
+        poolclass=TimedReadQueuePool,
+        pool_size=settings.DB_READ_POOL_SIZE,
+        max_overflow=settings.DB_READ_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        echo=False
+    )
+    if settings.DB_ASYNC:
+        async_read_engine = create_async_engine(
+            settings.ASYNC_DATABASE_READ_URL or async_database_url(settings.DATABASE_READ_URL),
+            poolclass=TimedAsyncReadQueuePool,
+            pool_size=settings.DB_READ_POOL_SIZE,
+            max_overflow=settings.DB_READ_MAX_OVERFLOW,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            echo=False
+        )
+
+
+# pg_advisory_xact_lock key held while one process sets up the schema
+SCHEMA_LOCK_KEY = 0x5C4E_3A00
+
+
+def schema_version() -> str:
+    """A hash of the DDL the models generate, so any model change is a new version"""
+    dialect = postgresql.dialect()
+    statements = [str(CreateTable(table).compile(dialect=dialect)) for table in SQLModel.metadata.sorted_tables]
+    statements += [
+        str(CreateIndex(index).compile(dialect=dialect))
+        for table in SQLModel.metadata.sorted_tables
+        for index in sorted(table.indexes, key=lambda index: index.name)
+    ]
+    statements.append(f'fact table partitions: {settings.FACT_TABLE_PARTITIONS}')
+    return hashlib.sha256('\n'.join(statements).encode()).hexdigest()[:16]
+
+
+def stored_schema_version(conn: Connection) -> str | None:
+    if conn.execute(text("SELECT to_regclass('schema_version')")).scalar() is None:
+        return None
+    return conn.execute(text('SELECT version FROM schema_version')).scalar()
+
+
+def create_db_and_tables(drop_first: bool = False) -> bool:
+    """Bring the schema up to the models, unless it already is. Returns whether it had to.
+
+    Workers starting together would race on the DDL, so the setup runs
+    under an advisory lock in one transaction: the first worker does it and
+    the others wait, then find the new version stored and skip it. When the
+    stored version already matches, startup costs one query.
+    """
+    version = schema_version()
+    if not drop_first:
+        with engine.connect() as conn:
+            if stored_schema_version(conn) == version:
+                return False
+    
+    with engine.begin() as conn:
+        conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+        if drop_first:
             conn.execute(text('DROP SCHEMA public CASCADE'))
             conn.execute(text('CREATE SCHEMA public'))
-    SQLModel.metadata.create_all(engine)
+        elif stored_schema_version(conn) == version:
+            return False
+        
+        partition_fact_tables(conn)
+        SQLModel.metadata.create_all(conn)
+        add_missing_columns(conn)
+        add_missing_indexes(conn)
+        key_products_by_site(conn)
+        # Imported here since ingest imports the models from this module
+        from app.core.ingest import backfill_product_summaries
+        backfill_product_summaries(conn)
+        
+        conn.execute(text('DELETE FROM schema_version'))
+        conn.execute(text(
+            'INSERT INTO schema_version (version, applied_at) VALUES (:version, now())'
+        ), {'version': version})
+    return True
+
+
+async def warm_up_pools(connections: int) -> None:
+    """Open up to `connections` pooled connections per engine before the first request.
+
+    Otherwise the first requests after a start each wait for a connection
+    handshake (and TLS, on a remote database). Connections are opened
+    concurrently and returned to the pool; at most the pool size, since
+    overflow connections would be closed again on return.
+    """
+    sync_count = min(connections, settings.DB_POOL_SIZE)
+    if sync_count > 0:
+        held = await asyncio.gather(*[run_in_threadpool(engine.connect) for _ in range(sync_count)])
+        for conn in held:
+            conn.close()
+    
+    async_count = min(connections, settings.ASYNC_DB_POOL_SIZE)
+    if async_engine is not None and async_count > 0:
+        held = await asyncio.gather(*[async_engine.connect().start() for _ in range(async_count)])
+        for conn in held:
+            await conn.close()
+    
+    read_count = min(connections, settings.DB_READ_POOL_SIZE)
+    if read_count > 0 and replica_available():
+        try:
+            if async_read_engine is not None:
+                held = await asyncio.gather(*[async_read_engine.connect().start() for _ in range(read_count)])
+                for conn in held:
+                    await conn.close()
+            else:
+                held = await asyncio.gather(*[run_in_threadpool(read_engine.connect) for _ in range(read_count)])
+                for conn in held:
+                    conn.close()
+        except REPLICA_ERRORS:
+            # Start anyway; reads go to the primary until the replica is back
+            mark_replica_down()
+
+
+def partition_fact_tables(conn: Connection) -> None:
+    """Move fact tables created before partitioning into their partitioned form.
+
+    The old table is renamed, its rows copied into the new one with their
+    owner looked up from products, then dropped, all in the caller's
+    transaction. The copy rewrites every row, so on a large database expect
+    the first startup after upgrading to take a while.
+    """
+    for table in FACT_TABLES:
+        kind = conn.execute(text(
+            'SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace '
+            'WHERE c.relname = :name AND n.nspname = current_schema()'
+        ), {'name': table.name}).scalar()
+        # 'p' is already partitioned; a missing table is left to create_all
+        if kind != 'r':
+            continue
+        
+        legacy = f'{table.name}_unpartitioned'
+        conn.execute(text(f'ALTER TABLE {table.name} RENAME TO {legacy}'))
+        # Constraint names are unique per schema, and the new table reuses them
+        constraints = conn.execute(text(
+            'SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass)'
+        ), {'table': legacy}).scalars().all()
+        for constraint in constraints:
+            conn.execute(text(f'ALTER TABLE {legacy} DROP CONSTRAINT "{constraint}"'))
+        
+        table.create(conn)
+        conn.execute(text(
+            f'INSERT INTO {table.name} (user_id, product_id, day, quantity, price, amount) '
+            f'SELECT p.user_id, t.product_id, t.day, t.quantity, t.price, t.amount '
+            f'FROM {legacy} t JOIN products p ON p.id = t.product_id'
+        ))
+        conn.execute(text(f'DROP TABLE {legacy}'))
+
+
+def add_missing_columns(conn: Connection) -> None:
+    """Add columns that were added to a model after its table was created.
+
+    create_all only creates missing tables, so existing databases would
+    otherwise lack them. Only nullable columns and ones with a server
+    default can be added this way; anything else needs a real migration.
+    """
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if column.nullable:
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS '
+                    f'{column.name} {column.type.compile(conn.dialect)}'
+                ))
+            elif column.server_default is not None:
+                default = conn.execute(text('SELECT quote_literal(:value)'), {'value': column.server_default.arg}).scalar()
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS '
+                    f'{column.name} {column.type.compile(conn.dialect)} NOT NULL DEFAULT {default}'
+                ))
+
+
+def key_products_by_site(conn: Connection) -> None:
+    """Swap the (user_id, product_id) key of products created before sites for one including the site"""
+    constraints = conn.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST('products' AS regclass)"
+    )).scalars().all()
+    if 'unique_user_product' in constraints:
+        conn.execute(text('ALTER TABLE products DROP CONSTRAINT unique_user_product'))
+    if 'unique_user_product_site' not in constraints:
+        conn.execute(text(
+            'ALTER TABLE products ADD CONSTRAINT unique_user_product_site UNIQUE (user_id, product_id, site)'
+        ))
+
+
+def add_missing_indexes(conn: Connection) -> None:
+    """Create indexes that were added to a model after its table was created"""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 
 def get_db():
@@ -125,3 +505,143 @@ def get_db():
             raise
         finally:
             db.close()
+
+
+async def get_async_db():
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+class SessionRunner:
+    """Runs sync session code from async endpoints without blocking the event loop.
+
+    With DB_ASYNC the function runs on an AsyncSession through run_sync, so
+    I/O goes through asyncpg and no thread is held. Otherwise it runs on a
+    regular Session in the threadpool. Either way the function receives a
+    sync Session, so query code is written once.
+    """
+
+    # Only a ReadSessionRunner starts out on the replica
+    on_replica = False
+
+    def __init__(self, session: Session | AsyncSession):
+        self.session = session
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(fn, *args)
+        return await run_in_threadpool(fn, self.session, *args)
+
+
+@asynccontextmanager
+async def session_runner() -> AsyncIterator[SessionRunner]:
+    """A SessionRunner on whichever engine DB_ASYNC selects"""
+    if async_engine is not None:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            yield SessionRunner(db)
+    else:
+        db = Session(engine)
+        try:
+            yield SessionRunner(db)
+        finally:
+            await run_in_threadpool(db.close)
+
+
+async def get_session_runner():
+    async with session_runner() as runner:
+        yield runner
+
+
+# Errors after which a read is retried on the primary: the replica is down,
+# unreachable, out of connections or cancelled the query during recovery
+REPLICA_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError, OSError)
+
+_replica_down_until = 0.0
+
+
+def replica_available() -> bool:
+    return read_engine is not None and time.monotonic() >= _replica_down_until
+
+
+def use_replica(username: str | None = None) -> bool:
+    """Whether a read can go to the replica: there is one, it's up and the user hasn't just written"""
+    return replica_available() and (username is None or not wrote_recently(username))
+
+
+def read_sync_engine(username: str | None = None) -> Engine:
+    """The sync engine for a long read, e.g. one streamed from a server-side cursor"""
+    return read_engine if use_replica(username) else engine
+
+
+def mark_replica_down() -> None:
+    """Send reads to the primary for DB_READ_RETRY_SECONDS, rather than failing over on every request"""
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + settings.DB_READ_RETRY_SECONDS
+
+
+def primary_session() -> Session | AsyncSession:
+    if async_engine is not None:
+        return AsyncSession(async_engine, expire_on_commit=False)
+    return Session(engine)
+
+
+async def close_session(db: Session | AsyncSession) -> None:
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
+
+
+class ReadSessionRunner(SessionRunner):
+    """A SessionRunner on the read replica that moves to the primary if the replica fails.
+
+    Only for functions that read, since a failed one is run again on the
+    primary. Sessions are closed by read_session_runner.
+    """
+
+    def __init__(self, session: Session | AsyncSession):
+        super().__init__(session)
+        self.on_replica = True
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.on_replica:
+            try:
+                return await super().run(fn, *args)
+            except REPLICA_ERRORS:
+                mark_replica_down()
+                await self.use_primary()
+        return await super().run(fn, *args)
+
+    async def use_primary(self) -> None:
+        """Run everything from here on on the primary, e.g. to look for a row the replica doesn't have yet"""
+        if self.on_replica:
+            await close_session(self.session)
+            self.session = primary_session()
+            self.on_replica = False
+
+
+@asynccontextmanager
+async def read_session_runner(username: str | None = None) -> AsyncIterator[SessionRunner]:
+    """A SessionRunner for read-only work, on the read replica when there is one.
+
+    Stays on the primary without a replica, while the replica is marked
+    down, and for a user who uploaded in the last READ_AFTER_WRITE_SECONDS.
+    """
+    # The user's read-your-writes deadline may be in Redis
+    if not (replica_available() and await run_in_threadpool(use_replica, username)):
+        async with session_runner() as runner:
+            yield runner
+        return
+    
+    if async_read_engine is not None:
+        runner = ReadSessionRunner(AsyncSession(async_read_engine, expire_on_commit=False))
+    else:
+        runner = ReadSessionRunner(Session(read_engine))
+    try:
+        yield runner
+    finally:
+        await close_session(runner.session)
@@ -4,7 +4,8 @@ from typing import Annotated
 
 from fastapi import Depends
 
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_token_subject
 from app.db import User
 
-CurrentUser = Annotated[User, Depends(get_current_user)]
\ No newline at end of file
+CurrentUser = Annotated[User, Depends(get_current_user)]
+TokenSubject = Annotated[str, Depends(get_token_subject)]
\ No newline at end of file
@@ -4,7 +4,13 @@ from typing import Annotated
 
 from fastapi import Depends
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.db import get_db
+from app.core.auth import get_read_session_runner
+from app.db import get_async_db, get_db, get_session_runner, SessionRunner
 
 DB = Annotated[Session, Depends(get_db)]
+AsyncDB = Annotated[AsyncSession, Depends(get_async_db)]
+DBRunner = Annotated[SessionRunner, Depends(get_session_runner)]
+# For endpoints that only read: the read replica when there is one
+ReadDBRunner = Annotated[SessionRunner, Depends(get_read_session_runner)]
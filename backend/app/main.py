@@ -1,21 +1,38 @@
 from __future__ import annotations
 
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi import status
 
+from app.routers.analytics import router as analytics_router
 from app.routers.auth import router as auth_router
-from app.routers.upload import router as upload_router
+from app.routers.upload import fail_stale_uploads, router as upload_router
+from app.routers.upload_sessions import router as upload_sessions_router
 
+from app.core.compression import CompressionMiddleware
+from app.core.config import get_settings
 from app.core.cors import add_cors_middleware
-from app.db import create_db_and_tables
+from app.core.executors import configure_threadpool, shutdown_executors
+from app.core.jobs import shutdown_jobs
+from app.core.metrics import metrics_response, RequestMetricsMiddleware
+from app.core.progress import progress_broker
+from app.core.user_cache import get_user_cache
+from app.db import create_db_and_tables, warm_up_pools
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    configure_threadpool()
     create_db_and_tables()
+    fail_stale_uploads()
+    await warm_up_pools(get_settings().DB_POOL_WARMUP)
+    progress_broker.attach(asyncio.get_running_loop())
     yield
+    shutdown_jobs()
+    shutdown_executors()
+    progress_broker.attach(None)
 
 
 def create_app() -> FastAPI:
@@ -33,13 +50,35 @@ def create_app() -> FastAPI:
     async def health_check():
         return {'status': 'ok'}
 
+    @app.get('/health/user-cache', tags=['Health'])
+    async def user_cache_stats():
+        user_cache = get_user_cache()
+        if user_cache is None:
+            return {'enabled': False}
+        return {'enabled': True, **user_cache.stats()}
+
+    # Prometheus scrape endpoint
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics():
+        return metrics_response()
+
     # Include routers
     app.include_router(auth_router)
     app.include_router(upload_router)
+    app.include_router(upload_sessions_router)
+    app.include_router(analytics_router)
 
 
     # middleware
+    settings = get_settings()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_BYTES,
+        gzip_level=settings.GZIP_LEVEL,
+        brotli_quality=settings.BROTLI_QUALITY,
+    )
     add_cors_middleware(app)
+    app.add_middleware(RequestMetricsMiddleware)
     return app
 
 
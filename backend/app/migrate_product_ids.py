@@ -0,0 +1,89 @@
+"""Rewrite numeric product IDs stored as floats, like '300.0', as uploads now store them: '300'.
+
+    uv run python -m app.migrate_product_ids --before 2026-10-17T06:00:00+00:00
+    uv run python -m app.migrate_product_ids --before 2026-10-17T06:00:00+00:00 --apply
+
+Uploads used to read an ID column that had blank cells as floats and store
+its IDs as '300.0'; they now store '300', so the next upload of such a
+product creates a second one instead of updating the first. This one-off
+migration fixes the old keys. It isn't run at startup, because an ID
+genuinely written as '300.0' (a text cell, a CSV) looks the same: only
+products last written before `--before`, the time the release that stores
+'300' was deployed, are touched.
+
+A '300.0' product that was already uploaded again as '300' is a duplicate;
+it is removed along with its day rows. Without `--apply` nothing is
+changed and the products that would be are printed. The affected users'
+cached responses are dropped afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import datetime
+
+from sqlalchemy import Connection, text
+
+from app.db import engine, FACT_TABLES, ProductSummary
+
+# Whole numbers as str(float) writes them
+FLOAT_ID_PATTERN = r'^-?[0-9]+\.0$'
+
+
+def float_id_products(conn: Connection, before: datetime) -> list[tuple]:
+    """(id, user_id, username, product_id, site, duplicate) of each product the migration touches"""
+    return conn.execute(text(
+        'SELECT p.id, p.user_id, u.username, p.product_id, p.site, n.id IS NOT NULL AS duplicate '
+        'FROM products p JOIN users u ON u.id = p.user_id '
+        'LEFT JOIN products n ON n.user_id = p.user_id AND n.site = p.site '
+        "AND n.product_id = regexp_replace(p.product_id, '\\.0$', '') "
+        'WHERE p.product_id ~ :pattern AND p.updated_at < :before '
+        'ORDER BY u.username, p.site, p.product_id'
+    ), {'pattern': FLOAT_ID_PATTERN, 'before': before}).all()
+
+
+def normalize_product_ids(conn: Connection, products: list[tuple]) -> None:
+    """Remove the duplicates among `products` and strip '.0' from the rest"""
+    for product_id, user_id, _, code, site, duplicate in products:
+        if duplicate:
+            for table in (*FACT_TABLES, ProductSummary.__table__):
+                conn.execute(table.delete().where(table.c.user_id == user_id, table.c.product_id == product_id))
+            conn.execute(text('DELETE FROM products WHERE id = :id'), {'id': product_id})
+            continue
+        conn.execute(text(
+            "UPDATE product_summary SET code = regexp_replace(code, '\\.0$', '') "
+            'WHERE user_id = :user_id AND product_id = :id'
+        ), {'user_id': user_id, 'id': product_id})
+        conn.execute(text(
+            "UPDATE products SET product_id = regexp_replace(product_id, '\\.0$', '') WHERE id = :id"
+        ), {'id': product_id})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--before', type=datetime.fromisoformat, required=True,
+        help='only products last written before this time (ISO 8601, with a UTC offset)',
+    )
+    parser.add_argument('--apply', action='store_true', help='make the changes instead of listing them')
+    args = parser.parse_args()
+    if args.before.tzinfo is None:
+        parser.error('--before needs a UTC offset, e.g. 2026-10-17T06:00:00+00:00')
+
+    with engine.begin() as conn:
+        products = float_id_products(conn, args.before)
+        for _, _, username, code, site, duplicate in products:
+            action = 'remove duplicate' if duplicate else 'rename'
+            print(f"{username}\t{site or '-'}\t{code}\t{action}")
+        if args.apply:
+            normalize_product_ids(conn, products)
+    print(f"{len(products)} products {'changed' if args.apply else 'to change, run with --apply'}")
+
+    if args.apply and products:
+        # Imported here since the cache module reads the settings at import
+        from app.core.cache import invalidate_user_cache
+        for username in sorted({username for _, _, username, *_ in products}):
+            invalidate_user_cache(username)
+
+
+if __name__ == '__main__':
+    main()
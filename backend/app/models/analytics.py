@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from pydantic import BaseModel
+from typing import List, Optional
+
+class TimeSeriesPoint(BaseModel):
+    day: int
+    procurement_qty: int
+    procurement_amount: float
+    sales_qty: int
+    sales_amount: float
+    inventory: int
+
+class TimeSeriesResponse(BaseModel):
+    product_ids: Optional[List[str]] = None
+    site: Optional[str] = None
+    start_day: int
+    end_day: int
+    opening_inventory: int
+    points: List[TimeSeriesPoint]
+
+class ProductSummaryItem(BaseModel):
+    product_id: str
+    site: str
+    name: str
+    opening_inventory: int
+    total_procurement_qty: int
+    total_procurement_amount: float
+    total_sales_qty: int
+    total_sales_amount: float
+    closing_inventory: int
+    gross_margin: Optional[float] = None
+    last_day: Optional[int] = None
+    stockout: bool
+
+class ProductSummaryListResponse(BaseModel):
+    products: List[ProductSummaryItem]
+    total: int
+
+class InventoryItem(BaseModel):
+    product_id: str
+    site: str
+    name: str
+    opening_inventory: int
+    closing_inventory: int
+    stockout_day: Optional[int] = None  # First day inventory was zero or less
+    stockout_days: int
+    daily_sales: float  # Over the window
+    days_of_cover: Optional[float] = None  # None if the product doesn't sell
+    projected_stockout_day: Optional[int] = None
+    sell_through_rate: Optional[float] = None  # Sold / (opening inventory + procured)
+    average_margin: Optional[float] = None  # 1 - average unit cost / average unit price
+    safety_stock: float
+    reorder_point: float
+    needs_reorder: bool
+    suggested_order_qty: int
+
+class InventoryAnalyticsResponse(BaseModel):
+    as_of_day: int
+    window_days: int
+    lead_time_days: int
+    service_level: float
+    products: List[InventoryItem]
+    total: int
@@ -17,10 +17,25 @@ class ExcelUploadResponse(BaseModel):
     products_processed: int
     status: str
     validation_info: Optional[Dict[str, Any]] = None
+    ingest_stats: Optional[Dict[str, int]] = None
+    metrics: Optional[Dict[str, Any]] = None  # stage_seconds, rows_read, cells_read, peak_memory_bytes
+
+class UploadJobResponse(BaseModel):
+    upload_id: str
+    filename: str
+    status: str
+    upload_date: datetime
+    finished_at: Optional[datetime] = None
+    products_processed: Optional[int] = None
+    validation_info: Optional[Dict[str, Any]] = None
+    ingest_stats: Optional[Dict[str, int]] = None
+    metrics: Optional[Dict[str, Any]] = None
+    errors: List[str] = []
 
 class ProductDataResponse(BaseModel):
     id: str
     product_id: str
+    site: str
     name: str
     opening_inventory: int
     procurement_data: List[dict]
@@ -28,4 +43,19 @@ class ProductDataResponse(BaseModel):
 
 class ProductListResponse(BaseModel):
     products: List[ProductDataResponse]
-    total: int
\ No newline at end of file
+    total: int
+    next_cursor: Optional[str] = None
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0, description="Total bytes the chunks will add up to")
+    sha256: Optional[str] = Field(None, pattern='^[0-9a-fA-F]{64}$', description="Of the whole file, checked on completion")
+
+class UploadSessionResponse(BaseModel):
+    upload_session_id: str
+    filename: str
+    size: int
+    offset: int  # Bytes received so far, where the next chunk starts
+    chunk_max_bytes: int
+    expires_at: datetime
+    upload_id: Optional[str] = None  # Once completed, poll GET /upload/jobs/{upload_id}
@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Literal, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, text
+from sqlmodel import select, Session
+
+from app.core.auth import get_current_user
+from app.core.cache import cached_response
+from app.core.config import get_settings
+from app.core.inventory import day_matrix, inventory_metrics, rank
+from app.core.lazy_imports import lazy_import
+from app.db import Product, ProcurementData, ProductSummary, SalesData
+from app.dependencies.auth import TokenSubject
+from app.dependencies.db import ReadDBRunner
+from app.models.analytics import InventoryAnalyticsResponse, ProductSummaryListResponse, TimeSeriesPoint, TimeSeriesResponse
+
+np = lazy_import('numpy')
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+settings = get_settings()
+
+# Same lower bound the dashboard chart has always used
+MIN_CHART_DAYS = 3
+
+def product_filter(user_id: UUID, product_ids: Optional[List[str]], site: Optional[str]):
+    """The user's products, optionally only some Excel product IDs and one site"""
+    condition = Product.user_id == user_id
+    if product_ids:
+        condition = condition & Product.product_id.in_(product_ids)
+    if site is not None:
+        condition = condition & (Product.site == site)
+    return condition
+
+def fact_filter(
+    model: type[ProcurementData] | type[SalesData],
+    user_id: UUID,
+    product_ids: Optional[List[str]],
+    site: Optional[str],
+):
+    """The user's rows of one fact table, optionally for some Excel product IDs or a site.
+
+    Fact rows carry user_id, so only a product selection needs products.
+    """
+    condition = model.user_id == user_id
+    if product_ids or site is not None:
+        selected = select(Product.id).where(product_filter(user_id, product_ids, site))
+        condition = condition & model.product_id.in_(selected)
+    return condition
+
+def daily_totals(model: type[ProcurementData] | type[SalesData], condition, end_day: int):
+    """Per-day quantity and amount totals of one fact table for the selected products"""
+    return select(
+        model.day,
+        func.sum(model.quantity).label('quantity'),
+        func.sum(model.amount).label('amount')
+    ).where(
+        condition, model.day <= end_day
+    ).group_by(model.day).subquery()
+
+def last_day(model: type[ProcurementData] | type[SalesData], condition):
+    return select(func.max(model.day)).where(condition).scalar_subquery()
+
+def build_timeseries(
+    db: Session,
+    user_id: UUID,
+    product_ids: Optional[List[str]],
+    start_day: int,
+    end_day: Optional[int],
+    site: Optional[str] = None,
+) -> TimeSeriesResponse:
+    """Per-day procurement, sales and running inventory totals for a set of products.
+
+    Everything is aggregated in SQL, so the payload is one point per day no
+    matter how many products are selected. Without a site, products that
+    several sites stock are summed over all of them.
+    """
+    selected_products = product_filter(user_id, product_ids, site)
+    procurement_filter = fact_filter(ProcurementData, user_id, product_ids, site)
+    sales_filter = fact_filter(SalesData, user_id, product_ids, site)
+    
+    if end_day is not None and start_day > end_day:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start_day must not be after end_day"
+        )
+    
+    # Days past the last one with data would only repeat the closing inventory,
+    # so a later end_day is cut short rather than generating the whole range
+    data_end_day = db.exec(select(func.greatest(
+        func.coalesce(last_day(ProcurementData, procurement_filter), 0),
+        func.coalesce(last_day(SalesData, sales_filter), 0),
+        MIN_CHART_DAYS
+    ))).one()
+    end_day = data_end_day if end_day is None else min(end_day, data_end_day)
+    
+    opening_inventory = db.exec(
+        select(func.coalesce(func.sum(Product.opening_inventory), 0)).where(selected_products)
+    ).one()
+    
+    # Running inventory has to start from day 1 even if the range starts later
+    days = select(func.generate_series(1, end_day).label('day')).subquery()
+    procurement = daily_totals(ProcurementData, procurement_filter, end_day)
+    sales = daily_totals(SalesData, sales_filter, end_day)
+    
+    procurement_qty = func.coalesce(procurement.c.quantity, 0)
+    sales_qty = func.coalesce(sales.c.quantity, 0)
+    series = select(
+        days.c.day,
+        procurement_qty.label('procurement_qty'),
+        func.coalesce(procurement.c.amount, 0.0).label('procurement_amount'),
+        sales_qty.label('sales_qty'),
+        func.coalesce(sales.c.amount, 0.0).label('sales_amount'),
+        (opening_inventory + func.sum(procurement_qty - sales_qty).over(order_by=days.c.day)).label('inventory')
+    ).select_from(
+        days
+        .outerjoin(procurement, procurement.c.day == days.c.day)
+        .outerjoin(sales, sales.c.day == days.c.day)
+    ).subquery()
+    
+    rows = db.exec(select(*series.c).where(series.c.day >= start_day).order_by(series.c.day)).all()
+    
+    return TimeSeriesResponse(
+        product_ids=product_ids,
+        site=site,
+        start_day=start_day,
+        end_day=end_day,
+        opening_inventory=opening_inventory,
+        points=[TimeSeriesPoint(
+            day=row.day,
+            procurement_qty=row.procurement_qty,
+            procurement_amount=row.procurement_amount,
+            sales_qty=row.sales_qty,
+            sales_amount=row.sales_amount,
+            inventory=row.inventory
+        ) for row in rows]
+    )
+
+@router.get("/timeseries", response_model=TimeSeriesResponse)
+async def get_timeseries(
+    request: Request,
+    db: ReadDBRunner,
+    username: TokenSubject,
+    product_ids: Optional[List[str]] = Query(None, description="Excel product IDs, all products when omitted"),
+    start_day: int = Query(1, ge=1),
+    end_day: Optional[int] = Query(
+        None, ge=1, le=settings.TIMESERIES_MAX_DAYS, description="Defaults to, and is capped at, the last day with data"
+    ),
+    site: Optional[str] = Query(None, description="Only this site's products (the sheet they were uploaded on)")
+):
+    """Dashboard chart series for the selected products"""
+    async def build() -> bytes:
+        current_user = await get_current_user(db, username)
+        timeseries = await db.run(build_timeseries, current_user.id, product_ids, start_day, end_day, site)
+        return timeseries.model_dump_json().encode()
+    
+    return await cached_response(request, username, build)
+
+SummarySort = Literal[
+    'product_id', 'name', 'total_procurement_qty', 'total_procurement_amount', 'total_sales_qty',
+    'total_sales_amount', 'closing_inventory', 'gross_margin', 'last_day',
+]
+
+# Sort keys of the product listing; ties are broken by product ID, then site
+SUMMARY_SORT_COLUMNS = {
+    'product_id': ProductSummary.code,
+    'name': ProductSummary.name,
+    'total_procurement_qty': ProductSummary.total_procurement_qty,
+    'total_procurement_amount': ProductSummary.total_procurement_amount,
+    'total_sales_qty': ProductSummary.total_sales_qty,
+    'total_sales_amount': ProductSummary.total_sales_amount,
+    'closing_inventory': ProductSummary.closing_inventory,
+    'gross_margin': ProductSummary.gross_margin,
+    'last_day': ProductSummary.last_day,
+}
+
+def list_product_summaries(
+    db: Session,
+    user_id: UUID,
+    sort: str,
+    descending: bool,
+    search: Optional[str],
+    stockout: Optional[bool],
+    limit: Optional[int],
+    offset: int,
+    site: Optional[str] = None,
+) -> ProductSummaryListResponse:
+    """One page of a user's product summaries, read from product_summary alone"""
+    condition = ProductSummary.user_id == user_id
+    if site is not None:
+        condition = condition & (ProductSummary.site == site)
+    if search:
+        condition = condition & (
+            ProductSummary.name.icontains(search, autoescape=True)
+            | ProductSummary.code.icontains(search, autoescape=True)
+        )
+    if stockout is not None:
+        condition = condition & (ProductSummary.stockout == stockout)
+    
+    sort_column = SUMMARY_SORT_COLUMNS[sort]
+    order = sort_column.desc().nulls_last() if descending else sort_column.asc().nulls_last()
+    # Plain columns rather than entities: no ORM objects for tens of thousands of rows
+    statement = select(
+        ProductSummary.code.label('product_id'),
+        *[column for column in ProductSummary.__table__.c if column.name not in ('user_id', 'product_id', 'code')]
+    ).where(condition).order_by(order, ProductSummary.code, ProductSummary.site).offset(offset).limit(limit)
+    result = db.connection().execute(statement)
+    keys = list(result.keys())
+    rows = result.all()
+    
+    # Only count separately when this page doesn't settle it
+    if (limit is None or len(rows) < limit) and (rows or not offset):
+        total = offset + len(rows)
+    else:
+        total = db.exec(select(func.count()).select_from(ProductSummary).where(condition)).one()
+    
+    # Validated as one document; per-item model_validate costs more than the query
+    return ProductSummaryListResponse.model_validate({
+        'products': [dict(zip(keys, row)) for row in rows],
+        'total': total,
+    })
+
+@router.get("/products", response_model=ProductSummaryListResponse)
+async def get_product_summaries(
+    request: Request,
+    db: ReadDBRunner,
+    username: TokenSubject,
+    sort: SummarySort = Query('product_id'),
+    order: Literal['asc', 'desc'] = Query('asc'),
+    search: Optional[str] = Query(None, description="Substring of the product name or ID"),
+    stockout: Optional[bool] = Query(None, description="Only products that did (true) or didn't (false) run out"),
+    site: Optional[str] = Query(None, description="Only this site's products (the sheet they were uploaded on)"),
+    limit: int = Query(100, ge=1, le=10000),
+    offset: int = Query(0, ge=0)
+):
+    """Product sidebar listing: totals, closing inventory and margin from product_summary"""
+    async def build() -> bytes:
+        current_user = await get_current_user(db, username)
+        summaries = await db.run(
+            list_product_summaries, current_user.id, sort, order == 'desc', search, stockout, limit, offset, site
+        )
+        return summaries.model_dump_json().encode()
+    
+    return await cached_response(request, username, build)
+
+# Everything the inventory metrics need, in one statement so the products
+# and their day rows come from the same snapshot. Numbers are sent as
+# packed big-endian records (int4send, float8send) that numpy reads as is,
+# rather than as millions of separately parsed values. Products are
+# numbered in (code, site) order, and day rows refer to them by number
+INVENTORY_DATA = '''
+WITH p AS MATERIALIZED (
+    SELECT
+        product_id, (row_number() OVER (ORDER BY code, site) - 1)::integer AS position,
+        code, site, name, opening_inventory, total_procurement_amount, total_sales_amount
+    FROM product_summary
+    WHERE user_id = :user_id AND (CAST(:site AS varchar) IS NULL OR site = CAST(:site AS varchar))
+)
+SELECT
+    (SELECT array_agg(code ORDER BY position) FROM p) AS codes,
+    (SELECT array_agg(site ORDER BY position) FROM p) AS sites,
+    (SELECT array_agg(name ORDER BY position) FROM p) AS names,
+    (SELECT string_agg(
+        int4send(opening_inventory) || float8send(total_procurement_amount) || float8send(total_sales_amount),
+        '' ORDER BY position
+    ) FROM p) AS totals,
+    (SELECT string_agg(int4send(p.position) || int4send(t.day) || int4send(t.quantity), '')
+     FROM procurement_data t JOIN p ON p.product_id = t.product_id WHERE t.user_id = :user_id) AS procurement,
+    (SELECT string_agg(int4send(p.position) || int4send(t.day) || int4send(t.quantity), '')
+     FROM sales_data t JOIN p ON p.product_id = t.product_id WHERE t.user_id = :user_id) AS sales
+'''
+
+TOTALS_RECORD = [('opening_inventory', '>i4'), ('procurement_amount', '>f8'), ('sales_amount', '>f8')]
+DAY_RECORD = [('product', '>i4'), ('day', '>i4'), ('quantity', '>i4')]
+
+def load_inventory_data(db: Session, user_id: UUID, site: Optional[str]) -> Dict[str, Any]:
+    """A user's products in (product ID, site) order, their totals and their day rows, as arrays"""
+    row = db.connection().execute(text(INVENTORY_DATA), {'user_id': user_id, 'site': site}).one()
+    records = lambda packed, dtype: np.frombuffer(packed or b'', dtype=dtype)
+    return {
+        'product_id': row.codes or [],
+        'site': row.sites or [],
+        'name': row.names or [],
+        'totals': records(row.totals, TOTALS_RECORD),
+        'procurement': records(row.procurement, DAY_RECORD),
+        'sales': records(row.sales, DAY_RECORD),
+    }
+
+InventorySort = Literal[
+    'product_id', 'closing_inventory', 'stockout_day', 'stockout_days', 'daily_sales', 'days_of_cover',
+    'projected_stockout_day', 'sell_through_rate', 'average_margin', 'reorder_point', 'suggested_order_qty',
+]
+
+# Metrics that are whole numbers but NaN when undefined, so come back as floats
+INTEGER_METRICS = ('stockout_day', 'projected_stockout_day')
+
+def summarize_inventory(
+    data: Dict[str, Any],
+    sort: str,
+    descending: bool,
+    needs_reorder: Optional[bool],
+    max_days_of_cover: Optional[float],
+    limit: int,
+    window_days: int,
+    lead_time_days: int,
+    service_level: float,
+) -> InventoryAnalyticsResponse:
+    """Inventory metrics of every product, then the top `limit` of those passing the filters"""
+    products = len(data['product_id'])
+    days = int(max(data['procurement']['day'].max(initial=0), data['sales']['day'].max(initial=0)))
+    totals = data['totals']
+    opening_inventory = totals['opening_inventory'].astype(np.int64)
+    metrics = inventory_metrics(
+        opening_inventory,
+        day_matrix(products, days, data['procurement']),
+        day_matrix(products, days, data['sales']),
+        totals['procurement_amount'].astype(np.float64),
+        totals['sales_amount'].astype(np.float64),
+        window_days,
+        lead_time_days,
+        service_level,
+    )
+    
+    selected = np.ones(products, dtype=bool)
+    if needs_reorder is not None:
+        selected &= metrics['needs_reorder'] == needs_reorder
+    if max_days_of_cover is not None:
+        selected &= metrics['days_of_cover'] <= max_days_of_cover
+    candidates = np.flatnonzero(selected)
+    # Products are already in product ID order
+    keys = candidates if sort == 'product_id' else metrics[sort][candidates]
+    page = candidates[rank(keys, descending, limit)]
+    
+    columns: Dict[str, List[Any]] = {
+        'product_id': [data['product_id'][i] for i in page],
+        'site': [data['site'][i] for i in page],
+        'name': [data['name'][i] for i in page],
+        'opening_inventory': opening_inventory[page].tolist(),
+    }
+    for field, values in metrics.items():
+        values = values[page].tolist()
+        if field in INTEGER_METRICS:
+            columns[field] = [None if value != value else int(value) for value in values]
+        else:
+            columns[field] = [None if value != value else value for value in values]
+    
+    return InventoryAnalyticsResponse.model_validate({
+        'as_of_day': days,
+        'window_days': window_days,
+        'lead_time_days': lead_time_days,
+        'service_level': service_level,
+        'products': [dict(zip(columns, row)) for row in zip(*columns.values())],
+        'total': len(candidates),
+    })
+
+@router.get("/inventory", response_model=InventoryAnalyticsResponse)
+async def get_inventory_analytics(
+    request: Request,
+    db: ReadDBRunner,
+    username: TokenSubject,
+    sort: InventorySort = Query('days_of_cover'),
+    order: Literal['asc', 'desc'] = Query('asc'),
+    needs_reorder: Optional[bool] = Query(None, description="Only products at (true) or above (false) their reorder point"),
+    max_days_of_cover: Optional[float] = Query(None, ge=0, description="Only products that run out within this many days"),
+    site: Optional[str] = Query(None, description="Only this site's products (the sheet they were uploaded on)"),
+    limit: int = Query(100, ge=1, le=10000, description="Top N after sorting"),
+    window_days: int = Query(7, ge=1, le=365, description="Recent days the sales rate is taken from"),
+    lead_time_days: int = Query(7, ge=1, le=365, description="Days from ordering to receiving stock"),
+    service_level: float = Query(0.95, ge=0.5, lt=1, description="Chance of not running out during the lead time"),
+):
+    """Stock health per product: stockouts, days of cover, sell-through, margin and reorder suggestions.
+
+    Computed from all of the user's day rows at once, then sorted and cut
+    to the top `limit`. Undefined metrics are null, e.g. days of cover of a
+    product that doesn't sell; they sort last.
+    """
+    async def build() -> bytes:
+        current_user = await get_current_user(db, username)
+        data = await db.run(load_inventory_data, current_user.id, site)
+        # The arithmetic runs off the event loop, even when the query ran on it
+        inventory = await run_in_threadpool(
+            summarize_inventory, data, sort, order == 'desc', needs_reorder, max_days_of_cover, limit,
+            window_days, lead_time_days, service_level,
+        )
+        return inventory.model_dump_json().encode()
+    
+    return await cached_response(request, username, build)
@@ -1,16 +1,19 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, HTTPException, status, Depends
-from sqlmodel import select
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
 
 from app.core.auth import (
     create_access_token,
     get_password_hash,
+    get_user_by_username,
     verify_password,
     get_current_user
 )
+from app.core.read_routing import note_user_write
 from app.db import User
-from app.dependencies.db import DB
+from app.dependencies.db import DBRunner
 from app.models.auth import (
     UserRegister,
     UserLogin,
@@ -21,11 +24,25 @@ from app.models.auth import (
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# Queries go through the session runner (asyncpg with DB_ASYNC, otherwise the
+# threadpool) and bcrypt runs in the threadpool, since it releases the GIL
+# while hashing. Nothing here blocks the event loop.
+
+def create_user(db: Session, username: str, password_hash: str) -> User:
+    db_user = User(
+        username=username,
+        password_hash=password_hash
+    )
+    
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserRegister, db: DB):
+async def register(user_data: UserRegister, db: DBRunner):
     # Check if username already exists
-    statement = select(User).where(User.username == user_data.username)
-    existing_user = db.exec(statement).first()
+    existing_user = await db.run(get_user_by_username, user_data.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -33,15 +50,9 @@ async def register(user_data: UserRegister, db: DB):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    db_user = User(
-        username=user_data.username,
-        password_hash=hashed_password
-    )
-    
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
+    db_user = await db.run(create_user, user_data.username, hashed_password)
+    await run_in_threadpool(note_user_write, db_user.username)
     
     return UserResponse(
         id=str(db_user.id),
@@ -49,12 +60,11 @@ async def register(user_data: UserRegister, db: DB):
     )
 
 @router.post("/login", response_model=LoginResponse)
-async def login(user_credentials: UserLogin, db: DB):
+async def login(user_credentials: UserLogin, db: DBRunner):
     # Find user by username
-    statement = select(User).where(User.username == user_credentials.username)
-    user = db.exec(statement).first()
+    user = await db.run(get_user_by_username, user_credentials.username)
     
-    if not user or not verify_password(user_credentials.password, user.password_hash):
+    if not user or not await run_in_threadpool(verify_password, user_credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -83,4 +93,4 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 async def logout():
     # In a real app, you might want to blacklist the token
     # For now, just return success - frontend will remove the token
-    return {"message": "Successfully logged out"}
\ No newline at end of file
+    return {"message": "Successfully logged out"}
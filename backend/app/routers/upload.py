@@ -1,21 +1,72 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import io
-import pandas as pd
+import json
+import os
 import re
-from datetime import datetime, UTC
-from typing import Any, Dict, List
+import zipfile
+from datetime import datetime, timedelta, UTC
+from typing import Any, AsyncIterator, Dict, Generator, Iterable, List, Literal
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
-from sqlmodel import select
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import ColumnElement, func, Select, tuple_
+from sqlmodel import select, Session, update
 
+from app.core.auth import get_current_user
+from app.core.cache import cached_response, invalidate_user_cache
+from app.core.config import get_settings
+from app.core.export import csv_export, EXPORT_MEDIA_TYPES, parquet_export, xlsx_export
+from app.core.executors import call_in_process, map_in_process, run_cpu_bound
+from app.core.ingest import ingest_products
+from app.core.jobs import submit_job
+from app.core.lazy_imports import lazy_import
+from app.core.metrics import current_rss_bytes, observe_upload, UploadMetrics
+from app.core.progress import DONE, progress_broker, publish_done, UploadProgress
+from app.core.read_routing import note_user_write
+from app.core.response_formats import ARROW, COLUMNAR_JSON, empty_day_columns, JSON, MSGPACK, negotiate_format, ProductColumns
+from app.db import engine, mark_replica_down, read_session_runner, read_sync_engine, REPLICA_ERRORS, session_runner
 from app.db import User, Product, ProcurementData, SalesData, ExcelUpload
-from app.dependencies.auth import CurrentUser
-from app.dependencies.db import DB
-from app.models.upload import ExcelUploadResponse, ProductDataResponse, ProductListResponse
+from app.dependencies.auth import CurrentUser, TokenSubject
+from app.dependencies.db import DB, DBRunner, ReadDBRunner
+from app.models.upload import ExcelUploadResponse, ProductListResponse, UploadJobResponse
+
+# Loaded on the first upload or columnar read rather than at startup
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow')
+
+settings = get_settings()
 
 router = APIRouter(prefix="/upload", tags=["Upload"])
 
+# Column names we accept for the per-product fields, in order of preference
+ID_COLUMNS = ['ID', 'Product ID', 'ProductID', 'id', 'product_id']
+NAME_COLUMNS = ['Product Name', 'ProductName', 'Name', 'product_name', 'name']
+INVENTORY_COLUMNS = ['Opening Inventory', 'Opening Inventory on Day 1', 'opening_inventory', 'OpeningInventory']
+
+# Upload formats. Columnar ones are read with pyarrow and always stored in chunks
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+COLUMNAR_EXTENSIONS = ('.csv', '.parquet', '.arrow', '.feather', '.arrows')
+FORMAT_NAMES = {
+    '.xlsx': 'Excel', '.xls': 'Excel', '.csv': 'CSV', '.parquet': 'Parquet',
+    '.arrow': 'Arrow', '.feather': 'Arrow', '.arrows': 'Arrow',
+}
+
+def unreadable_file_errors() -> tuple[type[Exception], ...]:
+    """What the readers raise for a file that isn't valid in the format its extension names"""
+    from openpyxl.utils.exceptions import InvalidFileException
+    
+    return (pd.errors.ParserError, pd.errors.EmptyDataError, pa.ArrowInvalid, zipfile.BadZipFile, InvalidFileException)
+
+def invalid_file_message(filename: str) -> str:
+    file_format = FORMAT_NAMES.get(os.path.splitext(filename)[1], 'Excel')
+    return f"Invalid {file_format} file format. Please check your file and try again."
+
 def get_column_name_patterns(day: int) -> Dict[str, List[str]]:
     """Returns different Excel column naming patterns we support"""
     return {
@@ -68,8 +119,13 @@ def detect_max_days(df: pd.DataFrame) -> int:
     # Default to 3 days minimum for backward compatibility
     return max(max_day, 3)
 
-def validate_excel_format(df: pd.DataFrame) -> Dict[str, Any]:
-    """Check if the Excel file has the right format"""
+def validate_excel_format(df: pd.DataFrame, total_rows: int | None = None) -> Dict[str, Any]:
+    """Check if the Excel file has the right format
+
+    total_rows overrides len(df), for streamed sheets validated on their header.
+    """
+    if total_rows is None:
+        total_rows = len(df)
     errors = []
     warnings = []
     
@@ -80,9 +136,9 @@ def validate_excel_format(df: pd.DataFrame) -> Dict[str, Any]:
     for req_col in required_columns:
         found = False
         possible_names = {
-            'ID': ['ID', 'Product ID', 'ProductID', 'id', 'product_id'],
-            'Product Name': ['Product Name', 'ProductName', 'Name', 'product_name', 'name'],
-            'Opening Inventory': ['Opening Inventory', 'Opening Inventory on Day 1', 'opening_inventory', 'OpeningInventory']
+            'ID': ID_COLUMNS,
+            'Product Name': NAME_COLUMNS,
+            'Opening Inventory': INVENTORY_COLUMNS
         }
         
         for possible in possible_names.get(req_col, [req_col]):
@@ -116,14 +172,14 @@ def validate_excel_format(df: pd.DataFrame) -> Dict[str, Any]:
         warnings.append(f"Some day-specific columns are missing: {', '.join(missing_day_columns[:3])}{'...' if len(missing_day_columns) > 3 else ''}")
     
     # Make sure we have actual data
-    if df.empty:
+    if total_rows == 0:
         errors.append("Excel file contains no data rows")
-    elif len(df) < 1:
+    elif total_rows < 1:
         errors.append("Excel file must contain at least one product row")
     
     # Warn about large files that might be slow
-    if len(df) > 1000:
-        warnings.append(f"Large dataset detected ({len(df)} rows). Processing may take longer.")
+    if total_rows > 1000:
+        warnings.append(f"Large dataset detected ({total_rows} rows). Processing may take longer.")
     
     # Sanity check on day numbers
     if max_day > 365:
@@ -136,313 +192,1355 @@ def validate_excel_format(df: pd.DataFrame) -> Dict[str, Any]:
         'errors': errors,
         'warnings': warnings,
         'max_days': max_day,
-        'total_rows': len(df),
+        'total_rows': total_rows,
         'expected_columns': len(expected_day_columns) + len(required_columns),
-        'columns_found': len(df.columns) if not df.empty else 0
+        'columns_found': len(df.columns) if total_rows else 0,
+        'has_product_columns': len(missing_required) < len(required_columns)
+    }
+
+def resolve_column_map(df: pd.DataFrame) -> Dict[str, Any]:
+    """Work out which Excel columns hold which values, once per sheet"""
+    columns = set(df.columns)
+    max_days = detect_max_days(df)
+
+    days = []
+    for day in range(1, max_days + 1):
+        patterns = get_column_name_patterns(day)
+        days.append({
+            col_type: [name for name in possible_names if name in columns]
+            for col_type, possible_names in patterns.items()
+        })
+
+    return {
+        'product_id': [col for col in ID_COLUMNS if col in columns],
+        'name': [col for col in NAME_COLUMNS if col in columns],
+        'opening_inventory': [col for col in INVENTORY_COLUMNS if col in columns],
+        'max_days': max_days,
+        'days': days,
     }
 
-def parse_excel_data(df: pd.DataFrame) -> List[Dict[str, Any]]:
-    """Extract product data from Excel rows"""
+def coalesce_columns(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """Take the first non-empty value across alternative columns, row by row"""
+    if not columns:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+
+    values = df[columns[0]]
+    for col in columns[1:]:
+        values = values.where(values.notna(), df[col])
+    return values
+
+def clean_currency_series(values: pd.Series) -> np.ndarray:
+    """Vectorized clean_currency_value for a whole column"""
+    if values.dtype == object:
+        present = values.notna()
+        values = (
+            values[present].astype(str)
+            .str.replace('$', '', regex=False)
+            .str.replace(',', '', regex=False)
+            .str.strip()
+            .reindex(values.index)
+        )
+        values = pd.to_numeric(values, errors='coerce')
+    return values.fillna(0.0).to_numpy(dtype=np.float64)
+
+def quantity_series(values: pd.Series) -> np.ndarray:
+    """Vectorized int(float(value)) for a whole column, missing cells become 0"""
+    numbers = pd.to_numeric(values).fillna(0)
+    return np.trunc(numbers.to_numpy(dtype=np.float64)).astype(np.int64)
+
+def product_content_hash(name: str, opening_inventory: int, day_values: np.ndarray) -> str:
+    """Stable hash of everything stored for a product, so re-uploads can skip it when unchanged"""
+    digest = hashlib.sha256(json.dumps([name, opening_inventory]).encode())
+    digest.update(day_values.tobytes())
+    return digest.hexdigest()
+
+def parse_excel_data(df: pd.DataFrame, site: str = '') -> List[Dict[str, Any]]:
+    """Extract product data from Excel rows, tagged with the site (sheet) they came from"""
+    column_map = resolve_column_map(df)
+
+    # Basic product info, skipping rows without a product ID
+    product_ids = coalesce_columns(df, column_map['product_id'])
+    if product_ids.dtype.kind == 'f':
+        # A blank ID upcasts numeric IDs to float, keep 300 as '300' rather than '300.0'
+        whole = product_ids % 1 == 0
+        integers = product_ids.fillna(0).astype(np.int64).astype(object)
+        product_ids = product_ids.astype(object).mask(whole, integers)
+    product_ids = product_ids.where(product_ids.isna(), product_ids.astype(str))
+    keep = product_ids.notna() & (product_ids != '') & (product_ids != 'nan')
+    df = df.loc[keep]
+    if df.empty:
+        return []
+
+    product_ids = product_ids[keep].tolist()
+    names = coalesce_columns(df, column_map['name'])
+    names = names.where(names.isna(), names.astype(str)).fillna('').tolist()
+    opening_inventory = quantity_series(
+        coalesce_columns(df, column_map['opening_inventory'])
+    ).tolist()
+
+    # Day-by-day data as products x days matrices
+    n_days = column_map['max_days']
+    shape = (len(df), n_days)
+    proc_qty = np.zeros(shape, dtype=np.int64)
+    proc_price = np.zeros(shape, dtype=np.float64)
+    sales_qty = np.zeros(shape, dtype=np.int64)
+    sales_price = np.zeros(shape, dtype=np.float64)
+
+    for i, day_columns in enumerate(column_map['days']):
+        if day_columns['procurement_qty']:
+            proc_qty[:, i] = quantity_series(coalesce_columns(df, day_columns['procurement_qty']))
+        if day_columns['procurement_price']:
+            proc_price[:, i] = clean_currency_series(coalesce_columns(df, day_columns['procurement_price']))
+        if day_columns['sales_qty']:
+            sales_qty[:, i] = quantity_series(coalesce_columns(df, day_columns['sales_qty']))
+        if day_columns['sales_price']:
+            sales_price[:, i] = clean_currency_series(coalesce_columns(df, day_columns['sales_price']))
+
+    proc_amount = proc_qty * proc_price
+    sales_amount = sales_qty * sales_price
+    day_numbers = range(1, n_days + 1)
+
+    # Amounts are derived, so quantities and prices cover the day series
+    day_values = np.hstack([proc_qty, proc_price, sales_qty, sales_price]).astype('<f8')
+    content_hashes = [
+        product_content_hash(name, inventory, values)
+        for name, inventory, values in zip(names, opening_inventory, day_values)
+    ]
+
     products = []
+    rows = zip(
+        product_ids, names, opening_inventory, content_hashes,
+        proc_qty.tolist(), proc_price.tolist(), proc_amount.tolist(),
+        sales_qty.tolist(), sales_price.tolist(), sales_amount.tolist(),
+    )
+    for product_id, name, inventory, content_hash, proc_qtys, proc_prices, proc_amts, sale_qtys, sale_prices, sale_amts in rows:
+        products.append({
+            'product_id': product_id,
+            'site': site,
+            'name': name,
+            'opening_inventory': inventory,
+            'content_hash': content_hash,
+            'procurement_data': [
+                {'day': day, 'quantity': q, 'price': p, 'amount': a}
+                for day, q, p, a in zip(day_numbers, proc_qtys, proc_prices, proc_amts)
+            ],
+            'sales_data': [
+                {'day': day, 'quantity': q, 'price': p, 'amount': a}
+                for day, q, p, a in zip(day_numbers, sale_qtys, sale_prices, sale_amts)
+            ]
+        })
+
+    return products
+
+def read_excel_upload(
+    source: bytes | str,
+    sheet_name: str | int = 0,
+    site: str = '',
+) -> tuple[Dict[str, Any], List[Dict[str, Any]], UploadMetrics]:
+    """Decode, validate and parse one sheet of a workbook from bytes or a file path, timing each stage.
+
+    This is the CPU-heavy part of an upload, so it runs in the process pool.
+    """
+    upload_metrics = UploadMetrics()
+    with upload_metrics.stage('decode'):
+        df = pd.read_excel(io.BytesIO(source) if isinstance(source, bytes) else source, sheet_name=sheet_name)
+    upload_metrics.rows, upload_metrics.cells = len(df), df.size
+    with upload_metrics.stage('validate'):
+        validation_result = validate_excel_format(df)
+    with upload_metrics.stage('parse'):
+        products_data = parse_excel_data(df, site) if validation_result['is_valid'] else []
+    return validation_result, products_data, upload_metrics
+
+def workbook_sheet_names(source: bytes | str) -> List[str]:
+    try:
+        workbook = pd.ExcelFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except ValueError as e:
+        # pandas' error for bytes that are neither .xlsx nor .xls
+        raise pd.errors.ParserError(str(e)) from None
+    with workbook:
+        return [str(name) for name in workbook.sheet_names]
+
+def combine_sheet_validations(sheets: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """One validation result for a workbook from each sheet's, which are kept under 'sheets'.
+
+    Sheets without any product column (notes, lookup tables) are skipped
+    rather than failing the upload; every other sheet has to be valid.
+    `sheets` maps sheet names to validate_excel_format results with the
+    number of products parsed from the sheet added.
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    report: Dict[str, Dict[str, Any]] = {}
+    used: List[Dict[str, Any]] = []
+    for name, result in sheets.items():
+        if not result['has_product_columns']:
+            warnings.append(f"{name}: no product columns, sheet skipped")
+            report[name] = {'skipped': True}
+            continue
+        used.append(result)
+        errors.extend(f"{name}: {error}" for error in result['errors'])
+        warnings.extend(f"{name}: {warning}" for warning in result['warnings'])
+        report[name] = {
+            'is_valid': result['is_valid'],
+            'errors': result['errors'],
+            'warnings': result['warnings'],
+            'max_days': result['max_days'],
+            'total_rows': result['total_rows'],
+            'products': result['products'],
+        }
+    if not used:
+        errors.append("No sheet has the product columns (ID, Product Name, Opening Inventory)")
     
-    for _, row in df.iterrows():
-        # Get basic product info - try different column name formats
-        product_id = ''
-        product_name = ''
-        opening_inventory = 0
-        
-        # Look for ID in different formats
-        for id_col in ['ID', 'Product ID', 'ProductID', 'id', 'product_id']:
-            if id_col in row and not pd.isna(row[id_col]):
-                product_id = str(row[id_col])
-                break
-        
-        # Look for name in different formats
-        for name_col in ['Product Name', 'ProductName', 'Name', 'product_name', 'name']:
-            if name_col in row and not pd.isna(row[name_col]):
-                product_name = str(row[name_col])
-                break
-                
-        # Look for inventory in different formats
-        for inv_col in ['Opening Inventory', 'Opening Inventory on Day 1', 'opening_inventory', 'OpeningInventory']:
-            if inv_col in row and not pd.isna(row[inv_col]):
-                opening_inventory = int(float(row[inv_col]))
-                break
-        
-        # Skip rows without a product ID
-        if not product_id or product_id == 'nan':
+    return {
+        'is_valid': len(errors) == 0,
+        'errors': errors,
+        'warnings': warnings,
+        'max_days': max((result['max_days'] for result in used), default=0),
+        'total_rows': sum(result['total_rows'] for result in used),
+        'has_product_columns': bool(used),
+        'sheets': report,
+    }
+
+def read_workbook(
+    source: bytes | str,
+    progress: UploadProgress | None = None,
+) -> tuple[Dict[str, Any], List[Dict[str, Any]], UploadMetrics]:
+    """read_excel_upload for every sheet of a workbook, the sheets in parallel on the process pool.
+
+    A workbook with one sheet is read as before and its products have no
+    site. With several, each sheet is a site: its products are tagged with
+    the sheet name and the validation result carries each sheet's under
+    'sheets'. Stage times are summed over the workers. Blocks on the pool,
+    so call it from a thread.
+    """
+    baseline_rss = current_rss_bytes()
+    if progress is not None:
+        progress.advance('decode')
+    sheet_names = call_in_process(workbook_sheet_names, source)
+    if len(sheet_names) < 2:
+        result = call_in_process(read_excel_upload, source)
+        # The parsed products are held here from now on, and count towards the write
+        result[2].note_baseline(baseline_rss)
+        if progress is not None:
+            progress.advance('parse', rows=result[2].rows)
+        return result
+    
+    results = []
+    for result in map_in_process(read_excel_upload, [(source, name, name) for name in sheet_names]):
+        results.append(result)
+        if progress is not None:
+            progress.advance('parse', rows=results[-1][2].rows)
+    sheets: Dict[str, Dict[str, Any]] = {}
+    products_data: List[Dict[str, Any]] = []
+    for name, (validation_result, sheet_products, _) in zip(sheet_names, results):
+        sheets[name] = validation_result | {'products': len(sheet_products)}
+        products_data.extend(sheet_products)
+    
+    validation_result = combine_sheet_validations(sheets)
+    upload_metrics = UploadMetrics.combine([sheet_metrics for _, _, sheet_metrics in results])
+    upload_metrics.note_baseline(baseline_rss)
+    return validation_result, products_data if validation_result['is_valid'] else [], upload_metrics
+
+def recognised_columns(header: List[Any]) -> List[int]:
+    """Positions of the header cells naming a column the parser reads"""
+    known = set(ID_COLUMNS + NAME_COLUMNS + INVENTORY_COLUMNS)
+    for day in range(1, detect_max_days(pd.DataFrame(columns=header)) + 1):
+        for possible_names in get_column_name_patterns(day).values():
+            known.update(possible_names)
+    return [i for i, name in enumerate(header) if name in known]
+
+def convert_excel_cell(cell: Any) -> Any:
+    """A cell value as pd.read_excel's openpyxl reader converts it"""
+    if cell.value is None:
+        return ""
+    if cell.data_type == 'e':
+        return np.nan
+    if cell.data_type == 'n':
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+def read_excel_chunks(
+    path: str,
+    chunk_rows: int,
+    sheet_name: str | None = None,
+) -> tuple[List[Any], Generator[pd.DataFrame, None, None]]:
+    """Stream a sheet of an .xlsx file, the first by default, as DataFrames of up to chunk_rows rows.
+
+    Returns the full header row and the chunks, which only hold recognised
+    columns. Rows come from openpyxl's read-only iterator and go through the
+    same TextParser as pd.read_excel, so a chunk parses like the matching
+    rows of the whole sheet while memory stays flat. Blank rows are skipped.
+    """
+    from openpyxl import load_workbook
+    from pandas.io.parsers import TextParser
+
+    workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    sheet = workbook.worksheets[0] if sheet_name is None else workbook[sheet_name]
+    sheet.reset_dimensions()
+    rows = sheet.rows
+    header = [convert_excel_cell(cell) for cell in next(rows, ())]
+    while header and header[-1] == "":
+        header.pop()
+    columns = recognised_columns(header)
+    names = [header[i] for i in columns]
+
+    def frame(batch: List[List[Any]]) -> pd.DataFrame:
+        if not names:
+            return pd.DataFrame(index=pd.RangeIndex(len(batch)))
+        return TextParser([names, *batch], header=0).read()
+
+    def chunks() -> Generator[pd.DataFrame, None, None]:
+        try:
+            batch: List[List[Any]] = []
+            for row in rows:
+                if all(cell.value is None for cell in row):
+                    continue
+                batch.append([convert_excel_cell(row[i]) if i < len(row) else "" for i in columns])
+                if len(batch) == chunk_rows:
+                    yield frame(batch)
+                    batch = []
+            if batch:
+                yield frame(batch)
+        finally:
+            workbook.close()
+
+    return header, chunks()
+
+def arrow_chunks(batches: Iterable[pa.RecordBatch], chunk_rows: int) -> Generator[pd.DataFrame, None, None]:
+    for batch in batches:
+        for offset in range(0, batch.num_rows, chunk_rows):
+            yield batch.slice(offset, chunk_rows).to_pandas()
+
+def csv_column_types(header: List[str]) -> Dict[str, Any]:
+    """Arrow types for the columns of a CSV upload, so none have to be inferred.
+
+    Quantities and inventory are numbers. IDs and names stay text, so
+    '0000001' keeps its zeros, and so do prices, which may be written like
+    '$1,234.50' and are cleaned by the parser. Other columns are read as text.
+    """
+    numbers = set(INVENTORY_COLUMNS)
+    for day in range(1, detect_max_days(pd.DataFrame(columns=header)) + 1):
+        patterns = get_column_name_patterns(day)
+        numbers.update(patterns['procurement_qty'] + patterns['sales_qty'])
+    return {name: pa.float64() if name in numbers else pa.string() for name in header}
+
+def read_csv_chunks(path: str, chunk_rows: int) -> tuple[List[Any], Generator[pd.DataFrame, None, None]]:
+    """Read a CSV file with pyarrow's streaming reader, in chunks of chunk_rows rows.
+
+    The header is read first to give every column its type, so blocks are
+    converted as they're read rather than the whole file being held to
+    infer them.
+    """
+    from pyarrow import csv
+
+    with csv.open_csv(path) as header_reader:
+        header = header_reader.schema.names
+    reader = csv.open_csv(path, convert_options=csv.ConvertOptions(
+        column_types=csv_column_types(header), strings_can_be_null=True,
+    ))
+    return header, arrow_chunks(reader, chunk_rows)
+
+def read_parquet_chunks(path: str, chunk_rows: int) -> tuple[List[Any], Generator[pd.DataFrame, None, None]]:
+    from pyarrow import parquet
+
+    parquet_file = parquet.ParquetFile(path)
+    return parquet_file.schema_arrow.names, arrow_chunks(parquet_file.iter_batches(batch_size=chunk_rows), chunk_rows)
+
+def read_arrow_chunks(path: str, chunk_rows: int) -> tuple[List[Any], Generator[pd.DataFrame, None, None]]:
+    """Read Arrow IPC, in the file format (.arrow, .feather) or the stream format (.arrows)"""
+    source = pa.memory_map(path)
+    if path.endswith('.arrows'):
+        reader = pa.ipc.open_stream(source)
+        batches = iter(reader)
+    else:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    return reader.schema.names, arrow_chunks(batches, chunk_rows)
+
+CHUNK_READERS = {
+    '.xlsx': read_excel_chunks,
+    '.csv': read_csv_chunks,
+    '.parquet': read_parquet_chunks,
+    '.arrow': read_arrow_chunks,
+    '.feather': read_arrow_chunks,
+    '.arrows': read_arrow_chunks,
+}
+
+def read_upload_chunks(
+    path: str,
+    chunk_rows: int,
+    sheet_name: str | None = None,
+) -> tuple[List[Any], Generator[pd.DataFrame, None, None]]:
+    """The header row and row chunks of a spooled upload, read according to its extension"""
+    if sheet_name is not None:
+        return read_excel_chunks(path, chunk_rows, sheet_name)
+    return CHUNK_READERS[os.path.splitext(path)[1]](path, chunk_rows)
+
+def upload_sheet_names(path: str) -> List[str | None]:
+    """The sheets of a spooled .xlsx file; other formats have a single, unnamed one"""
+    if not path.endswith('.xlsx'):
+        return [None]
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(path, read_only=True, keep_links=False)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+def file_checksum(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+def find_identical_upload(db: Session, user_id: UUID, checksum: str) -> ExcelUpload | None:
+    """The user's latest upload, if it completed with this exact file and so left nothing to do"""
+    statement = (
+        select(ExcelUpload)
+        .where(ExcelUpload.user_id == user_id, ExcelUpload.status != "failed")
+        .order_by(ExcelUpload.upload_date.desc())
+        .limit(1)
+    )
+    latest = db.exec(statement).first()
+    if latest is not None and latest.status == "completed" and latest.checksum == checksum:
+        return latest
+    return None
+
+def identical_upload_response(upload_record: ExcelUpload) -> ExcelUploadResponse:
+    products = upload_record.products_processed or 0
+    return ExcelUploadResponse(
+        message="File is identical to the last upload, nothing to update",
+        upload_id=str(upload_record.id),
+        products_processed=products,
+        status="completed",
+        validation_info=upload_record.validation_info,
+        ingest_stats={"products_inserted": 0, "products_updated": 0, "products_unchanged": products}
+    )
+
+def queued_upload_response(upload_record: ExcelUpload) -> ExcelUploadResponse:
+    return ExcelUploadResponse(
+        message="Excel file queued for processing",
+        upload_id=str(upload_record.id),
+        products_processed=0,
+        status="processing"
+    )
+
+def create_upload_record(db: Session, user_id: UUID, filename: str, checksum: str | None = None) -> ExcelUpload:
+    upload_record = ExcelUpload(
+        user_id=user_id,
+        filename=filename,
+        checksum=checksum,
+        status="processing"
+    )
+    db.add(upload_record)
+    db.commit()
+    db.refresh(upload_record)
+    return upload_record
+
+def mark_upload_failed(db: Session, upload_record: ExcelUpload, errors: List[str] | None = None) -> None:
+    # Discard any half-written products before marking the upload failed
+    db.rollback()
+    if upload_record.status == "failed":
+        # Already recorded, by the process pool worker that streamed it
+        return
+    upload_record.status = "failed"
+    if errors is not None:
+        upload_record.errors = errors
+    upload_record.finished_at = datetime.now(UTC)
+    db.commit()
+    publish_done(upload_record.id, upload_job_response(upload_record).model_dump(mode="json"))
+
+def fail_stale_uploads() -> int:
+    """Mark failed the uploads left 'processing' for longer than UPLOAD_STALE_SECONDS.
+
+    Their worker died or was restarted mid-upload, so nothing will finish
+    them. Run at startup; uploads younger than the limit may still be
+    running in another worker. Returns how many were marked.
+    """
+    cutoff = datetime.now(UTC) - timedelta(seconds=settings.UPLOAD_STALE_SECONDS)
+    with Session(engine) as db:
+        result = db.exec(
+            update(ExcelUpload)
+            .where(ExcelUpload.status == "processing", ExcelUpload.upload_date < cutoff)
+            .values(
+                status="failed",
+                errors=["Upload was interrupted before it finished, please upload the file again."],
+                finished_at=datetime.now(UTC),
+            )
+        )
+        db.commit()
+        return result.rowcount
+
+def reject_invalid_upload(db: Session, upload_record: ExcelUpload, validation_result: Dict[str, Any]) -> None:
+    # A streamed workbook may have written earlier sheets already
+    db.rollback()
+    upload_record.status = "failed"
+    upload_record.errors = validation_result['errors']
+    upload_record.validation_info = {"warnings": validation_result['warnings']}
+    if 'sheets' in validation_result:
+        upload_record.validation_info['sheets'] = validation_result['sheets']
+    upload_record.finished_at = datetime.now(UTC)
+    db.commit()
+    publish_done(upload_record.id, upload_job_response(upload_record).model_dump(mode="json"))
+    error_details = {
+        "message": "Excel file format validation failed",
+        "errors": validation_result['errors'],
+        "warnings": validation_result['warnings']
+    }
+    if 'sheets' in validation_result:
+        error_details['sheets'] = validation_result['sheets']
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=error_details
+    )
+
+def reject_empty_upload(db: Session, upload_record: ExcelUpload) -> None:
+    # Discard anything a streamed sheet wrote before it turned out to be empty
+    db.rollback()
+    upload_record.status = "failed"
+    upload_record.errors = ["File contains no processable product data"]
+    upload_record.finished_at = datetime.now(UTC)
+    db.commit()
+    publish_done(upload_record.id, upload_job_response(upload_record).model_dump(mode="json"))
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail={
+            "message": "No valid product data found in Excel file",
+            "errors": ["File contains no processable product data"],
+            "warnings": []
+        }
+    )
+
+def complete_upload(
+    db: Session,
+    upload_record: ExcelUpload,
+    validation_result: Dict[str, Any],
+    products_processed: int,
+    ingest_stats: Dict[str, int],
+    upload_metrics: UploadMetrics,
+) -> ExcelUploadResponse:
+    """Mark an upload completed, committing it together with its products"""
+    validation_info = {
+        "max_days_detected": validation_result['max_days'],
+        "total_rows": validation_result['total_rows'],
+        "warnings": validation_result['warnings']
+    }
+    if 'sheets' in validation_result:
+        validation_info['sheets'] = validation_result['sheets']
+    metrics = upload_metrics.as_dict()
+    
+    upload_record.status = "completed"
+    upload_record.products_processed = products_processed
+    upload_record.validation_info = validation_info
+    upload_record.ingest_stats = ingest_stats
+    upload_record.stage_seconds = metrics['stage_seconds']
+    upload_record.rows_read = metrics['rows_read']
+    upload_record.cells_read = metrics['cells_read']
+    upload_record.peak_memory_bytes = metrics['peak_memory_bytes']
+    upload_record.finished_at = datetime.now(UTC)
+    db.commit()
+    publish_done(upload_record.id, upload_job_response(upload_record).model_dump(mode="json"))
+    
+    return ExcelUploadResponse(
+        message="Excel file processed successfully",
+        upload_id=str(upload_record.id),
+        products_processed=products_processed,
+        status="completed",
+        validation_info=validation_info,
+        ingest_stats=ingest_stats,
+        metrics=metrics
+    )
+
+def invalidate_owner_cache(db: Session, upload_record: ExcelUpload) -> None:
+    # Cached product lists and charts for this user are now stale, and so
+    # may the read replica be for a little while
+    username = db.get(User, upload_record.user_id).username
+    invalidate_user_cache(username)
+    note_user_write(username)
+
+def process_upload(
+    db: Session,
+    upload_record: ExcelUpload,
+    validation_result: Dict[str, Any],
+    products_data: List[Dict[str, Any]],
+    upload_metrics: UploadMetrics,
+    progress: UploadProgress | None = None,
+) -> ExcelUploadResponse:
+    """Store a parsed sheet, recording the outcome on its upload record"""
+    if not validation_result['is_valid']:
+        reject_invalid_upload(db, upload_record, validation_result)
+    if not products_data:
+        reject_empty_upload(db, upload_record)
+    
+    # Save products, procurement and sales rows with set-based upserts
+    progress = progress or UploadProgress(upload_record.id)
+    progress.advance('write')
+    with upload_metrics.stage('write'):
+        ingest_stats = ingest_products(db, upload_record.user_id, products_data)
+    progress.advance('write', products=len(products_data))
+    response = complete_upload(db, upload_record, validation_result, len(products_data), ingest_stats, upload_metrics)
+    invalidate_owner_cache(db, upload_record)
+    observe_upload(response.metrics)
+    return response
+
+def process_upload_stream(db: Session, upload_record: ExcelUpload, path: str) -> ExcelUploadResponse:
+    """Like process_upload for a spooled file, read, parsed and stored a chunk at a time.
+
+    A workbook with several sheets is read one sheet after another, each
+    sheet a site as in read_workbook. Every chunk is written in the same
+    transaction, so a failure part way leaves nothing behind. The caller
+    invalidates the user's cache.
+    """
+    upload_metrics = UploadMetrics()
+    progress = UploadProgress(upload_record.id)
+    progress.advance('decode')
+    with upload_metrics.stage('decode'):
+        sheet_names = upload_sheet_names(path)
+    multi_sheet = len(sheet_names) > 1
+    sheets: Dict[str, Dict[str, Any]] = {}
+    ingest_stats: Dict[str, int] = {}
+    products_processed = 0
+    
+    for sheet_name in sheet_names:
+        site = sheet_name if multi_sheet else ''
+        with upload_metrics.stage('decode'):
+            header, chunks = read_upload_chunks(path, settings.UPLOAD_CHUNK_ROWS, sheet_name)
+            chunk = next(chunks, None)
+        # Columns are checked on the full header, row counts once the first chunk is in
+        columns = pd.DataFrame(columns=header)
+        with upload_metrics.stage('validate'):
+            validation_result = validate_excel_format(columns, 0 if chunk is None else len(chunk))
+        if multi_sheet and not validation_result['has_product_columns']:
+            chunks.close()
+            sheets[site] = validation_result | {'products': 0}
             continue
-            
-        # Now get the day-by-day data
-        procurement_data = []
-        sales_data = []
+        if not validation_result['is_valid']:
+            chunks.close()
+            if multi_sheet:
+                sheets[site] = validation_result | {'products': 0}
+                validation_result = combine_sheet_validations(sheets)
+            reject_invalid_upload(db, upload_record, validation_result)
         
-        max_days = detect_max_days(df)
+        sheet_rows = sheet_products = 0
+        while chunk is not None:
+            sheet_rows += len(chunk)
+            upload_metrics.rows += len(chunk)
+            upload_metrics.cells += chunk.size
+            with upload_metrics.stage('parse'):
+                products_data = parse_excel_data(chunk, site)
+            progress.advance('parse', rows=len(chunk))
+            if products_data:
+                with upload_metrics.stage('write'):
+                    chunk_stats = ingest_products(db, upload_record.user_id, products_data)
+                for key, count in chunk_stats.items():
+                    ingest_stats[key] = ingest_stats.get(key, 0) + count
+                sheet_products += len(products_data)
+                progress.advance('write', products=len(products_data))
+            with upload_metrics.stage('decode'):
+                chunk = next(chunks, None)
         
-        # Go through each day and extract the data
-        for day in range(1, max_days + 1):
-            patterns = get_column_name_patterns(day)
-            
-            proc_qty = 0
-            proc_price = 0.0
-            sales_qty = 0
-            sales_price = 0.0
-            
-            # Try different column names for procurement quantity
-            for col in patterns['procurement_qty']:
-                if col in row and not pd.isna(row[col]):
-                    proc_qty = int(float(row[col]))
-                    break
-                    
-            # Same for procurement price
-            for col in patterns['procurement_price']:
-                if col in row and not pd.isna(row[col]):
-                    proc_price = clean_currency_value(row[col])
-                    break
-                    
-            # And sales quantity
-            for col in patterns['sales_qty']:
-                if col in row and not pd.isna(row[col]):
-                    sales_qty = int(float(row[col]))
-                    break
-                    
-            # And sales price
-            for col in patterns['sales_price']:
-                if col in row and not pd.isna(row[col]):
-                    sales_price = clean_currency_value(row[col])
-                    break
-            
-            procurement_data.append({
-                'day': day,
-                'quantity': proc_qty,
-                'price': proc_price,
-                'amount': proc_qty * proc_price
-            })
-            
-            sales_data.append({
-                'day': day,
-                'quantity': sales_qty,
-                'price': sales_price,
-                'amount': sales_qty * sales_price
-            })
-        
-        products.append({
-            'product_id': product_id,
-            'name': product_name,
-            'opening_inventory': opening_inventory,
-            'procurement_data': procurement_data,
-            'sales_data': sales_data
-        })
+        sheets[site] = validate_excel_format(columns, sheet_rows) | {'products': sheet_products}
+        products_processed += sheet_products
     
-    return products
+    if multi_sheet:
+        validation_result = combine_sheet_validations(sheets)
+        if not validation_result['is_valid']:
+            reject_invalid_upload(db, upload_record, validation_result)
+    if not products_processed:
+        reject_empty_upload(db, upload_record)
+    
+    if not multi_sheet:
+        validation_result = sheets['']
+    return complete_upload(db, upload_record, validation_result, products_processed, ingest_stats, upload_metrics)
 
-@router.post("/excel", response_model=ExcelUploadResponse)
-async def upload_excel(
-    db: DB,
-    current_user: CurrentUser,
-    file: UploadFile = File(...)
-):
+class UploadRejected(Exception):
+    """An HTTPException from a process pool worker, which can't pickle the original"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def run_streaming_upload(upload_id: UUID, path: str) -> ExcelUploadResponse:
+    """Stream a spooled workbook into the database, in a process pool worker with its own session"""
+    with Session(engine) as db:
+        upload_record = db.get(ExcelUpload, upload_id)
+        try:
+            return process_upload_stream(db, upload_record, path)
+        except HTTPException as e:
+            # Already recorded on the upload
+            raise UploadRejected(e.status_code, e.detail) from None
+        except unreadable_file_errors():
+            mark_upload_failed(db, upload_record, [invalid_file_message(path)])
+            raise UploadRejected(status.HTTP_400_BAD_REQUEST, invalid_file_message(path)) from None
+        except Exception as e:
+            mark_upload_failed(db, upload_record, [f"Error processing Excel file: {str(e)}"])
+            # Driver and openpyxl errors don't all pickle either
+            raise RuntimeError(str(e)) from None
+
+def should_stream(filename: str, size: int) -> bool:
+    """Columnar formats and large .xlsx files are streamed; openpyxl can't read .xls"""
+    if filename.endswith(COLUMNAR_EXTENSIONS):
+        return True
+    return filename.endswith('.xlsx') and size > settings.UPLOAD_STREAM_THRESHOLD_BYTES
+
+def run_upload_job(upload_id: UUID, path: str) -> None:
+    """Process a queued upload on a job worker, with its own database session"""
+    with Session(engine) as db:
+        upload_record = db.get(ExcelUpload, upload_id)
+        try:
+            if should_stream(path, os.path.getsize(path)):
+                response = call_in_process(run_streaming_upload, upload_id, path)
+                invalidate_owner_cache(db, upload_record)
+                observe_upload(response.metrics)
+            else:
+                progress = UploadProgress(upload_id)
+                validation_result, products_data, upload_metrics = read_workbook(path, progress)
+                process_upload(db, upload_record, validation_result, products_data, upload_metrics, progress)
+        except (HTTPException, UploadRejected):
+            # Validation failures are already recorded on the upload
+            pass
+        except unreadable_file_errors():
+            mark_upload_failed(db, upload_record, [invalid_file_message(path)])
+        except Exception as e:
+            mark_upload_failed(db, upload_record, [f"Error processing Excel file: {str(e)}"])
+        finally:
+            os.remove(path)
+
+def spool_upload(file: UploadFile, path: str) -> str:
+    """Copy the upload to disk, returning its checksum"""
+    checksum = hashlib.sha256()
+    with open(path, 'wb') as spool:
+        while chunk := file.file.read(1024 * 1024):
+            checksum.update(chunk)
+            spool.write(chunk)
+    return checksum.hexdigest()
+
+def remove_spool(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def spool_path(filename: str) -> str:
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, f"{uuid4()}{os.path.splitext(filename)[1]}")
+
+async def process_spooled_upload(db: Session, user: User, upload_record: ExcelUpload, path: str) -> ExcelUploadResponse:
+    """Parse and store an upload that is already on disk, then remove the file.
+
+    Streamed from the file a chunk at a time when should_stream says so,
+    otherwise decoded whole in the process pool, which reads the file itself.
+    """
+    try:
+        if should_stream(path, os.path.getsize(path)):
+            try:
+                result = await run_cpu_bound(run_streaming_upload, upload_record.id, path)
+            except UploadRejected as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail) from None
+            await run_in_threadpool(invalidate_user_cache, user.username)
+            await run_in_threadpool(note_user_write, user.username)
+            observe_upload(result.metrics)
+            return result
+        
+        progress = UploadProgress(upload_record.id)
+        validation_result, products_data, upload_metrics = await run_in_threadpool(read_workbook, path, progress)
+        return await run_in_threadpool(
+            process_upload, db, upload_record, validation_result, products_data, upload_metrics, progress
+        )
+    finally:
+        await run_in_threadpool(os.remove, path)
+
+async def stream_upload(db: Session, user: User, file: UploadFile) -> ExcelUploadResponse:
+    """Spool an upload to disk and stream it into the database from the process pool"""
+    path = spool_path(file.filename)
+    checksum = await run_in_threadpool(spool_upload, file, path)
+    try:
+        previous = await run_in_threadpool(find_identical_upload, db, user.id, checksum)
+        if previous is not None:
+            await run_in_threadpool(os.remove, path)
+            return identical_upload_response(previous)
+        upload_record = await run_in_threadpool(create_upload_record, db, user.id, file.filename, checksum)
+    except BaseException:
+        await run_in_threadpool(os.remove, path)
+        raise
+    return await process_spooled_upload(db, user, upload_record, path)
+
+def check_upload_file(filename: str | None, size: int | None) -> None:
+    """Reject file types we can't read and files over the size limit"""
     # Validate file type
-    if not file.filename or not file.filename.endswith(('.xlsx', '.xls')):
+    if not filename or not filename.endswith(EXCEL_EXTENSIONS + COLUMNAR_EXTENSIONS):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Please upload a valid Excel file (.xlsx or .xls)"
+            detail="Please upload an Excel, CSV, Parquet or Arrow file (.xlsx, .xls, .csv, .parquet, .arrow, .feather or .arrows)"
         )
     
-    # Check file size (limit to 10MB)
-    if file.size and file.size > 10 * 1024 * 1024:
+    # Check file size: .xls files are read into memory and capped lower than
+    # the formats that can be streamed from disk
+    max_bytes = settings.UPLOAD_STREAM_THRESHOLD_BYTES if filename.endswith('.xls') else settings.UPLOAD_MAX_BYTES
+    if size and size > max_bytes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File size must be less than 10MB"
+            detail=f"File size must be less than {max_bytes // (1024 * 1024)}MB"
         )
+
+@router.post("/excel", response_model=ExcelUploadResponse)
+async def upload_excel(
+    db: DB,
+    current_user: CurrentUser,
+    response: Response,
+    file: UploadFile = File(...),
+    background: bool = Query(False, description="Queue the file and return 202 instead of processing it in the request")
+):
+    check_upload_file(file.filename, file.size)
+    
+    # Blocking DB and disk work goes to the threadpool, decoding and parsing
+    # to the process pool, so the event loop stays free for other requests
+    # A byte-identical re-upload of the last file is answered without parsing it
+    if background:
+        # Store the file and hand it to the job pool, poll GET /upload/jobs/{id} for the result
+        path = spool_path(file.filename)
+        upload_record = None
+        try:
+            checksum = await run_in_threadpool(spool_upload, file, path)
+            previous = await run_in_threadpool(find_identical_upload, db, current_user.id, checksum)
+            if previous is not None:
+                await run_in_threadpool(os.remove, path)
+                return identical_upload_response(previous)
+            
+            upload_record = await run_in_threadpool(create_upload_record, db, current_user.id, file.filename, checksum)
+            # The job removes the file from here on
+            submit_job(run_upload_job, upload_record.id, path)
+        except BaseException:
+            await run_in_threadpool(remove_spool, path)
+            if upload_record is not None:
+                await run_in_threadpool(mark_upload_failed, db, upload_record, ["Upload could not be queued, please try again."])
+            raise
+        
+        response.status_code = status.HTTP_202_ACCEPTED
+        return queued_upload_response(upload_record)
     
     try:
+        if should_stream(file.filename, file.size or 0):
+            return await stream_upload(db, current_user, file)
+        
         # Read Excel file
         content = await file.read()
-        df = pd.read_excel(io.BytesIO(content))
-        
-        # Create upload record
-        upload_record = ExcelUpload(
-            user_id=current_user.id,
-            filename=file.filename,
-            status="processing"
-        )
-        db.add(upload_record)
-        db.commit()
-        db.refresh(upload_record)
-        
-        # Validate Excel format first
-        validation_result = validate_excel_format(df)
-        
-        if not validation_result['is_valid']:
-            upload_record.status = "failed"
-            db.commit()
-            error_details = {
-                "message": "Excel file format validation failed",
-                "errors": validation_result['errors'],
-                "warnings": validation_result['warnings']
-            }
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=error_details
-            )
-        
-        # Parse Excel data
-        products_data = parse_excel_data(df)
-        
-        if not products_data:
-            upload_record.status = "failed"
-            db.commit()
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={
-                    "message": "No valid product data found in Excel file",
-                    "errors": ["File contains no processable product data"],
-                    "warnings": []
-                }
-            )
-        
-        # Save products to database
-        products_processed = 0
-        
-        for product_data in products_data:
-            # Check if product already exists for this user
-            statement = select(Product).where(
-                Product.user_id == current_user.id,
-                Product.product_id == product_data['product_id']
-            )
-            existing_product = db.exec(statement).first()
-            
-            if existing_product:
-                # Update existing product
-                existing_product.name = product_data['name']
-                existing_product.opening_inventory = product_data['opening_inventory']
-                existing_product.updated_at = datetime.now(UTC)
-                
-                # Delete existing data
-                proc_to_delete = db.exec(select(ProcurementData).where(ProcurementData.product_id == existing_product.id)).all()
-                for proc in proc_to_delete:
-                    db.delete(proc)
-                
-                sales_to_delete = db.exec(select(SalesData).where(SalesData.product_id == existing_product.id)).all()
-                for sale in sales_to_delete:
-                    db.delete(sale)
-                
-                db_product = existing_product
-            else:
-                # Create new product
-                db_product = Product(
-                    user_id=current_user.id,
-                    product_id=product_data['product_id'],
-                    name=product_data['name'],
-                    opening_inventory=product_data['opening_inventory']
-                )
-                db.add(db_product)
-            
-            db.commit()
-            db.refresh(db_product)
-            
-            # Add procurement data
-            for proc_data in product_data['procurement_data']:
-                if proc_data['quantity'] > 0 or proc_data['price'] > 0:
-                    procurement = ProcurementData(
-                        product_id=db_product.id,
-                        day=proc_data['day'],
-                        quantity=proc_data['quantity'],
-                        price=proc_data['price'],
-                        amount=proc_data['amount']
-                    )
-                    db.add(procurement)
-            
-            # Add sales data
-            for sales_data in product_data['sales_data']:
-                if sales_data['quantity'] > 0 or sales_data['price'] > 0:
-                    sales = SalesData(
-                        product_id=db_product.id,
-                        day=sales_data['day'],
-                        quantity=sales_data['quantity'],
-                        price=sales_data['price'],
-                        amount=sales_data['amount']
-                    )
-                    db.add(sales)
-            
-            products_processed += 1
+        checksum = await run_in_threadpool(file_checksum, content)
+        previous = await run_in_threadpool(find_identical_upload, db, current_user.id, checksum)
+        if previous is not None:
+            return identical_upload_response(previous)
         
-        db.commit()
+        validation_result, products_data, upload_metrics = await run_in_threadpool(read_workbook, content)
         
-        # Update upload status
-        upload_record.status = "completed"
-        db.commit()
+        # Create upload record
+        upload_record = await run_in_threadpool(create_upload_record, db, current_user.id, file.filename, checksum)
         
-        return ExcelUploadResponse(
-            message="Excel file processed successfully",
-            upload_id=str(upload_record.id),
-            products_processed=products_processed,
-            status="completed",
-            validation_info={
-                "max_days_detected": validation_result['max_days'],
-                "total_rows": validation_result['total_rows'],
-                "warnings": validation_result['warnings']
-            }
-        )
+        return await run_in_threadpool(process_upload, db, upload_record, validation_result, products_data, upload_metrics)
         
-    except pd.errors.ParserError:
+    except HTTPException:
+        # Validation failures are already recorded on the upload
+        raise
+    except unreadable_file_errors():
         if 'upload_record' in locals():
-            upload_record.status = "failed"
-            db.commit()
+            await run_in_threadpool(mark_upload_failed, db, upload_record, [invalid_file_message(file.filename)])
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid Excel file format. Please check your file and try again."
+            detail=invalid_file_message(file.filename)
         )
     except Exception as e:
         if 'upload_record' in locals():
-            upload_record.status = "failed"
-            db.commit()
+            await run_in_threadpool(mark_upload_failed, db, upload_record)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing Excel file: {str(e)}"
         )
 
-@router.get("/products", response_model=ProductListResponse)
-async def get_user_products(
-    db: DB,
+def get_upload(db: Session, upload_id: UUID) -> ExcelUpload | None:
+    return db.get(ExcelUpload, upload_id)
+
+def upload_metrics_of(upload_record: ExcelUpload) -> Dict[str, Any] | None:
+    if upload_record.stage_seconds is None:
+        return None
+    return {
+        'stage_seconds': upload_record.stage_seconds,
+        'rows_read': upload_record.rows_read,
+        'cells_read': upload_record.cells_read,
+        'peak_memory_bytes': upload_record.peak_memory_bytes,
+    }
+
+@router.get("/jobs/{upload_id}", response_model=UploadJobResponse)
+async def get_upload_job(
+    upload_id: UUID,
+    db: DBRunner,
     current_user: CurrentUser
 ):
-    """Get all products for the current user"""
-    statement = select(Product).where(Product.user_id == current_user.id)
-    products = db.exec(statement).all()
+    """Get the status and results of an upload"""
+    upload_record = await db.run(get_upload, upload_id)
+    if upload_record is None or upload_record.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    return upload_job_response(upload_record)
+
+def upload_job_response(upload_record: ExcelUpload) -> UploadJobResponse:
+    return UploadJobResponse(
+        upload_id=str(upload_record.id),
+        filename=upload_record.filename,
+        status=upload_record.status,
+        upload_date=upload_record.upload_date,
+        finished_at=upload_record.finished_at,
+        products_processed=upload_record.products_processed,
+        validation_info=upload_record.validation_info,
+        ingest_stats=upload_record.ingest_stats,
+        metrics=upload_metrics_of(upload_record),
+        errors=upload_record.errors or []
+    )
+
+def server_sent_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+# Reads of upload records in flight, shared by the event streams asking at the same time
+_upload_loads: Dict[UUID, asyncio.Future] = {}
+
+async def read_upload(upload_id: UUID) -> ExcelUpload | None:
+    # A session per read, so an open stream doesn't hold a connection
+    async with session_runner() as db:
+        return await db.run(get_upload, upload_id)
+
+async def load_upload(upload_id: UUID) -> ExcelUpload | None:
+    """An upload record, read once for however many event streams want it at the same time"""
+    load = _upload_loads.get(upload_id)
+    if load is None:
+        load = asyncio.ensure_future(read_upload(upload_id))
+        _upload_loads[upload_id] = load
+        load.add_done_callback(lambda _: _upload_loads.pop(upload_id, None))
+    # A listener going away mustn't cancel the read for the others
+    return await asyncio.shield(load)
+
+async def upload_events(upload_record: ExcelUpload) -> AsyncIterator[str]:
+    """The progress events of an upload until it finishes, then its outcome"""
+    keepalive = settings.UPLOAD_PROGRESS_KEEPALIVE_SECONDS
+    if upload_record.status != "processing":
+        yield server_sent_event("done", upload_job_response(upload_record).model_dump_json())
+        return
     
-    product_responses = []
+    # The broker replays the outcome if the upload finished since the record was read
+    with progress_broker.subscribe(str(upload_record.id)) as events:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), keepalive)
+            except TimeoutError:
+                # Silence may also mean another worker has the upload, whose events we don't see
+                yield ": keepalive\n\n"
+                upload_record = await load_upload(upload_record.id)
+                if upload_record.status != "processing":
+                    yield server_sent_event("done", upload_job_response(upload_record).model_dump_json())
+                    return
+                continue
+            if event['stage'] == DONE:
+                yield server_sent_event("done", json.dumps(event['job']))
+                return
+            yield server_sent_event("progress", json.dumps(event))
+
+@router.get("/jobs/{upload_id}/events", response_class=StreamingResponse)
+async def stream_upload_job_events(
+    upload_id: UUID,
+    username: TokenSubject,
+):
+    """Server-Sent Events with the progress of an upload.
+    
+    `progress` events carry the stage, rows parsed and products written, at
+    most every UPLOAD_PROGRESS_INTERVAL_SECONDS. A final `done` event
+    carries the same document as GET /upload/jobs/{upload_id} and ends the
+    stream. Events are only seen on the worker processing the upload; on
+    other workers the stream just ends with the outcome.
+    """
+    async with session_runner() as db:
+        current_user = await get_current_user(db, username)
+    upload_record = await load_upload(upload_id)
+    if upload_record is None or upload_record.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    
+    return StreamingResponse(
+        upload_events(upload_record),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Products are read and serialized this many at a time, which bounds memory per request
+PRODUCT_BATCH_SIZE = 500
+
+def get_day_rows(
+    db: Session,
+    model: type[ProcurementData] | type[SalesData],
+    user_id: UUID,
+    product_ids: List[UUID],
+) -> Dict[UUID, List[Dict[str, Any]]]:
+    """Fetch the day rows for a batch of products in one query, grouped by product"""
+    # user_id keeps the scan to the owner's partition
+    statement = select(
+        model.product_id, model.day, model.quantity, model.price, model.amount
+    ).where(
+        model.user_id == user_id, model.product_id.in_(product_ids)
+    ).order_by(model.product_id, model.day)
+    
+    rows: Dict[UUID, List[Dict[str, Any]]] = {}
+    for product_id, day, quantity, price, amount in db.exec(statement):
+        rows.setdefault(product_id, []).append({
+            'day': day,
+            'quantity': quantity,
+            'price': price,
+            'amount': amount
+        })
+    return rows
+
+def product_cursor(product_id: str, site: str) -> str:
+    """The paging cursor of a product: its ID, followed by a tab and its site when it has one"""
+    return f'{product_id}\t{site}' if site else product_id
+
+def after_cursor(cursor: str) -> ColumnElement[bool]:
+    """The keyset condition for the products after `cursor`, in (product_id, site) order"""
+    product_id, _, site = cursor.partition('\t')
+    return tuple_(Product.product_id, Product.site) > (product_id, site)
+
+def render_product_batch(
+    db: Session,
+    user_id: UUID,
+    after: str | None,
+    batch_size: int,
+) -> tuple[List[str], str | None]:
+    """Serialize the next batch of products after the `after` cursor.
+
+    Products are paged by keyset on (user_id, product_id, site), and a batch
+    costs three queries no matter how many day rows it has. Returns the JSON
+    documents and the cursor of the batch's last product.
+    """
+    statement = select(Product).where(Product.user_id == user_id)
+    if after is not None:
+        statement = statement.where(after_cursor(after))
+    products = db.exec(statement.order_by(Product.product_id, Product.site).limit(batch_size)).all()
+    if not products:
+        return [], None
+    
+    product_ids = [product.id for product in products]
+    procurement_data = get_day_rows(db, ProcurementData, user_id, product_ids)
+    sales_data = get_day_rows(db, SalesData, user_id, product_ids)
+    
+    documents = [json.dumps({
+        'id': str(product.id),
+        'product_id': product.product_id,
+        'site': product.site,
+        'name': product.name,
+        'opening_inventory': product.opening_inventory,
+        'procurement_data': procurement_data.get(product.id, []),
+        'sales_data': sales_data.get(product.id, [])
+    }) for product in products]
     
-    for product in products:
-        # Get procurement data
-        proc_statement = select(ProcurementData).where(ProcurementData.product_id == product.id)
-        procurement_data = db.exec(proc_statement).all()
+    # Don't keep the ORM objects of earlier batches alive
+    db.expunge_all()
+    return documents, product_cursor(products[-1].product_id, products[-1].site)
+
+def has_products_after(db: Session, user_id: UUID, after: str) -> bool:
+    statement = select(Product.id).where(
+        Product.user_id == user_id,
+        after_cursor(after)
+    ).limit(1)
+    return db.exec(statement).first() is not None
+
+async def stream_products_json(
+    user_id: UUID, username: str, limit: int | None, cursor: str | None,
+) -> AsyncIterator[str]:
+    """Stream a ProductListResponse as JSON, one batch of products at a time.
+
+    The session is opened here because it has to outlive the request's own
+    dependencies.
+    """
+    async with read_session_runner(username) as db:
+        yield '{"products":['
+        total = 0
+        last_cursor = cursor
+        
+        while limit is None or total < limit:
+            batch_size = PRODUCT_BATCH_SIZE if limit is None else min(PRODUCT_BATCH_SIZE, limit - total)
+            documents, batch_last = await db.run(render_product_batch, user_id, last_cursor, batch_size)
+            if not documents:
+                break
+            
+            yield (',' if total else '') + ','.join(documents)
+            total += len(documents)
+            last_cursor = batch_last
+            if len(documents) < batch_size:
+                break
         
-        # Get sales data
-        sales_statement = select(SalesData).where(SalesData.product_id == product.id)
-        sales_data = db.exec(sales_statement).all()
+        # Only hand out a cursor if there really is a next page
+        next_cursor = None
+        if limit is not None and total == limit and last_cursor is not None:
+            if await db.run(has_products_after, user_id, last_cursor):
+                next_cursor = last_cursor
         
-        product_responses.append(ProductDataResponse(
-            id=str(product.id),
-            product_id=product.product_id,
-            name=product.name,
-            opening_inventory=product.opening_inventory,
-            procurement_data=[{
-                'day': p.day,
-                'quantity': p.quantity,
-                'price': p.price,
-                'amount': p.amount
-            } for p in procurement_data],
-            sales_data=[{
-                'day': s.day,
-                'quantity': s.quantity,
-                'price': s.price,
-                'amount': s.amount
-            } for s in sales_data]
-        ))
-    
-    return ProductListResponse(
-        products=product_responses,
-        total=len(product_responses)
-    )
\ No newline at end of file
+        yield f'],"total":{total},"next_cursor":{json.dumps(next_cursor)}}}'
+
+def get_day_columns(
+    db: Session,
+    model: type[ProcurementData] | type[SalesData],
+    user_id: UUID,
+    positions: Dict[UUID, int],
+) -> Dict[str, np.ndarray]:
+    """Fetch the day rows for a batch of products as arrays, indexed by the products' positions"""
+    statement = select(
+        model.product_id, model.day, model.quantity, model.price, model.amount
+    ).where(
+        model.user_id == user_id, model.product_id.in_(list(positions))
+    ).order_by(model.product_id, model.day)
+    rows = db.exec(statement).all()
+    if not rows:
+        return empty_day_columns()
+    
+    product_ids, days, quantities, prices, amounts = zip(*rows)
+    product = np.fromiter((positions[product_id] for product_id in product_ids), np.int64, len(rows))
+    # Rows come grouped by product UUID; a stable sort puts them in page order, days still ascending
+    order = np.argsort(product, kind='stable')
+    return {
+        'product': product[order],
+        'day': np.array(days, np.int64)[order],
+        'quantity': np.array(quantities, np.int64)[order],
+        'price': np.array(prices, np.float64)[order],
+        'amount': np.array(amounts, np.float64)[order],
+    }
+
+def render_product_columns(
+    db: Session,
+    user_id: UUID,
+    after: str | None,
+    batch_size: int,
+    offset: int,
+) -> ProductColumns | None:
+    """The next batch of products after `after` as columns, the way render_product_batch pages.
+
+    `offset` is the number of products in earlier batches, so day rows
+    index the page rather than the batch.
+    """
+    statement = select(
+        Product.id, Product.product_id, Product.site, Product.name, Product.opening_inventory
+    ).where(Product.user_id == user_id)
+    if after is not None:
+        statement = statement.where(after_cursor(after))
+    rows = db.exec(statement.order_by(Product.product_id, Product.site).limit(batch_size)).all()
+    if not rows:
+        return None
+    
+    positions = {row.id: offset + position for position, row in enumerate(rows)}
+    products = {
+        'id': [str(row.id) for row in rows],
+        'product_id': [row.product_id for row in rows],
+        'site': [row.site for row in rows],
+        'name': [row.name for row in rows],
+        'opening_inventory': [row.opening_inventory for row in rows],
+    }
+    return ProductColumns(
+        products,
+        get_day_columns(db, ProcurementData, user_id, positions),
+        get_day_columns(db, SalesData, user_id, positions),
+        next_cursor=None,
+    )
+
+async def encode_product_columns(
+    user_id: UUID, username: str, limit: int | None, cursor: str | None, media_type: str,
+) -> bytes:
+    """A page of products in a columnar media type.
+
+    Unlike JSON these formats aren't streamed: the page is collected batch
+    by batch, then encoded once. Columns are far smaller than the per-day
+    dicts, but large tenants should still page with `limit`.
+    """
+    async with read_session_runner(username) as db:
+        batches: List[ProductColumns] = []
+        total = 0
+        last_cursor = cursor
+        
+        while limit is None or total < limit:
+            batch_size = PRODUCT_BATCH_SIZE if limit is None else min(PRODUCT_BATCH_SIZE, limit - total)
+            batch = await db.run(render_product_columns, user_id, last_cursor, batch_size, total)
+            if batch is None:
+                break
+            
+            batches.append(batch)
+            total += batch.total
+            last_cursor = product_cursor(batch.products['product_id'][-1], batch.products['site'][-1])
+            if batch.total < batch_size:
+                break
+        
+        next_cursor = None
+        if limit is not None and total == limit and last_cursor is not None:
+            if await db.run(has_products_after, user_id, last_cursor):
+                next_cursor = last_cursor
+    
+    page = ProductColumns.concat(batches, next_cursor)
+    return await run_in_threadpool(page.encode, media_type)
+
+@router.get(
+    "/products",
+    response_model=ProductListResponse,
+    responses={200: {"content": {COLUMNAR_JSON: {}, MSGPACK: {}, ARROW: {}}}},
+)
+async def get_user_products(
+    request: Request,
+    db: ReadDBRunner,
+    username: TokenSubject,
+    limit: int | None = Query(None, ge=1, le=10000, description="Page size, all products when omitted"),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    format: Literal['json', 'columnar', 'msgpack', 'arrow'] | None = Query(
+        None, description="Overrides the Accept header"
+    ),
+):
+    """Get the current user's products, ordered by product ID and site.
+    
+    JSON by default. Columnar JSON, MessagePack and Arrow IPC (by Accept or
+    `format`) carry the same data as one array per field.
+    """
+    media_type = negotiate_format(request.headers.get('accept'), format)
+    
+    async def build() -> bytes | AsyncIterator[str]:
+        current_user = await get_current_user(db, username)
+        if media_type == JSON:
+            return stream_products_json(current_user.id, username, limit, cursor)
+        return await encode_product_columns(current_user.id, username, limit, cursor, media_type)
+    
+    return await cached_response(request, username, build, media_type)
+
+# The wide layout's columns for each day, in upload order, and their types
+EXPORT_DAY_FIELDS = (
+    ('procurement_qty', 'int64'),
+    ('procurement_price', 'float64'),
+    ('sales_qty', 'int64'),
+    ('sales_price', 'float64'),
+)
+
+def site_products(user_id: UUID, site: str | None) -> Select:
+    statement = select(Product.id).where(Product.user_id == user_id)
+    return statement if site is None else statement.where(Product.site == site)
+
+def get_export_layout(db: Session, user_id: UUID, site: str | None) -> tuple[List[str], int]:
+    """The sites to export and the last day with data, which sets the number of day columns"""
+    sites = [site] if site is not None else db.exec(
+        select(Product.site).where(Product.user_id == user_id).distinct().order_by(Product.site)
+    ).all()
+    max_days = 0
+    for model in (ProcurementData, SalesData):
+        # The (user_id, day) index answers this without reading the rows
+        statement = select(func.max(model.day)).where(model.user_id == user_id)
+        if site is not None:
+            statement = statement.where(model.product_id.in_(site_products(user_id, site)))
+        max_days = max(max_days, db.exec(statement).one() or 0)
+    return sites, max_days
+
+def export_header(max_days: int, with_site: bool) -> tuple[List[str], List[str]]:
+    """Column names and types of the wide layout, in the form uploads are read from"""
+    header = [ID_COLUMNS[0], NAME_COLUMNS[0], INVENTORY_COLUMNS[0]]
+    types = ['string', 'string', 'int64']
+    for day in range(1, max_days + 1):
+        patterns = get_column_name_patterns(day)
+        for field, kind in EXPORT_DAY_FIELDS:
+            header.append(patterns[field][0])
+            types.append(kind)
+    if with_site:
+        header.append('Site')
+        types.append('string')
+    return header, types
+
+def export_rows(
+    db: Session, user_id: UUID, site: str | None, max_days: int,
+) -> Generator[tuple[str, List[Any]], None, None]:
+    """Each product's site and wide row, ordered by product ID and site.
+
+    Products are read off a server-side cursor, and each batch's day rows
+    are fetched by primary key and pivoted into its rows, so no more than
+    one batch is held however many products there are. Both reads follow
+    an index, so the plans don't depend on up to date statistics, e.g.
+    right after a large upload.
+    """
+    statement = select(
+        Product.id, Product.site, Product.product_id, Product.name, Product.opening_inventory
+    ).where(Product.user_id == user_id)
+    if site is not None:
+        statement = statement.where(Product.site == site)
+    statement = statement.order_by(Product.product_id, Product.site).execution_options(yield_per=PRODUCT_BATCH_SIZE)
+    
+    for batch in db.exec(statement).partitions():
+        rows = {
+            product.id: [product.product_id, product.name, product.opening_inventory] + [None] * (4 * max_days)
+            for product in batch
+        }
+        # Procurement fills the first two of a day's four columns, sales the last two
+        for offset, model in ((0, ProcurementData), (2, SalesData)):
+            day_rows = select(model.product_id, model.day, model.quantity, model.price).where(
+                model.user_id == user_id, model.product_id.in_(list(rows))
+            )
+            for product_id, day, quantity, price in db.exec(day_rows):
+                if 1 <= day <= max_days:
+                    start = 3 + 4 * (day - 1) + offset
+                    rows[product_id][start:start + 2] = [quantity, price]
+        for product in batch:
+            yield product.site, rows[product.id]
+
+def export_products(username: str, user_id: UUID, export_format: str, site: str | None) -> Generator[bytes, None, None]:
+    """The encoded export, a chunk at a time, for a StreamingResponse to send from the threadpool.
+
+    Uses a sync session of its own, on the read replica when the user's
+    reads would go there, for the server-side cursor of export_rows.
+    """
+    db = Session(read_sync_engine(username))
+    try:
+        try:
+            sites, max_days = get_export_layout(db, user_id, site)
+        except REPLICA_ERRORS:
+            if db.get_bind() is engine:
+                raise
+            # Nothing is sent yet, so the primary can take over
+            mark_replica_down()
+            db.close()
+            db = Session(engine)
+            sites, max_days = get_export_layout(db, user_id, site)
+        
+        # XLSX has a sheet per site; the flat formats need a column for it
+        with_site = export_format != 'xlsx' and site is None and any(sites)
+        header, types = export_header(max_days, with_site)
+        rows = export_rows(db, user_id, site, max_days)
+        if export_format == 'xlsx':
+            yield from xlsx_export(header, sites, rows)
+        else:
+            wide = ((row + [row_site] if with_site else row) for row_site, row in rows)
+            if export_format == 'parquet':
+                yield from parquet_export(header, types, wide)
+            else:
+                yield from csv_export(header, wide)
+    finally:
+        db.close()
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}},
+)
+async def export_user_products(
+    db: ReadDBRunner,
+    username: TokenSubject,
+    format: Literal['csv', 'xlsx', 'parquet'] = Query('csv'),
+    site: str | None = Query(None, description="Only this site's products (the sheet they were uploaded on)"),
+):
+    """Download the current user's products in the wide layout they are uploaded in.
+
+    One row per product with four columns per day. XLSX has a sheet per
+    site; CSV and Parquet add a Site column when products have one.
+    The file is streamed as it is written, so memory doesn't grow with it.
+    """
+    current_user = await get_current_user(db, username)
+    filename = f"products-{re.sub(r'[^A-Za-z0-9_.-]', '_', site)}.{format}" if site else f"products.{format}"
+    return StreamingResponse(
+        export_products(username, current_user.id, format, site),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+from datetime import datetime, timedelta, UTC
+from typing import BinaryIO
+from uuid import UUID
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import delete, select, Session, update
+
+from app.core.config import get_settings
+from app.core.jobs import submit_job
+from app.db import ExcelUpload, UploadSession
+from app.dependencies.auth import CurrentUser
+from app.dependencies.db import DB
+from app.models.upload import ExcelUploadResponse, UploadSessionCreate, UploadSessionResponse
+from app.routers.upload import (
+    check_upload_file,
+    find_identical_upload,
+    identical_upload_response,
+    invalid_file_message,
+    mark_upload_failed,
+    process_spooled_upload,
+    queued_upload_response,
+    remove_spool,
+    run_upload_job,
+    unreadable_file_errors,
+)
+
+settings = get_settings()
+
+# Resumable uploads for large files and flaky links: POST /upload/sessions,
+# PUT each chunk at its offset, then POST .../complete. Chunks go straight
+# to a spool file, so a dropped connection loses at most the chunk in
+# flight; GET the session to find where to resume. The spool directory has
+# to be shared by every worker that can receive a session's requests.
+router = APIRouter(prefix="/upload/sessions", tags=["Upload"])
+
+# Request bodies are written to disk in blocks of this size
+WRITE_BLOCK_BYTES = 1024 * 1024
+
+def session_spool_path(upload_session: UploadSession) -> str:
+    # Keeps the extension, which decides how the file is read
+    extension = os.path.splitext(upload_session.filename)[1]
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, f"session-{upload_session.id}{extension}")
+
+def session_response(upload_session: UploadSession) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        upload_session_id=str(upload_session.id),
+        filename=upload_session.filename,
+        size=upload_session.size,
+        offset=upload_session.received_bytes,
+        chunk_max_bytes=settings.UPLOAD_CHUNK_MAX_BYTES,
+        expires_at=upload_session.updated_at + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS),
+        upload_id=str(upload_session.upload_id) if upload_session.upload_id else None,
+    )
+
+def purge_expired_sessions(db: Session) -> None:
+    """Drop sessions idle for longer than UPLOAD_SESSION_TTL_SECONDS, and their spooled bytes"""
+    cutoff = datetime.now(UTC) - timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+    expired = db.exec(select(UploadSession).where(UploadSession.updated_at < cutoff)).all()
+    for upload_session in expired:
+        remove_spool(session_spool_path(upload_session))
+    if expired:
+        db.exec(delete(UploadSession).where(UploadSession.id.in_([upload_session.id for upload_session in expired])))
+        db.commit()
+
+def create_session(db: Session, user_id: UUID, request: UploadSessionCreate) -> UploadSession:
+    purge_expired_sessions(db)
+    upload_session = UploadSession(
+        user_id=user_id,
+        filename=request.filename,
+        size=request.size,
+        sha256=request.sha256.lower() if request.sha256 else None,
+    )
+    db.add(upload_session)
+    db.commit()
+    db.refresh(upload_session)
+    # Created empty, so every chunk, the first included, is an overwrite at its offset
+    open(session_spool_path(upload_session), 'xb').close()
+    return upload_session
+
+def get_session(db: Session, user_id: UUID, session_id: UUID) -> UploadSession:
+    upload_session = db.get(UploadSession, session_id)
+    if upload_session is None or upload_session.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    return upload_session
+
+def offset_conflict(upload_session: UploadSession, message: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={"message": message, "offset": upload_session.received_bytes}
+    )
+
+def open_spool_for_chunk(path: str, offset: int) -> BinaryIO:
+    """Open a session's spool file locked, positioned at offset, with anything past it dropped.
+
+    Bytes past the offset are what an interrupted chunk left behind. The
+    lock keeps two requests from writing the same session at once; hold it
+    until record_chunk has committed the chunk.
+    """
+    spool = open(path, 'r+b')
+    try:
+        fcntl.flock(spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        spool.close()
+        raise
+    spool.truncate(offset)
+    spool.seek(offset)
+    return spool
+
+def record_chunk(db: Session, upload_session: UploadSession, offset: int, received_bytes: int) -> bool:
+    """Move the session's offset on, unless another request already did"""
+    result = db.exec(
+        update(UploadSession)
+        .where(UploadSession.id == upload_session.id, UploadSession.received_bytes == offset)
+        .values(received_bytes=received_bytes, updated_at=datetime.now(UTC))
+    )
+    db.commit()
+    db.refresh(upload_session)
+    return result.rowcount == 1
+
+def file_sha256(path: str) -> str:
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as spool:
+        while block := spool.read(WRITE_BLOCK_BYTES):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+def claim_session(db: Session, upload_session: UploadSession, upload_record: ExcelUpload) -> bool:
+    """Attach the upload to the session, unless a concurrent complete already attached one.
+
+    A new upload record is inserted in the same transaction, so the request
+    that loses the race leaves nothing behind.
+    """
+    db.add(upload_record)
+    db.flush()
+    result = db.exec(
+        update(UploadSession)
+        .where(UploadSession.id == upload_session.id, UploadSession.upload_id.is_(None))
+        .values(upload_id=upload_record.id, updated_at=datetime.now(UTC))
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        db.refresh(upload_session)
+        return False
+    db.commit()
+    db.refresh(upload_record)
+    db.refresh(upload_session)
+    return True
+
+def completed_session_response(db: Session, upload_session: UploadSession) -> ExcelUploadResponse:
+    upload_record = db.get(ExcelUpload, upload_session.upload_id)
+    return ExcelUploadResponse(
+        message="Upload session was already completed",
+        upload_id=str(upload_record.id),
+        products_processed=upload_record.products_processed or 0,
+        status=upload_record.status,
+        validation_info=upload_record.validation_info,
+        ingest_stats=upload_record.ingest_stats,
+    )
+
+def delete_session(db: Session, upload_session: UploadSession) -> None:
+    # A statement rather than db.delete, so a concurrent delete isn't an error
+    db.exec(delete(UploadSession).where(UploadSession.id == upload_session.id))
+    db.commit()
+
+@router.post("", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    request: UploadSessionCreate,
+    db: DB,
+    current_user: CurrentUser
+):
+    """Start a chunked upload of `size` bytes"""
+    check_upload_file(request.filename, request.size)
+    upload_session = await run_in_threadpool(create_session, db, current_user.id, request)
+    return session_response(upload_session)
+
+@router.get("/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: UUID,
+    db: DB,
+    current_user: CurrentUser
+):
+    """Where a chunked upload stands: the next chunk goes at `offset`"""
+    upload_session = await run_in_threadpool(get_session, db, current_user.id, session_id)
+    return session_response(upload_session)
+
+@router.put("/{session_id}", response_model=UploadSessionResponse)
+async def put_upload_chunk(
+    session_id: UUID,
+    request: Request,
+    db: DB,
+    current_user: CurrentUser,
+    offset: int = Query(..., ge=0, description="Where the chunk starts, the session's current offset"),
+    chunk_sha256: str | None = Header(None, alias="X-Chunk-SHA256", description="Hex SHA-256 of the chunk"),
+):
+    """Append the request body to the upload at `offset`.
+
+    A chunk is either stored whole or not at all: one that is cut off, or
+    doesn't match X-Chunk-SHA256, leaves the offset where it was so it can
+    be sent again.
+    """
+    upload_session = await run_in_threadpool(get_session, db, current_user.id, session_id)
+    if upload_session.upload_id is not None:
+        raise offset_conflict(upload_session, "Upload is already complete")
+    if offset != upload_session.received_bytes:
+        raise offset_conflict(upload_session, "Chunk offset doesn't match the bytes received so far")
+
+    limit = min(settings.UPLOAD_CHUNK_MAX_BYTES, upload_session.size - offset)
+    try:
+        content_length = int(request.headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Content-Length must be a number of bytes"
+        ) from None
+    if content_length > limit:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Chunk may be at most {limit} bytes"
+        )
+
+    path = session_spool_path(upload_session)
+    try:
+        spool = await run_in_threadpool(open_spool_for_chunk, path, offset)
+    except BlockingIOError:
+        raise offset_conflict(upload_session, "Another chunk of this upload is being written") from None
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Upload session has expired, start a new one"
+        ) from None
+
+    checksum = hashlib.sha256()
+    written = 0
+    try:
+        block = bytearray()
+        async for data in request.stream():
+            written += len(data)
+            if written > limit:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Chunk may be at most {limit} bytes"
+                )
+            checksum.update(data)
+            block += data
+            if len(block) >= WRITE_BLOCK_BYTES:
+                await run_in_threadpool(spool.write, bytes(block))
+                block.clear()
+        await run_in_threadpool(spool.write, bytes(block))
+
+        if chunk_sha256 is not None and checksum.hexdigest() != chunk_sha256.lower():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Chunk doesn't match X-Chunk-SHA256, send it again"
+            )
+        await run_in_threadpool(os.fsync, spool.fileno())
+        recorded = await run_in_threadpool(record_chunk, db, upload_session, offset, offset + written)
+    finally:
+        # Closing releases the lock, only once the new offset is committed, so
+        # the next chunk can't truncate this one before it counts; bytes of a
+        # rejected chunk are dropped by the next one
+        await run_in_threadpool(spool.close)
+
+    if not recorded:
+        raise offset_conflict(upload_session, "Chunk offset doesn't match the bytes received so far")
+    return session_response(upload_session)
+
+@router.post("/{session_id}/complete", response_model=ExcelUploadResponse)
+async def complete_upload_session(
+    session_id: UUID,
+    db: DB,
+    current_user: CurrentUser,
+    response: Response,
+    background: bool = Query(False, description="Queue the file and return 202 instead of processing it in the request")
+):
+    """Process a fully received upload from its spool file, like POST /upload/excel.
+
+    Repeating the call (say, after the response was lost) doesn't process
+    the file again; it reports the upload's current status.
+    """
+    upload_session = await run_in_threadpool(get_session, db, current_user.id, session_id)
+    if upload_session.upload_id is not None:
+        return await run_in_threadpool(completed_session_response, db, upload_session)
+    if upload_session.received_bytes != upload_session.size:
+        raise offset_conflict(upload_session, f"Only {upload_session.received_bytes} of {upload_session.size} bytes received")
+
+    path = session_spool_path(upload_session)
+    checksum = await run_in_threadpool(file_sha256, path)
+    if upload_session.sha256 is not None and checksum != upload_session.sha256:
+        # No way to tell which chunk is wrong, so the upload starts over
+        await run_in_threadpool(remove_spool, path)
+        await run_in_threadpool(delete_session, db, upload_session)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File doesn't match the SHA-256 given when the upload started, upload it again"
+        )
+
+    # Only the request that attaches an upload goes on to use the spool file;
+    # a concurrent or repeated complete reports the upload it attached
+    previous = await run_in_threadpool(find_identical_upload, db, current_user.id, checksum)
+    if previous is not None:
+        if not await run_in_threadpool(claim_session, db, upload_session, previous):
+            return await run_in_threadpool(completed_session_response, db, upload_session)
+        await run_in_threadpool(remove_spool, path)
+        return identical_upload_response(previous)
+
+    upload_record = ExcelUpload(
+        user_id=current_user.id,
+        filename=upload_session.filename,
+        checksum=checksum,
+        status="processing"
+    )
+    if not await run_in_threadpool(claim_session, db, upload_session, upload_record):
+        return await run_in_threadpool(completed_session_response, db, upload_session)
+
+    if background:
+        # run_upload_job removes the spool file when it's done
+        try:
+            submit_job(run_upload_job, upload_record.id, path)
+        except BaseException:
+            await run_in_threadpool(remove_spool, path)
+            await run_in_threadpool(mark_upload_failed, db, upload_record, ["Upload could not be queued, please try again."])
+            raise
+        response.status_code = status.HTTP_202_ACCEPTED
+        return queued_upload_response(upload_record)
+
+    try:
+        return await process_spooled_upload(db, current_user, upload_record, path)
+    except HTTPException:
+        # Validation failures are already recorded on the upload
+        raise
+    except unreadable_file_errors():
+        await run_in_threadpool(mark_upload_failed, db, upload_record, [invalid_file_message(upload_session.filename)])
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=invalid_file_message(upload_session.filename)
+        )
+    except Exception as e:
+        await run_in_threadpool(mark_upload_failed, db, upload_record, [f"Error processing Excel file: {str(e)}"])
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing Excel file: {str(e)}"
+        )
+
+@router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    session_id: UUID,
+    db: DB,
+    current_user: CurrentUser
+):
+    """Abandon a chunked upload and remove what was received"""
+    upload_session = await run_in_threadpool(get_session, db, current_user.id, session_id)
+    if upload_session.upload_id is None:
+        await run_in_threadpool(remove_spool, session_spool_path(upload_session))
+    await run_in_threadpool(delete_session, db, upload_session)
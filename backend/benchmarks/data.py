@@ -0,0 +1,86 @@
+"""Synthetic product sheets for the benchmarks, in every upload format."""
+from __future__ import annotations
+
+import io
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ('xlsx', 'csv', 'parquet', 'arrow')
+
+
+def make_frame(products: int, days: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns: dict[str, object] = {
+        'ID': [f'{i:07d}' for i in range(products)],
+        'Product Name': [f'Product {i}' for i in range(products)],
+        'Opening Inventory': rng.integers(0, 500, products),
+    }
+    for day in range(1, days + 1):
+        columns[f'Procurement Qty (Day {day})'] = rng.integers(0, 50, products)
+        columns[f'Procurement Price (Day {day})'] = rng.uniform(1, 100, products).round(2)
+        columns[f'Sales Qty (Day {day})'] = rng.integers(0, 50, products)
+        columns[f'Sales Price (Day {day})'] = rng.uniform(1, 150, products).round(2)
+    return pd.DataFrame(columns)
+
+
+def make_realistic_frame(
+    products: int,
+    days: int,
+    seed: int = 0,
+    missing: float = 0.05,
+    currency: float = 0.3,
+) -> pd.DataFrame:
+    """A sheet shaped like the ones users upload.
+
+    Each column uses a randomly chosen accepted header variant, a `currency`
+    share of prices are formatted like '$1,234.50', and a `missing` share of
+    the day and inventory cells are blank.
+    """
+    # Imported here so the plain generators work without the app's settings
+    from app.routers.upload import get_column_name_patterns, ID_COLUMNS, INVENTORY_COLUMNS, NAME_COLUMNS
+
+    rng = np.random.default_rng(seed)
+
+    def blanks(values: np.ndarray) -> list[object]:
+        values = values.astype(object)
+        values[rng.random(products) < missing] = None
+        return values.tolist()
+
+    def prices(high: float) -> list[object]:
+        values = rng.uniform(1, high, products).round(2).astype(object)
+        formatted = rng.random(products) < currency
+        values[formatted] = [f'${value:,.2f}' for value in values[formatted]]
+        return blanks(values)
+
+    columns: dict[str, object] = {
+        str(rng.choice(ID_COLUMNS)): [f'{i:07d}' for i in range(products)],
+        str(rng.choice(NAME_COLUMNS)): [f'Product {i}' for i in range(products)],
+        str(rng.choice(INVENTORY_COLUMNS)): blanks(rng.integers(0, 500, products)),
+    }
+    for day in range(1, days + 1):
+        headers = {col_type: str(rng.choice(names)) for col_type, names in get_column_name_patterns(day).items()}
+        columns[headers['procurement_qty']] = blanks(rng.integers(0, 50, products))
+        columns[headers['procurement_price']] = prices(100)
+        columns[headers['sales_qty']] = blanks(rng.integers(0, 50, products))
+        columns[headers['sales_price']] = prices(150)
+    return pd.DataFrame(columns)
+
+
+def encode(frame: pd.DataFrame, file_format: str) -> bytes:
+    buffer = io.BytesIO()
+    if file_format == 'xlsx':
+        frame.to_excel(buffer, index=False)
+    elif file_format == 'csv':
+        frame.to_csv(buffer, index=False)
+    elif file_format == 'parquet':
+        frame.to_parquet(buffer, index=False)
+    elif file_format == 'arrow':
+        frame.to_feather(buffer)
+    else:
+        raise ValueError(f'Unknown format: {file_format}')
+    return buffer.getvalue()
+
+
+def make_workbook(products: int, days: int, seed: int = 0) -> bytes:
+    return encode(make_frame(products, days, seed), 'xlsx')
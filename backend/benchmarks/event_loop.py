@@ -0,0 +1,96 @@
+"""Check that /health and /upload/products stay responsive while uploads run.
+
+Start the API first (e.g. `uv run uvicorn app.main:app`), then:
+
+    uv run python -m benchmarks.event_loop --base-url http://localhost:8000 --uploads 4
+
+Latencies are measured once on an idle server and again while the uploads
+are in flight. Results are printed as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from benchmarks.data import make_workbook
+from benchmarks.results import summarize
+
+
+async def timed_get(client: httpx.AsyncClient, url: str, headers: dict[str, str]) -> float:
+    start = time.perf_counter()
+    response = await client.get(url, headers=headers)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def probe(client: httpx.AsyncClient, headers: dict[str, str], until: asyncio.Event | None, samples: int) -> dict[str, list[float]]:
+    """Hit the read endpoints back to back, either `samples` times or until the event is set"""
+    latencies: dict[str, list[float]] = {'/health': [], '/upload/products': []}
+    while True:
+        for url in latencies:
+            latencies[url].append(await timed_get(client, url, headers))
+        if until is None and len(latencies['/health']) >= samples:
+            return latencies
+        if until is not None and until.is_set():
+            return latencies
+        await asyncio.sleep(0.01)
+
+
+async def run(args: argparse.Namespace) -> dict[str, object]:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600) as client:
+        username = f'bench-{uuid.uuid4().hex[:8]}'
+        credentials = {'username': username, 'password': 'benchmark'}
+        (await client.post('/auth/register', json=credentials)).raise_for_status()
+        login = (await client.post('/auth/login', json=credentials)).json()
+        headers = {'Authorization': f"Bearer {login['token']['access_token']}"}
+
+        # Give /upload/products something to return
+        small = make_workbook(args.read_products, args.days, seed=1)
+        files = {'file': ('small.xlsx', small)}
+        (await client.post('/upload/excel', headers=headers, files=files)).raise_for_status()
+
+        idle = await probe(client, headers, None, args.samples)
+
+        workbook = make_workbook(args.products, args.days)
+        done = asyncio.Event()
+
+        async def upload(i: int) -> float:
+            start = time.perf_counter()
+            response = await client.post('/upload/excel', headers=headers, files={'file': (f'load-{i}.xlsx', workbook)})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        probing = asyncio.create_task(probe(client, headers, done, args.samples))
+        upload_times = await asyncio.gather(*(upload(i) for i in range(args.uploads)))
+        done.set()
+        loaded = await probing
+
+    return {
+        'uploads': args.uploads,
+        'products': args.products,
+        'days': args.days,
+        'upload_seconds': [round(t, 2) for t in upload_times],
+        'idle': {url: summarize(values) for url, values in idle.items()},
+        'during_uploads': {url: summarize(values) for url, values in loaded.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--uploads', type=int, default=4, help='concurrent uploads to run')
+    parser.add_argument('--products', type=int, default=2000, help='products per uploaded workbook')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--read-products', type=int, default=50, help='products behind /upload/products')
+    parser.add_argument('--samples', type=int, default=50, help='idle samples per endpoint')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Check that /upload/export memory stays flat as the number of products grows.
+
+    DATABASE_URL=postgresql+psycopg2://... uv run python -m benchmarks.export --products 1000 10000
+
+For each size a user is loaded with that many products, then each format
+is exported in a fresh process straight from export_products, the
+generator behind the endpoint, with the chunks discarded. Reported per
+export: time, output size and how far the process's RSS rose above its
+RSS just before the export, at its highest. Like the suite's, the
+benchmark users are left in the database. Results are printed as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any
+
+FORMATS = ('csv', 'xlsx', 'parquet')
+
+
+def load_user(products: int, days: int) -> tuple[str, str]:
+    from sqlmodel import Session
+
+    from app.core.ingest import ingest_products
+    from app.db import engine, User
+    from app.routers.upload import parse_excel_data
+    from benchmarks.data import make_frame
+
+    username = f'bench-{uuid.uuid4().hex[:8]}'
+    products_data = parse_excel_data(make_frame(products, days))
+    with Session(engine) as db:
+        user = User(username=username, password_hash='-')
+        db.add(user)
+        db.flush()
+        ingest_products(db, user.id, products_data)
+        db.commit()
+        return username, str(user.id)
+
+
+def measure(username: str, user_id: str, export_format: str) -> dict[str, Any]:
+    """Run in its own process, so its peak RSS belongs to this export alone"""
+    from app.core.metrics import current_rss_bytes
+    from app.routers.upload import export_products
+
+    # Load pyarrow and openpyxl before taking the baseline
+    import openpyxl  # noqa: F401
+    import pyarrow.parquet  # noqa: F401
+
+    # Sampled rather than ru_maxrss, which Linux carries over from the parent
+    before = peak = current_rss_bytes()
+    done = threading.Event()
+
+    def sample() -> None:
+        nonlocal peak
+        while not done.wait(0.01):
+            peak = max(peak, current_rss_bytes())
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in export_products(username, uuid.UUID(user_id), export_format, None))
+    seconds = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return {
+        'seconds': round(seconds, 3),
+        'bytes': size,
+        'peak_rss_growth_mb': round(max(0, peak - before) / 1024 / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--measure', nargs=3, metavar=('USERNAME', 'USER_ID', 'FORMAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    results: dict[str, Any] = {'days': args.days, 'exports': {}}
+    for products in args.products:
+        username, user_id = load_user(products, args.days)
+        for export_format in args.formats:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.export', '--measure', username, user_id, export_format],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            results['exports'].setdefault(str(products), {})[export_format] = json.loads(output)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Compare dashboard queries on the original and the partitioned fact tables.
+
+    DATABASE_URL=postgresql+psycopg2://... uv run python -m benchmarks.fact_tables --users 20 --products 1000
+
+Loads the same synthetic data into two schemas of DATABASE_URL's database:
+`bench_legacy`, with procurement_data and sales_data as they were before
+partitioning (UUID keys, created_at, unique (product_id, day), no user_id),
+and `bench_partitioned`, created from the current models. Then times the
+read patterns the app runs against each: per-day chart totals for all of a
+user's products and for a selection, and the day rows of a page of
+products, plus inserting one user's rows. Both schemas are dropped
+afterwards unless --keep is given. Results are printed as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Any, Callable
+
+from sqlalchemy import create_engine, Connection, text
+
+from benchmarks.results import run_metadata, summarize, write_results
+
+LEGACY = 'bench_legacy'
+PARTITIONED = 'bench_partitioned'
+FACT_TABLES = ('procurement_data', 'sales_data')
+
+LEGACY_FACT_TABLE = '''
+CREATE TABLE {table} (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    product_id uuid NOT NULL REFERENCES products (id),
+    day integer NOT NULL,
+    quantity integer NOT NULL,
+    price float8 NOT NULL,
+    amount float8 NOT NULL,
+    created_at timestamptz NOT NULL,
+    CONSTRAINT unique_{table}_day UNIQUE (product_id, day)
+)
+'''
+
+# The query shapes of each layout: before partitioning every read joined products
+QUERIES = {
+    LEGACY: {
+        'chart_all_products': '''
+            SELECT t.day, sum(t.quantity), sum(t.amount) FROM {table} t
+            JOIN products p ON p.id = t.product_id
+            WHERE p.user_id = :user_id AND t.day <= :days GROUP BY t.day
+        ''',
+        'chart_selected_products': '''
+            SELECT t.day, sum(t.quantity), sum(t.amount) FROM {table} t
+            JOIN products p ON p.id = t.product_id
+            WHERE p.user_id = :user_id AND p.product_id = ANY(:selected) AND t.day <= :days GROUP BY t.day
+        ''',
+        'product_page_rows': '''
+            SELECT product_id, day, quantity, price, amount FROM {table}
+            WHERE product_id = ANY(:page) ORDER BY product_id, day
+        ''',
+    },
+    PARTITIONED: {
+        'chart_all_products': '''
+            SELECT day, sum(quantity), sum(amount) FROM {table}
+            WHERE user_id = :user_id AND day <= :days GROUP BY day
+        ''',
+        'chart_selected_products': '''
+            SELECT day, sum(quantity), sum(amount) FROM {table}
+            WHERE user_id = :user_id AND day <= :days AND product_id IN (
+                SELECT id FROM products WHERE user_id = :user_id AND product_id = ANY(:selected)
+            ) GROUP BY day
+        ''',
+        'product_page_rows': '''
+            SELECT product_id, day, quantity, price, amount FROM {table}
+            WHERE user_id = :user_id AND product_id = ANY(:page) ORDER BY product_id, day
+        ''',
+    },
+}
+
+INSERT_ROWS = {
+    LEGACY: '''
+        INSERT INTO {table} (product_id, day, quantity, price, amount, created_at)
+        SELECT p.id, d, 1 + (random() * 99)::int, 1 + random() * 49, 0, now()
+        FROM products p CROSS JOIN generate_series(1, :days) d
+        WHERE p.user_id = :user_id AND random() < :fill
+    ''',
+    PARTITIONED: '''
+        INSERT INTO {table} (user_id, product_id, day, quantity, price, amount)
+        SELECT p.user_id, p.id, d, 1 + (random() * 99)::int, 1 + random() * 49, 0
+        FROM products p CROSS JOIN generate_series(1, :days) d
+        WHERE p.user_id = :user_id AND random() < :fill
+    ''',
+}
+
+
+def use_schema(conn: Connection, schema: str) -> None:
+    conn.execute(text(f'SET search_path TO {schema}'))
+
+
+def load(conn: Connection, schema: str, users: int, products: int, days: int, fill: float) -> None:
+    from sqlmodel import SQLModel
+    from app.db import Product, ProcurementData, SalesData, User
+
+    conn.execute(text(f'DROP SCHEMA IF EXISTS {schema} CASCADE'))
+    conn.execute(text(f'CREATE SCHEMA {schema}'))
+    use_schema(conn, schema)
+    if schema == LEGACY:
+        SQLModel.metadata.create_all(conn, tables=[User.__table__, Product.__table__])
+        for table in FACT_TABLES:
+            conn.execute(text(LEGACY_FACT_TABLE.format(table=table)))
+    else:
+        SQLModel.metadata.create_all(conn, tables=[
+            User.__table__, Product.__table__, ProcurementData.__table__, SalesData.__table__,
+        ])
+
+    conn.execute(text('SELECT setseed(0)'))
+    conn.execute(text(
+        "INSERT INTO users (id, username, password_hash, created_at) "
+        "SELECT gen_random_uuid(), 'bench-' || u, '', now() FROM generate_series(1, :users) u"
+    ), {'users': users})
+    conn.execute(text(
+        "INSERT INTO products (id, user_id, product_id, name, opening_inventory, created_at, updated_at) "
+        "SELECT gen_random_uuid(), u.id, lpad(n::text, 7, '0'), 'Product ' || n, 100, now(), now() "
+        "FROM users u CROSS JOIN generate_series(1, :products) n"
+    ), {'products': products})
+    user_ids = conn.execute(text('SELECT id FROM users')).scalars().all()
+    for user_id in user_ids:
+        for table in FACT_TABLES:
+            conn.execute(text(INSERT_ROWS[schema].format(table=table)), {'user_id': user_id, 'days': days, 'fill': fill})
+
+
+def storage_bytes(conn: Connection, table: str) -> int:
+    """Heap, indexes and TOAST of a table and all its partitions"""
+    # pg_partition_tree is empty for a table that isn't partitioned
+    return int(conn.execute(text(
+        'SELECT coalesce('
+        '(SELECT sum(pg_total_relation_size(relid)) FROM pg_partition_tree(CAST(:table AS regclass))), '
+        'pg_total_relation_size(CAST(:table AS regclass)))'
+    ), {'table': table}).scalar_one())
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> list[float]:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_queries(conn: Connection, schema: str, days: int, page_size: int, repeat: int) -> dict[str, Any]:
+    use_schema(conn, schema)
+    # The user in the middle of the load, so their rows aren't the first or last written
+    user_id = conn.execute(text("SELECT id FROM users WHERE username = 'bench-' || (SELECT count(*) / 2 + 1 FROM users)")).scalar_one()
+    products = conn.execute(text(
+        'SELECT id, product_id FROM products WHERE user_id = :user_id ORDER BY product_id LIMIT :limit'
+    ), {'user_id': user_id, 'limit': page_size}).all()
+    params = {
+        'user_id': user_id,
+        'days': days,
+        'selected': [product.product_id for product in products[:10]],
+        'page': [product.id for product in products],
+    }
+
+    cases: dict[str, Any] = {}
+    for case, query in QUERIES[schema].items():
+        def run() -> None:
+            for table in FACT_TABLES:
+                conn.execute(text(query.format(table=table)), params).all()
+        cases[case] = summarize(measure(run, repeat))
+
+    # A new user's first upload; rolled back, so every repeat inserts into the same data
+    new_user_id = conn.execute(text(
+        "INSERT INTO users (id, username, password_hash, created_at) "
+        "VALUES (gen_random_uuid(), 'bench-insert', '', now()) RETURNING id"
+    )).scalar_one()
+    conn.execute(text(
+        "INSERT INTO products (id, user_id, product_id, name, opening_inventory, created_at, updated_at) "
+        "SELECT gen_random_uuid(), :user_id, product_id, name, opening_inventory, now(), now() "
+        "FROM products WHERE user_id = :template"
+    ), {'user_id': new_user_id, 'template': user_id})
+
+    def insert() -> None:
+        savepoint = conn.begin_nested()
+        for table in FACT_TABLES:
+            conn.execute(text(INSERT_ROWS[schema].format(table=table)), {'user_id': new_user_id, 'days': days, 'fill': 1.0})
+        savepoint.rollback()
+    cases['insert_user_rows'] = summarize(measure(insert, max(1, repeat // 5)))
+
+    cases['storage_mb'] = round(sum(storage_bytes(conn, table) for table in FACT_TABLES) / 1024 / 1024, 1)
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--products', type=int, default=1000, help='per user')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--fill', type=float, default=0.7, help='share of days with a row')
+    parser.add_argument('--page-size', type=int, default=500, help='products per page read, as PRODUCT_BATCH_SIZE')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--keep', action='store_true', help='leave the benchmark schemas in place')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ['DATABASE_URL'])
+    results: dict[str, Any] = {}
+    for schema in (LEGACY, PARTITIONED):
+        with engine.begin() as conn:
+            start = time.perf_counter()
+            load(conn, schema, args.users, args.products, args.days, args.fill)
+            load_seconds = time.perf_counter() - start
+        # Index-only scans need an up to date visibility map
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            use_schema(conn, schema)
+            conn.execute(text('VACUUM ANALYZE'))
+        with engine.connect() as conn:
+            results[schema] = {'load_seconds': round(load_seconds, 2)}
+            results[schema] |= run_queries(conn, schema, args.days, args.page_size, args.repeat)
+            conn.rollback()
+
+    relative = {}
+    for case, legacy in results[LEGACY].items():
+        if isinstance(legacy, dict):
+            relative[case] = round(results[PARTITIONED][case]['p50_ms'] / legacy['p50_ms'], 3)
+    results['partitioned_p50_vs_legacy'] = relative
+
+    if not args.keep:
+        with engine.begin() as conn:
+            for schema in (LEGACY, PARTITIONED):
+                conn.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+
+    write_results({
+        'metadata': run_metadata(),
+        'parameters': vars(args) | {'output': None},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
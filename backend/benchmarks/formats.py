@@ -0,0 +1,71 @@
+"""Compare upload ingest throughput across Excel, CSV, Parquet and Arrow.
+
+Start the API first (e.g. `uv run uvicorn app.main:app`), then:
+
+    uv run python -m benchmarks.formats --base-url http://localhost:8000 --products 2000 --days 30
+
+The same synthetic sheet is encoded in every format and uploaded through
+/upload/excel, each time as a new user so every run inserts every product.
+Results are printed as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+from benchmarks.data import encode, FORMATS, make_frame
+
+
+async def login(client: httpx.AsyncClient) -> dict[str, str]:
+    credentials = {'username': f'bench-{uuid.uuid4().hex[:8]}', 'password': 'benchmark'}
+    (await client.post('/auth/register', json=credentials)).raise_for_status()
+    response = (await client.post('/auth/login', json=credentials)).json()
+    return {'Authorization': f"Bearer {response['token']['access_token']}"}
+
+
+async def time_upload(client: httpx.AsyncClient, filename: str, content: bytes) -> tuple[float, int]:
+    headers = await login(client)
+    start = time.perf_counter()
+    response = await client.post('/upload/excel', headers=headers, files={'file': (filename, content)})
+    response.raise_for_status()
+    return time.perf_counter() - start, response.json()['products_processed']
+
+
+async def run(args: argparse.Namespace) -> dict[str, object]:
+    frame = make_frame(args.products, args.days)
+    results: dict[str, object] = {}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600) as client:
+        for file_format in args.formats:
+            content = encode(frame, file_format)
+            runs = [await time_upload(client, f'bench.{file_format}', content) for _ in range(args.repeat)]
+            seconds = statistics.median(elapsed for elapsed, _ in runs)
+            results[file_format] = {
+                'file_mb': round(len(content) / 1024 / 1024, 2),
+                'seconds': [round(elapsed, 3) for elapsed, _ in runs],
+                'products_processed': runs[0][1],
+                'products_per_second': round(args.products / seconds),
+                'mb_per_second': round(len(content) / 1024 / 1024 / seconds, 2),
+            }
+
+    return {'products': args.products, 'days': args.days, 'repeat': args.repeat, 'formats': results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3, help='uploads per format, the median is reported')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Time the inventory analytics behind /analytics/inventory at 100k products.
+
+    uv run python -m benchmarks.inventory --products 100000 --days 30
+
+Builds the packed records load_inventory_data gets from the database for a
+synthetic user, then times what the endpoint does with them: reading the
+records into arrays (`unpack`) and summarize_inventory, which fills the
+products × days matrices, computes every metric, filters, ranks and converts
+the top `--limit` (`summarize`). For comparison, the same metrics are
+computed with a plain Python loop over each product's days on the first
+`--loop-products` products, and scaled to all of them. The database query
+itself is not included. Runs in process; results are printed as JSON and
+the exit status is non-zero when the median of `unpack` plus `summarize`
+exceeds `--target-seconds`.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+from statistics import NormalDist
+from typing import Any, Callable
+
+import numpy as np
+
+from benchmarks.results import run_metadata, summarize, write_results
+
+
+def make_records(products: int, days: int, seed: int = 0, fill: float = 0.7) -> dict[str, Any]:
+    """Packed records shaped like the INVENTORY_DATA row, for `products` products"""
+    from app.routers.analytics import DAY_RECORD, TOTALS_RECORD
+
+    rng = np.random.default_rng(seed)
+    totals = np.empty(products, dtype=TOTALS_RECORD)
+    totals['opening_inventory'] = rng.integers(0, 500, products)
+    totals['procurement_amount'] = rng.uniform(0, 50_000, products)
+    totals['sales_amount'] = rng.uniform(0, 80_000, products)
+
+    def day_records(high: int) -> bytes:
+        product, day = np.nonzero(rng.random((products, days)) < fill)
+        records = np.empty(len(product), dtype=DAY_RECORD)
+        records['product'] = product
+        records['day'] = day + 1
+        records['quantity'] = rng.integers(1, high, len(product))
+        # Rows arrive in no particular order
+        return rng.permutation(records).tobytes()
+
+    return {
+        'product_id': [f'{index:07d}' for index in range(products)],
+        'site': [''] * products,
+        'name': [f'Product {index}' for index in range(products)],
+        'totals': totals.tobytes(),
+        'procurement': day_records(40),
+        'sales': day_records(50),
+    }
+
+
+def unpack(records: dict[str, Any]) -> dict[str, Any]:
+    """The arrays load_inventory_data returns, from the packed records"""
+    from app.routers.analytics import DAY_RECORD, TOTALS_RECORD
+
+    return {
+        **records,
+        'totals': np.frombuffer(records['totals'], dtype=TOTALS_RECORD),
+        'procurement': np.frombuffer(records['procurement'], dtype=DAY_RECORD),
+        'sales': np.frombuffer(records['sales'], dtype=DAY_RECORD),
+    }
+
+
+def loop_metrics(
+    data: dict[str, Any], products: int, window_days: int, lead_time_days: int, service_level: float,
+) -> list[tuple[Any, ...]]:
+    """The same metrics one product and one day at a time, as they would be without arrays"""
+    days = int(max(data['procurement']['day'].max(), data['sales']['day'].max()))
+    procurement: list[dict[int, int]] = [{} for _ in range(products)]
+    sales: list[dict[int, int]] = [{} for _ in range(products)]
+    for rows, by_product in ((data['procurement'], procurement), (data['sales'], sales)):
+        for product, day, quantity in rows[rows['product'] < products].tolist():
+            by_product[product][day] = quantity
+    z = NormalDist().inv_cdf(service_level)
+    totals = data['totals'][:products].tolist()
+    metrics = []
+    for index, (opening_inventory, procurement_amount, sales_amount) in enumerate(totals):
+        inventory, stockout_day, stockout_days = opening_inventory, None, 0
+        for day in range(1, days + 1):
+            inventory += procurement[index].get(day, 0) - sales[index].get(day, 0)
+            if inventory <= 0:
+                stockout_days += 1
+                stockout_day = stockout_day or day
+        window = [sales[index].get(day, 0) for day in range(max(1, days - window_days + 1), days + 1)]
+        daily_sales = statistics.fmean(window)
+        days_of_cover = 0.0 if inventory <= 0 else (inventory / daily_sales if daily_sales else None)
+        procurement_qty, sales_qty = sum(procurement[index].values()), sum(sales[index].values())
+        sell_through_rate = sales_qty / (opening_inventory + procurement_qty) if opening_inventory + procurement_qty else None
+        average_margin = None
+        if procurement_qty and sales_qty and sales_amount:
+            average_margin = 1 - (procurement_amount / procurement_qty) / (sales_amount / sales_qty)
+        reorder_point = daily_sales * lead_time_days + z * statistics.pstdev(window) * math.sqrt(lead_time_days)
+        needs_reorder = 0 < reorder_point and inventory <= reorder_point
+        metrics.append((
+            inventory, stockout_day, stockout_days, daily_sales, days_of_cover, sell_through_rate,
+            average_margin, reorder_point, needs_reorder,
+        ))
+    return metrics
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> list[float]:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--loop-products', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--target-seconds', type=float, default=1.0)
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    # Nothing here connects, but importing the app needs a database URL
+    os.environ.setdefault('DATABASE_URL', 'postgresql+psycopg2:///benchmarks')
+    from app.routers.analytics import summarize_inventory
+
+    records = make_records(args.products, args.days, args.seed)
+    data = unpack(records)
+    window_days, lead_time_days, service_level = 7, 7, 0.95
+    loop_products = min(args.loop_products, args.products)
+
+    cases = {
+        'unpack': summarize(measure(lambda: unpack(records), args.repeat)),
+        'summarize': summarize(measure(lambda: summarize_inventory(
+            data, 'days_of_cover', False, None, None, args.limit, window_days, lead_time_days, service_level,
+        ), args.repeat)),
+        'summarize_needs_reorder': summarize(measure(lambda: summarize_inventory(
+            data, 'suggested_order_qty', True, True, None, args.limit, window_days, lead_time_days, service_level,
+        ), args.repeat)),
+    }
+    loop = summarize(measure(
+        lambda: loop_metrics(data, loop_products, window_days, lead_time_days, service_level), 1,
+    ))
+    scale = args.products / loop_products
+    cases['python_loop'] = {**loop, 'products': loop_products, 'scaled_p50_ms': round(loop['p50_ms'] * scale, 2)}
+
+    total_ms = cases['unpack']['p50_ms'] + cases['summarize']['p50_ms']
+    results = {
+        'metadata': run_metadata(),
+        'parameters': {
+            'products': args.products, 'days': args.days, 'limit': args.limit, 'seed': args.seed,
+            'repeat': args.repeat, 'target_seconds': args.target_seconds,
+        },
+        'cases': cases,
+        'vectorized_p50_ms': round(total_ms, 2),
+        'speedup_vs_python_loop': round(cases['python_loop']['scaled_p50_ms'] / total_ms, 1),
+        'passed': total_ms / 1000 <= args.target_seconds,
+    }
+    write_results(results, args.output)
+    if not results['passed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
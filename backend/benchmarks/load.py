@@ -0,0 +1,326 @@
+"""Load test the API with many users at once, and fail on latency or error regressions.
+
+    DATABASE_URL=postgresql+psycopg2://... uv run --group bench python -m benchmarks.load \\
+        --users 20 --duration 60 --thresholds benchmarks/load_thresholds.json
+
+Starts uvicorn with --workers against DATABASE_URL (or targets --base-url)
+and runs --users virtual users for --duration seconds, started evenly over
+--ramp-up. Each registers, logs in and uploads a generated workbook, then
+repeats actions picked by --mix until the time is up:
+
+- browse: /upload/products, /analytics/products, /analytics/timeseries
+  for a few of its products and /analytics/inventory
+- login: /auth/login and /auth/me, i.e. bcrypt and the JWT user lookup
+- upload: another workbook, replacing its products
+
+Reported per endpoint: requests, throughput, error rate and status codes,
+and latency percentiles. Database pool saturation comes from the server's
+db_pool_checkout_seconds histogram, scraped from /metrics before and after
+the run: checkouts and how long they waited for a connection, per engine.
+The server doesn't tell which request a checkout belonged to, so it is per
+engine rather than per endpoint.
+
+--thresholds is a JSON file of limits per endpoint ("*" for any endpoint)
+on p50_ms, p95_ms, p99_ms, error_rate and min_rps, plus "db_pool" limits on
+p95_wait_ms and waited_over_100ms per engine. With --baseline, an endpoint
+whose p95 is more than --max-regression times the baseline's also fails.
+Results are JSON; the exit status is non-zero on any failure.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+import httpx
+
+from benchmarks.data import make_workbook
+from benchmarks.results import run_metadata, summarize, write_results
+from benchmarks.startup import free_port, READY_LINE
+
+ACTIONS = ('browse', 'login', 'upload')
+POOL_METRIC = 'db_pool_checkout_seconds'
+
+
+class Recorder:
+    """Latency and outcome of every request, per endpoint"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs: Any) -> httpx.Response | None:
+        """The response, or None when the request failed outright; either way it's recorded"""
+        endpoint = f'{method} {url}'
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            self.latencies[endpoint].append(time.perf_counter() - start)
+            self.statuses[endpoint][type(exc).__name__] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        self.statuses[endpoint][str(response.status_code)] += 1
+        return response
+
+    def report(self, seconds: float) -> dict[str, Any]:
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            statuses = self.statuses[endpoint]
+            requests = sum(statuses.values())
+            errors = sum(count for status, count in statuses.items() if not status.startswith(('2', '3')))
+            endpoints[endpoint] = {
+                'requests': requests,
+                'rps': round(requests / seconds, 2),
+                'error_rate': round(errors / requests, 4),
+                'statuses': dict(statuses),
+                **summarize(self.latencies[endpoint]),
+            }
+        return endpoints
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, workbooks: list[tuple[int, bytes]], rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.workbooks = workbooks
+        self.rng = rng
+        self.credentials = {'username': f'load-{uuid.uuid4().hex[:12]}', 'password': 'load-test'}
+        self.headers: dict[str, str] = {}
+        self.products = 0
+
+    async def login(self) -> bool:
+        response = await self.recorder.request(self.client, 'POST', '/auth/login', json=self.credentials)
+        if response is None or response.status_code != 200:
+            return False
+        self.headers = {'Authorization': f"Bearer {response.json()['token']['access_token']}"}
+        await self.recorder.request(self.client, 'GET', '/auth/me', headers=self.headers)
+        return True
+
+    async def upload(self) -> None:
+        products, workbook = self.rng.choice(self.workbooks)
+        response = await self.recorder.request(
+            self.client, 'POST', '/upload/excel', headers=self.headers, files={'file': ('load.xlsx', workbook)},
+        )
+        if response is not None and response.status_code == 200:
+            self.products = products
+
+    async def browse(self) -> None:
+        get = lambda url, **params: self.recorder.request(self.client, 'GET', url, headers=self.headers, params=params)
+        await get('/upload/products', limit=100)
+        await get('/analytics/products', sort=self.rng.choice(['product_id', 'closing_inventory', 'gross_margin']))
+        if self.products:
+            # IDs as make_frame writes them
+            picked = self.rng.sample(range(self.products), min(3, self.products))
+            await get('/analytics/timeseries', product_ids=[f'{index:07d}' for index in picked])
+        await get('/analytics/inventory', limit=50)
+
+    async def run(self, deadline: float, mix: dict[str, float], think_seconds: float) -> None:
+        response = await self.recorder.request(self.client, 'POST', '/auth/register', json=self.credentials)
+        if response is None or response.status_code != 201 or not await self.login():
+            return
+        await self.upload()
+        actions, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            await getattr(self, self.rng.choices(actions, weights)[0])()
+            # Jittered so the users don't fall into step
+            await asyncio.sleep(self.rng.uniform(0, 2 * think_seconds))
+
+
+async def pool_histograms(client: httpx.AsyncClient) -> dict[str, dict[float, float]]:
+    """Cumulative db_pool_checkout_seconds bucket counts and the wait sum, per engine"""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    response = await client.get('/metrics')
+    response.raise_for_status()
+    histograms: dict[str, dict[float, float]] = defaultdict(dict)
+    for family in text_string_to_metric_families(response.text):
+        if family.name != POOL_METRIC:
+            continue
+        for sample in family.samples:
+            engine = sample.labels.get('engine')
+            if sample.name == f'{POOL_METRIC}_bucket':
+                bound = float(sample.labels['le'])
+                histograms[engine][bound] = histograms[engine].get(bound, 0) + sample.value
+            elif sample.name == f'{POOL_METRIC}_sum':
+                histograms[engine][-1.0] = histograms[engine].get(-1.0, 0) + sample.value
+    return histograms
+
+
+def pool_saturation(before: dict[str, dict[float, float]], after: dict[str, dict[float, float]]) -> dict[str, Any]:
+    """Checkouts during the run per engine, their mean wait and the bucket bound under which 95% of them waited"""
+    engines = {}
+    for engine, buckets in after.items():
+        counts = {bound: value - before.get(engine, {}).get(bound, 0) for bound, value in buckets.items()}
+        wait_sum = counts.pop(-1.0, 0.0)
+        checkouts = counts.get(float('inf'), 0)
+        if not checkouts:
+            continue
+        bounds = sorted(counts)
+        p95 = next(bound for bound in bounds if counts[bound] >= 0.95 * checkouts)
+        under_100ms = max((counts[bound] for bound in bounds if bound <= 0.1), default=0)
+        engines[engine] = {
+            'checkouts': int(checkouts),
+            'mean_wait_ms': round(wait_sum / checkouts * 1000, 2),
+            'p95_wait_ms': None if p95 == float('inf') else p95 * 1000,
+            'waited_over_100ms': round(1 - under_100ms / checkouts, 4),
+        }
+    return engines
+
+
+def check(results: dict[str, Any], thresholds: dict[str, Any], baseline: dict[str, Any] | None, max_regression: float) -> list[str]:
+    """Every limit the run broke, as readable lines"""
+    failures = []
+    for endpoint, stats in results['endpoints'].items():
+        limits = {**thresholds.get('*', {}), **thresholds.get(endpoint, {})}
+        for limit, value in limits.items():
+            if limit == 'min_rps':
+                if stats['rps'] < value:
+                    failures.append(f'{endpoint}: {stats["rps"]} requests/s is under {value}')
+            elif stats[limit] > value:
+                failures.append(f'{endpoint}: {limit} {stats[limit]} is over {value}')
+        before = (baseline or {}).get('endpoints', {}).get(endpoint)
+        if before and before['p95_ms'] and stats['p95_ms'] > max_regression * before['p95_ms']:
+            failures.append(
+                f'{endpoint}: p95 {stats["p95_ms"]}ms is over {max_regression}x the baseline {before["p95_ms"]}ms'
+            )
+    for engine, stats in results['db_pool'].items():
+        for limit, value in thresholds.get('db_pool', {}).items():
+            # No p95 means 95% of checkouts waited longer than the largest bucket
+            if stats[limit] is None or stats[limit] > value:
+                failures.append(f'db_pool {engine}: {limit} {stats[limit]} is over {value}')
+    return failures
+
+
+@contextmanager
+def server(workers: int, timeout: float) -> Iterator[str]:
+    """Run uvicorn against DATABASE_URL until the block exits, yielding its URL"""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as multiproc_dir:
+        # So /metrics adds up the pool waits of every worker
+        env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': multiproc_dir}
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--workers', str(workers)],
+            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, env=env,
+        )
+        ready = threading.Event()
+
+        def watch() -> None:
+            count = 0
+            for line in process.stderr:
+                if READY_LINE in line:
+                    count += 1
+                    if count == workers:
+                        ready.set()
+            # Exited; don't keep the caller waiting out the timeout
+            ready.set()
+
+        threading.Thread(target=watch, daemon=True).start()
+        try:
+            if not ready.wait(timeout) or process.poll() is not None:
+                raise RuntimeError(f'uvicorn not ready within {timeout}s')
+            yield f'http://127.0.0.1:{port}'
+        finally:
+            process.terminate()
+            process.wait()
+
+
+async def run(args: argparse.Namespace, base_url: str, mix: dict[str, float]) -> dict[str, Any]:
+    workbook_rng = random.Random(args.seed)
+    # A few sizes around --products, shared by the users; encoding one is slow
+    workbooks = []
+    for seed in range(args.workbooks):
+        products = max(1, round(args.products * workbook_rng.uniform(0.5, 1.5)))
+        workbooks.append((products, make_workbook(products, args.days, seed=seed)))
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users + 1, max_keepalive_connections=args.users + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        before = await pool_histograms(client)
+        start = time.monotonic()
+        deadline = start + args.duration
+
+        async def start_user(index: int) -> None:
+            await asyncio.sleep(args.ramp_up * index / args.users)
+            user = VirtualUser(client, recorder, workbooks, random.Random(args.seed * 100_003 + index))
+            await user.run(deadline, mix, args.think_seconds)
+
+        await asyncio.gather(*(start_user(index) for index in range(args.users)))
+        seconds = time.monotonic() - start
+        after = await pool_histograms(client)
+
+    return {
+        'seconds': round(seconds, 2),
+        'requests': sum(len(latencies) for latencies in recorder.latencies.values()),
+        'rps': round(sum(len(latencies) for latencies in recorder.latencies.values()) / seconds, 2),
+        'endpoints': recorder.report(seconds),
+        'db_pool': pool_saturation(before, after),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='a running server to load instead of starting one')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers of the started server')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds from the first user starting')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='seconds over which the users start')
+    parser.add_argument('--think-seconds', type=float, default=0.5, help='mean pause between a user\'s actions')
+    parser.add_argument('--mix', default='browse=8,login=1,upload=1', help='relative weight of each action')
+    parser.add_argument('--products', type=int, default=200, help='typical products per workbook')
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--workbooks', type=int, default=4, help='distinct workbooks to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--request-timeout', type=float, default=120.0)
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--thresholds', help='JSON file of limits per endpoint and for db_pool')
+    parser.add_argument('--baseline', help='an earlier result file to compare p95 latencies with')
+    parser.add_argument('--max-regression', type=float, default=1.5, help='p95 over this times the baseline fails')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    mix = {}
+    for part in args.mix.split(','):
+        action, _, weight = part.partition('=')
+        if action not in ACTIONS or not weight:
+            parser.error(f'--mix takes action=weight pairs with actions from {", ".join(ACTIONS)}')
+        mix[action] = float(weight)
+    if args.base_url is None and 'DATABASE_URL' not in os.environ:
+        parser.error('DATABASE_URL must point at a PostgreSQL database, or pass --base-url')
+    thresholds = json.loads(Path(args.thresholds).read_text()) if args.thresholds else {}
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    if args.base_url is not None:
+        measured = asyncio.run(run(args, args.base_url, mix))
+    else:
+        with server(args.workers, args.startup_timeout) as base_url:
+            measured = asyncio.run(run(args, base_url, mix))
+
+    results = {
+        'metadata': run_metadata(),
+        'parameters': {
+            'users': args.users, 'duration': args.duration, 'ramp_up': args.ramp_up, 'think_seconds': args.think_seconds,
+            'mix': mix, 'products': args.products, 'days': args.days, 'workers': args.workers, 'seed': args.seed,
+        },
+        **measured,
+    }
+    results['failures'] = check(results, thresholds, baseline, args.max_regression)
+    write_results(results, args.output)
+    if results['failures']:
+        sys.exit('Load test failed:\n' + '\n'.join(results['failures']))
+
+
+if __name__ == '__main__':
+    main()
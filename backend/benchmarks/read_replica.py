@@ -0,0 +1,155 @@
+"""Check that dashboard reads go to the read replica, and when they must not.
+
+    DATABASE_URL=postgresql+psycopg2://.../app DATABASE_READ_URL=postgresql+psycopg2://...:5433/app \\
+        uv run --group bench python -m benchmarks.read_replica
+
+DATABASE_READ_URL has to be a streaming replica of DATABASE_URL (e.g. made
+with `pg_basebackup -R` and started on another port). Runs the app in
+process with the response and user caches off and counts connection
+checkouts per engine for each request, checking that:
+
+- right after an upload the user's reads stay on the primary
+- once READ_AFTER_WRITE_SECONDS has passed they go to the replica, with
+  the same products as the primary returned
+- with the replica unreachable they fall back to the primary and succeed,
+  and later reads skip the replica for DB_READ_RETRY_SECONDS
+
+Results are printed as JSON; the exit status is non-zero if a check fails.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Any
+
+import httpx
+
+from benchmarks.data import make_workbook
+
+READS = ('/upload/products', '/analytics/products', '/analytics/timeseries', '/analytics/inventory', '/auth/me')
+
+
+def count_checkouts(counts: Counter) -> None:
+    """Count pool checkouts per engine from now on"""
+    from sqlalchemy import event
+
+    import app.db as db
+
+    engines = {'primary': db.async_engine or db.engine, 'replica': db.async_read_engine or db.read_engine}
+    for label, engine in engines.items():
+        sync_engine = getattr(engine, 'sync_engine', engine)
+        event.listen(sync_engine, 'checkout', lambda *_, label=label: counts.update([label]))
+
+
+async def routed_reads(client: httpx.AsyncClient, headers: dict[str, str], counts: Counter) -> dict[str, Any]:
+    """Each read endpoint's status, and the engines it checked out connections from"""
+    routes = {}
+    for url in READS:
+        counts.clear()
+        response = await client.get(url, headers=headers)
+        routes[url] = {'status': response.status_code, 'engines': sorted(counts)}
+    return routes
+
+
+def all_on(routes: dict[str, Any], engine: str) -> bool:
+    return all(route['status'] == 200 and route['engines'] == [engine] for route in routes.values())
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    import app.db as db
+    from app.main import app
+
+    counts: Counter = Counter()
+    count_checkouts(counts)
+    checks: dict[str, bool] = {}
+    result: dict[str, Any] = {'checks': checks}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=600) as client:
+            credentials = {'username': f'bench-{uuid.uuid4().hex[:8]}', 'password': 'benchmark'}
+            (await client.post('/auth/register', json=credentials)).raise_for_status()
+            login = (await client.post('/auth/login', json=credentials)).json()
+            headers = {'Authorization': f"Bearer {login['token']['access_token']}"}
+            files = {'file': ('replica.xlsx', make_workbook(args.products, args.days))}
+            (await client.post('/upload/excel', headers=headers, files=files)).raise_for_status()
+            primary_products = (await client.get('/upload/products', headers=headers)).json()
+
+            result['after_upload'] = await routed_reads(client, headers, counts)
+            checks['reads_stay_on_primary_after_upload'] = all_on(result['after_upload'], 'primary')
+
+            # Wait out read-your-writes, and for the replica to replay the upload
+            await asyncio.sleep(db.settings.READ_AFTER_WRITE_SECONDS)
+            deadline = time.monotonic() + args.lag_seconds
+            while True:
+                counts.clear()
+                replica_products = (await client.get('/upload/products', headers=headers)).json()
+                if replica_products == primary_products or time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.1)
+            checks['replica_returns_same_products'] = replica_products == primary_products
+
+            result['after_catch_up'] = await routed_reads(client, headers, counts)
+            checks['reads_use_replica'] = all_on(result['after_catch_up'], 'replica')
+
+            # Point the replica engines at a port nothing listens on
+            from sqlalchemy import create_engine
+
+            replica, async_replica = db.read_engine, db.async_read_engine
+            db.read_engine = create_engine('postgresql+psycopg2://postgres@127.0.0.1:9/app', pool_pre_ping=True)
+            if async_replica is not None:
+                from sqlalchemy.ext.asyncio import create_async_engine
+                db.async_read_engine = create_async_engine('postgresql+asyncpg://postgres@127.0.0.1:9/app')
+            try:
+                counts.clear()
+                started = time.perf_counter()
+                response = await client.get('/upload/products', headers=headers)
+                result['failover_seconds'] = round(time.perf_counter() - started, 3)
+                checks['read_succeeds_with_replica_down'] = (
+                    response.status_code == 200 and response.json() == primary_products
+                )
+                checks['replica_marked_down'] = not db.replica_available()
+                result['while_down'] = await routed_reads(client, headers, counts)
+                checks['reads_skip_replica_while_down'] = all_on(result['while_down'], 'primary')
+            finally:
+                await asyncio.to_thread(db.read_engine.dispose)
+                if async_replica is not None:
+                    await db.async_read_engine.dispose()
+                db.read_engine, db.async_read_engine = replica, async_replica
+                db._replica_down_until = 0.0
+
+    result['passed'] = all(checks.values())
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--read-after-write-seconds', type=float, default=1.0,
+                        help='READ_AFTER_WRITE_SECONDS for this run')
+    parser.add_argument('--lag-seconds', type=float, default=10.0,
+                        help='How long to wait for the replica to catch up')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_READ_URL'):
+        parser.error('DATABASE_READ_URL must point at a replica of DATABASE_URL')
+    # Set before the app reads its settings: every request has to reach a database
+    os.environ['CACHE_BACKEND'] = 'none'
+    os.environ['USER_CACHE_ENABLED'] = 'false'
+    os.environ['READ_AFTER_WRITE_SECONDS'] = str(args.read_after_write_seconds)
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if not result['passed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
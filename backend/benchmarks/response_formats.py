@@ -0,0 +1,140 @@
+"""Compare encode time and size of the /upload/products response formats.
+
+    uv run python -m benchmarks.response_formats --products 5000 --days 30
+
+Encodes the same synthetic page as the default row JSON (one dict per day,
+as stream_products_json sends it), columnar JSON, MessagePack and Arrow
+IPC, each uncompressed and with the gzip and brotli settings the API uses.
+Times cover encoding from the structures each path holds after its queries,
+not the queries themselves. Runs in process without a database; results
+are printed as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+import uuid
+from typing import Any, Callable
+
+import numpy as np
+
+from benchmarks.results import run_metadata, summarize, write_results
+
+
+def make_page(products: int, days: int, seed: int = 0, fill: float = 0.7):
+    """Row documents the way render_product_batch builds them, and the same page as ProductColumns"""
+    from app.core.response_formats import ProductColumns
+
+    rng = np.random.default_rng(seed)
+    product_columns = {
+        'id': [str(uuid.UUID(int=int(rng.integers(2**63)))) for _ in range(products)],
+        'product_id': [f'{index:07d}' for index in range(products)],
+        'site': [''] * products,
+        'name': [f'Product {index}' for index in range(products)],
+        'opening_inventory': rng.integers(0, 500, products).tolist(),
+    }
+
+    def day_columns() -> dict[str, np.ndarray]:
+        product, day = np.nonzero(rng.random((products, days)) < fill)
+        quantity = rng.integers(1, 100, len(product))
+        price = rng.integers(100, 5000, len(product)) / 100
+        return {
+            'product': product.astype(np.int64),
+            'day': (day + 1).astype(np.int64),
+            'quantity': quantity.astype(np.int64),
+            'price': price,
+            'amount': quantity * price,
+        }
+
+    procurement, sales = day_columns(), day_columns()
+
+    def day_dicts(columns: dict[str, np.ndarray]) -> list[list[dict[str, Any]]]:
+        rows: list[list[dict[str, Any]]] = [[] for _ in range(products)]
+        for index, day, quantity, price, amount in zip(*(columns[field].tolist() for field in columns)):
+            rows[index].append({'day': day, 'quantity': quantity, 'price': price, 'amount': amount})
+        return rows
+
+    procurement_rows, sales_rows = day_dicts(procurement), day_dicts(sales)
+    documents = [{
+        'id': product_columns['id'][index],
+        'product_id': product_columns['product_id'][index],
+        'site': product_columns['site'][index],
+        'name': product_columns['name'][index],
+        'opening_inventory': product_columns['opening_inventory'][index],
+        'procurement_data': procurement_rows[index],
+        'sales_data': sales_rows[index],
+    } for index in range(products)]
+    return documents, ProductColumns(product_columns, procurement, sales, next_cursor=None)
+
+
+def encode_rows(documents: list[dict[str, Any]]) -> bytes:
+    body = ','.join(json.dumps(document) for document in documents)
+    return f'{{"products":[{body}],"total":{len(documents)},"next_cursor":null}}'.encode()
+
+
+def measure(fn: Callable[[], bytes], repeat: int) -> tuple[list[float], bytes]:
+    body = fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings, body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    # Nothing here connects, but importing the app needs a database URL
+    os.environ.setdefault('DATABASE_URL', 'postgresql+psycopg2:///benchmarks')
+    from app.core.compression import BrotliCompressor, GzipCompressor
+    from app.core.config import get_settings
+    from app.core.response_formats import ARROW, COLUMNAR_JSON, MSGPACK
+
+    settings = get_settings()
+    compressors = {
+        'gzip': lambda: GzipCompressor(settings.GZIP_LEVEL),
+        'br': lambda: BrotliCompressor(settings.BROTLI_QUALITY),
+    }
+    documents, columns = make_page(args.products, args.days, args.seed)
+    encoders = {
+        'json_rows': lambda: encode_rows(documents),
+        'json_columnar': lambda: columns.encode(COLUMNAR_JSON),
+        'msgpack': lambda: columns.encode(MSGPACK),
+        'arrow': lambda: columns.encode(ARROW),
+    }
+
+    cases: dict[str, Any] = {}
+    for name, encoder in encoders.items():
+        timings, body = measure(encoder, args.repeat)
+        case: dict[str, Any] = {'bytes': len(body), 'encode': summarize(timings)}
+        for encoding, make_compressor in compressors.items():
+            def compress() -> bytes:
+                compressor = make_compressor()
+                return compressor.compress(body) + compressor.flush()
+            timings, compressed = measure(compress, args.repeat)
+            case[encoding] = {'bytes': len(compressed), 'compress': summarize(timings)}
+        cases[name] = case
+
+    baseline = cases['json_rows']
+    for case in cases.values():
+        case['bytes_vs_json_rows'] = round(case['bytes'] / baseline['bytes'], 3)
+        case['encode_vs_json_rows'] = round(case['encode']['p50_ms'] / baseline['encode']['p50_ms'], 3)
+
+    write_results({
+        'metadata': run_metadata(),
+        'parameters': {'products': args.products, 'days': args.days, 'seed': args.seed, 'repeat': args.repeat},
+        'cases': cases,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
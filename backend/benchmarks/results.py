@@ -0,0 +1,58 @@
+"""Timing summaries and machine-readable result files shared by the benchmarks."""
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import subprocess
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Any
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'min_ms': round(latencies[0] * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+        'p99_ms': round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
+
+
+def run_metadata() -> dict[str, Any]:
+    """Where and on what code a run happened, so result files can be compared later"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(UTC).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+    }
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> dict[str, float]:
+    """Median time of each case relative to the baseline run, above 1.0 is slower"""
+    ratios = {}
+    for case, summary in current['cases'].items():
+        before = baseline.get('cases', {}).get(case)
+        if before and before['p50_ms']:
+            ratios[case] = round(summary['p50_ms'] / before['p50_ms'], 3)
+    return ratios
+
+
+def write_results(results: dict[str, Any], output: str | None) -> None:
+    text = json.dumps(results, indent=2)
+    if output is None:
+        print(text)
+    else:
+        Path(output).write_text(text + '\n')
@@ -0,0 +1,119 @@
+"""Measure how long the API takes to start, and fail when it's over the target.
+
+    DATABASE_URL=postgresql+psycopg2://... uv run python -m benchmarks.startup --workers 4 --target-seconds 6
+
+Times `import app.main` in fresh interpreters, then starts uvicorn with
+--workers and waits until every worker has logged that its startup is
+complete, i.e. imported the app, checked (or set up) the schema and warmed
+its pool. The database should already be set up, as it is on a restart or
+when scaling out; a first start after a model change also pays for the
+migration. Prints the results as JSON and exits with status 1 when the
+median time to ready exceeds --target-seconds, so CI can hold the target.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any
+
+from benchmarks.results import run_metadata, summarize, write_results
+
+READY_LINE = 'Application startup complete'
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl')
+
+IMPORT_SCRIPT = f'''
+import sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+loaded = [name for name in {HEAVY_MODULES!r} if type(sys.modules.get(name)).__name__ == 'module']
+print(elapsed, ','.join(loaded))
+'''
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_import() -> tuple[float, list[str]]:
+    """Seconds to import the app in a new interpreter, and the heavy modules it loaded"""
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT], capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return float(output[0]), output[1].split(',') if len(output) > 1 else []
+
+
+def time_ready(workers: int, timeout: float) -> float:
+    """Seconds from spawning uvicorn until all its workers finished their lifespan startup"""
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(free_port()), '--workers', str(workers)],
+        stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True,
+    )
+    ready = threading.Event()
+    elapsed: list[float] = []
+
+    def watch() -> None:
+        count = 0
+        for line in server.stderr:
+            if READY_LINE in line:
+                count += 1
+                if count == workers:
+                    elapsed.append(time.perf_counter() - start)
+                    ready.set()
+        ready.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        ready.wait(timeout)
+        if not elapsed:
+            raise RuntimeError(f'{workers} worker(s) not ready within {timeout}s')
+        return elapsed[0]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--target-seconds', type=float, default=2.0, help='median time to ready that fails the run')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        parser.error('DATABASE_URL must point at a PostgreSQL database')
+
+    imports = [time_import() for _ in range(args.repeat)]
+    # The first start sets up the schema if it's behind; only restarts are timed
+    time_ready(args.workers, args.timeout)
+    ready = [time_ready(args.workers, args.timeout) for _ in range(args.repeat)]
+
+    cases: dict[str, Any] = {
+        'import_app': summarize([seconds for seconds, _ in imports]),
+        'ready': summarize(ready),
+    }
+    ready_p50 = cases['ready']['p50_ms'] / 1000
+    results = {
+        'metadata': run_metadata(),
+        'parameters': {'workers': args.workers, 'repeat': args.repeat, 'target_seconds': args.target_seconds},
+        'cases': cases,
+        'heavy_modules_imported': sorted({name for _, loaded in imports for name in loaded}),
+        'within_target': ready_p50 <= args.target_seconds,
+    }
+    write_results(results, args.output)
+    if not results['within_target']:
+        sys.exit(f'Median startup {ready_p50:.2f}s is over the {args.target_seconds}s target')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Repeatable benchmarks for the upload parser and the ingest and read endpoints.
+
+    uv run --group bench python -m benchmarks.suite --output results.json
+    uv run --group bench python -m benchmarks.suite --baseline results.json
+
+Parser cases (read_excel, detect_max_days, validate_excel_format and
+parse_excel_data) run in process on a generated workbook and never touch
+the database. The API cases time POST /upload/excel and GET
+/upload/products, the first read after an upload (cold) and repeats
+(warm). They run in process against DATABASE_URL, or against a running
+server with --base-url. Ingest uses PostgreSQL features (COPY, ON CONFLICT),
+so that has to be a local Postgres; SQLite can't stand in.
+
+Results are JSON with per-case timings and run metadata. With --baseline,
+each case's median is also reported relative to an earlier result file.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+import httpx
+import pandas as pd
+
+from benchmarks.data import encode, make_realistic_frame
+from benchmarks.results import compare, run_metadata, summarize, write_results
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def parser_cases(workbook: bytes, repeat: int) -> dict[str, list[float]]:
+    from app.routers.upload import detect_max_days, parse_excel_data, validate_excel_format
+
+    df = pd.read_excel(io.BytesIO(workbook))
+    return {
+        'read_excel': measure(lambda: pd.read_excel(io.BytesIO(workbook)), max(1, repeat // 5)),
+        'detect_max_days': measure(lambda: detect_max_days(df), repeat),
+        'validate_excel_format': measure(lambda: validate_excel_format(df), repeat),
+        'parse_excel_data': measure(lambda: parse_excel_data(df), repeat),
+    }
+
+
+@asynccontextmanager
+async def api_client(base_url: str | None) -> AsyncIterator[httpx.AsyncClient]:
+    if base_url is not None:
+        async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+            yield client
+        return
+
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=600) as client:
+            yield client
+
+
+async def timed(request: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    response = await request()
+    response.raise_for_status()
+    # Streamed bodies are only complete once read
+    await response.aread()
+    return time.perf_counter() - start
+
+
+async def api_cases(base_url: str | None, workbook: bytes, uploads: int, reads: int) -> dict[str, list[float]]:
+    timings: dict[str, list[float]] = {'upload_excel': [], 'products_cold': [], 'products_warm': []}
+    async with api_client(base_url) as client:
+        for _ in range(uploads):
+            # A new user each time, so every upload inserts every product
+            credentials = {'username': f'bench-{uuid.uuid4().hex[:8]}', 'password': 'benchmark'}
+            (await client.post('/auth/register', json=credentials)).raise_for_status()
+            login = (await client.post('/auth/login', json=credentials)).json()
+            headers = {'Authorization': f"Bearer {login['token']['access_token']}"}
+
+            files = {'file': ('benchmark.xlsx', workbook)}
+            timings['upload_excel'].append(await timed(lambda: client.post('/upload/excel', headers=headers, files=files)))
+            timings['products_cold'].append(await timed(lambda: client.get('/upload/products', headers=headers)))
+            for _ in range(reads):
+                timings['products_warm'].append(await timed(lambda: client.get('/upload/products', headers=headers)))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per parser case')
+    parser.add_argument('--uploads', type=int, default=3, help='timed uploads, each by a new user')
+    parser.add_argument('--reads', type=int, default=10, help='warm product reads after each upload')
+    parser.add_argument('--base-url', help='benchmark a running server instead of the app in process')
+    parser.add_argument('--skip-api', action='store_true', help='only run the parser cases')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    args = parser.parse_args()
+
+    if args.skip_api:
+        # The parser never connects, but importing the app needs a database URL
+        os.environ.setdefault('DATABASE_URL', 'postgresql+psycopg2:///benchmarks')
+
+    workbook = encode(make_realistic_frame(args.products, args.days, args.seed), 'xlsx')
+    timings = parser_cases(workbook, args.repeat)
+    if not args.skip_api:
+        timings |= asyncio.run(api_cases(args.base_url, workbook, args.uploads, args.reads))
+
+    results: dict[str, Any] = {
+        'metadata': run_metadata(),
+        'parameters': {
+            'products': args.products,
+            'days': args.days,
+            'seed': args.seed,
+            'workbook_bytes': len(workbook),
+            'target': args.base_url or 'in-process',
+        },
+        'cases': {case: summarize(values) for case, values in timings.items()},
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            results['relative_to_baseline'] = compare(json.load(baseline), results)
+    write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
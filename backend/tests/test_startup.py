@@ -0,0 +1,9 @@
+"""Importing the app has to stay cheap: the heavy libraries load on the first upload or columnar read."""
+from benchmarks.startup import HEAVY_MODULES, time_import
+
+
+def test_import_does_not_load_heavy_modules(monkeypatch):
+    # Nothing connects at import, but the settings need a database URL
+    monkeypatch.setenv('DATABASE_URL', 'postgresql+psycopg2:///startup-test')
+    _, loaded = time_import()
+    assert loaded == [], f'import app.main loaded {", ".join(loaded)}, expected none of {", ".join(HEAVY_MODULES)}'
@@ -45,8 +45,8 @@ export const ExcelUpload = () => {
   }
 
   const handleFileUpload = async (file: File) => {
-    if (!file.name.match(/\.(xlsx|xls)$/)) {
-      setErrorMessage('Please upload a valid Excel file (.xlsx or .xls)')
+    if (!file.name.match(/\.(xlsx|xls|csv|parquet|arrow|feather|arrows)$/)) {
+      setErrorMessage('Please upload an Excel, CSV, Parquet or Arrow file')
       setUploadStatus('error')
       return
     }
@@ -227,7 +227,7 @@ export const ExcelUpload = () => {
                     Drag & drop your file here, or click to browse
                   </p>
                   <p className="text-sm text-gray-500 mt-2">
-                    Supports .xlsx and .xls files up to 10MB
+                    Supports Excel (.xlsx, .xls), CSV, Parquet and Arrow files
                   </p>
                   <details className="text-sm text-gray-600 mt-4 border border-gray-200 rounded-lg">
                     <summary className="cursor-pointer hover:bg-gray-50 p-3 font-medium text-gray-700 flex items-center">
@@ -337,7 +337,7 @@ export const ExcelUpload = () => {
                 <input
                   ref={fileInputRef}
                   type="file"
-                  accept=".xlsx,.xls"
+                  accept=".xlsx,.xls,.csv,.parquet,.arrow,.feather,.arrows"
                   onChange={handleFileSelect}
                   className="hidden"
                 />